@@ -0,0 +1,25 @@
+import orjson
+from django.conf import settings
+from rest_framework import parsers
+from rest_framework.exceptions import ParseError
+
+
+class ORJSONParser(parsers.JSONParser):
+    """
+    JSON parser using orjson (https://github.com/ijl/orjson) which is significantly faster than the standard library
+    """
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        parser_context = parser_context or {}
+        encoding = parser_context.get('encoding', settings.DEFAULT_CHARSET)
+
+        data = stream.read()
+
+        # orjson only accepts utf-8 so decode anything else first
+        if encoding.lower().replace('-', '') != 'utf8':
+            data = data.decode(encoding)
+
+        try:
+            return orjson.loads(data)
+        except (orjson.JSONDecodeError, UnicodeDecodeError) as exc:
+            raise ParseError('JSON parse error - %s' % str(exc))
@@ -0,0 +1,122 @@
+from typing import Iterable, Iterator
+import orjson
+import pyarrow as pa
+import pyarrow.parquet as pq
+from rest_framework import renderers
+from rest_framework.utils.encoders import JSONEncoder
+
+
+class ORJSONRenderer(renderers.JSONRenderer):
+    """
+    JSON renderer using orjson (https://github.com/ijl/orjson) which is significantly faster than the standard library
+    - datetimes, dicts/lists (and their subclasses) and floats are serialized natively
+    - anything else falls back to drf's encoder (i.e Decimal, lazy strings, numpy values)
+    """
+    options = orjson.OPT_UTC_Z | orjson.OPT_NON_STR_KEYS
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+
+        options = self.options
+
+        # honor an indent requested through the accepted media type (i.e "application/json; indent=2")
+        if self.get_indent(accepted_media_type, renderer_context or {}):
+            options |= orjson.OPT_INDENT_2
+
+        return orjson.dumps(data, default=JSONEncoder().default, option=options)
+
+
+class ArrowStreamRenderer(renderers.BaseRenderer):
+    """
+    Apache Arrow IPC stream renderer (https://arrow.apache.org/docs/format/Columnar.html#ipc-streaming-format)
+    - views should prefer streaming record batches via stream_arrow() for large results
+    """
+    media_type = 'application/vnd.apache.arrow.stream'
+    format = 'arrow'
+    charset = None
+    render_style = 'binary'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        table = _table_from_data(data)
+        return b''.join(stream_arrow(table.schema, table.to_batches()))
+
+
+class ParquetRenderer(renderers.BaseRenderer):
+    """
+    Apache Parquet renderer (https://parquet.apache.org/)
+    - views should prefer streaming record batches via stream_parquet() for large results
+    """
+    media_type = 'application/vnd.apache.parquet'
+    format = 'parquet'
+    charset = None
+    render_style = 'binary'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        table = _table_from_data(data)
+        return b''.join(stream_parquet(table.schema, table.to_batches()))
+
+
+COLUMNAR_RENDERERS = (ArrowStreamRenderer, ParquetRenderer)
+
+
+class _StreamSink:
+    """
+    Write-only file-like object which collects the bytes written by pyarrow so they can be yielded as they're produced
+    """
+
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+        self.closed = False
+
+    def write(self, data) -> int:
+        data = bytes(data)
+        self.chunks.append(data)
+        self.position += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self.position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self) -> bytes:
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def _table_from_data(data) -> pa.Table:
+    # rendering arbitrary api data (i.e a list of results or an error detail)
+    if data is None:
+        data = []
+    return pa.Table.from_pylist(data if isinstance(data, list) else [data])
+
+
+def stream_arrow(schema: pa.Schema, batches: Iterable[pa.RecordBatch]) -> Iterator[bytes]:
+    """
+    Yields an arrow ipc stream as each record batch is written
+    """
+    sink = _StreamSink()
+    with pa.ipc.new_stream(sink, schema) as writer:
+        for batch in batches:
+            writer.write_batch(batch)
+            yield sink.drain()
+    yield sink.drain()
+
+
+def stream_parquet(schema: pa.Schema, batches: Iterable[pa.RecordBatch]) -> Iterator[bytes]:
+    """
+    Yields a parquet file as each record batch is written (one row group per batch)
+    """
+    sink = _StreamSink()
+    with pq.ParquetWriter(sink, schema, compression='zstd') as writer:
+        for batch in batches:
+            writer.write_table(pa.Table.from_batches([batch], schema=schema))
+            yield sink.drain()
+    yield sink.drain()
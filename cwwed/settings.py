@@ -294,10 +294,23 @@ REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': (
         'rest_framework.permissions.IsAuthenticatedOrReadOnly',
     ),
+    'DEFAULT_THROTTLE_RATES': {
+        'psa-time-series-batch-anon': '20/minute',
+    },
     'DEFAULT_FILTER_BACKENDS': (
         'django_filters.rest_framework.DjangoFilterBackend',
         'rest_framework.filters.SearchFilter',
     ),
+    # orjson vs the standard library's json (see "benchmark_api_renderers" management command)
+    'DEFAULT_RENDERER_CLASSES': (
+        'cwwed.api.renderers.ORJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ),
+    'DEFAULT_PARSER_CLASSES': (
+        'cwwed.api.parsers.ORJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ),
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.LimitOffsetPagination',
     'PAGE_SIZE': 100,
 }
@@ -331,6 +344,12 @@ CWWED_SCHEME = 'http' if DEPLOY_STAGE == DEPLOY_STAGE_LOCAL else 'https'
 CWWED_PORT = 8000 if DEPLOY_STAGE == DEPLOY_STAGE_LOCAL else 443
 
 CWWED_ARCHIVE_EXTENSION = 'tgz'
+CWWED_ARCHIVE_CODEC = os.environ.get('CWWED_ARCHIVE_CODEC', 'pigz')  # gzip, pigz, zstd or store
+CWWED_ARCHIVE_CODEC_LEVEL = 6
+CWWED_ARCHIVE_CODEC_THREADS = 4
+# directories whose payload is (nearly) all already-compressed files are archived without compression
+CWWED_ARCHIVE_COMPRESSED_EXTENSIONS = ('nc4', 'h5', 'hdf5', 'he5', 'gz', 'tgz', 'zip', 'zst', 'bz2', 'xz', 'parquet', 'grib2', 'png', 'jpg')
+CWWED_ARCHIVE_STORE_COMPRESSED_RATIO = .9
 CWWED_DATA_DIR = MEDIA_ROOT
 CWWED_OPENDAP_DIR = 'OPENDAP'
 
@@ -340,11 +359,17 @@ CWWED_COVERED_DATA_SNAPSHOTS_DIR_NAME = 'Covered Data Snapshots'
 CWWED_COVERED_ARCHIVE_DIR_NAME = 'Covered Data Archive'
 CWWED_COVERED_DATA_INCOMPLETE_DIR_NAME = '.incomplete'
 CWWED_COVERED_DATA_TMP_DIR_NAME = '.tmp-covered-data'
+CWWED_COVERED_DATA_HTTP_CONCURRENCY = 16  # concurrent requests while building a provider's processors
+CWWED_COVERED_DATA_HTTP_HOST_CONCURRENCY = 8  # concurrent connections to any single host
+CWWED_COVERED_DATA_COLLECTION_WAIT_HOURS = 12  # how long `collect_covered_data --wait` waits for the collection to finish
+CWWED_STATION_REGISTRY_DIR_NAME = '.station-registry'
+CWWED_STATION_REGISTRY_HOURS = 24  # station catalogs (NDBC, CO-OPS) are refreshed after this many hours
+CWWED_THREDDS_CATALOG_CACHE_DIR_NAME = '.thredds-catalog-cache'
+CWWED_DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+CWWED_DOWNLOAD_ATTEMPTS = 5  # interrupted downloads resume where they left off
 
 CWWED_NSEM_DIR_NAME = 'NSEM'
 CWWED_NSEM_UPLOAD_DIR_NAME = 'upload'
-CWWED_NSEM_ARCHIVE_WRITE_MODE = 'w:gz'
-CWWED_NSEM_ARCHIVE_READ_MODE = 'r:gz'
 CWWED_NSEM_USER = 'nsem'
 CWWED_NSEM_PASSWORD = os.environ.get('CWWED_NSEM_PASSWORD')
 CWWED_NSEM_GROUP = 'nsem'
@@ -354,12 +379,19 @@ CWWED_NSEM_S3_USER_EXPORT_DIR_NAME = 'User Exports'
 
 CWWED_ARCHIVES_ACCESS_KEY_ID = os.environ['CWWED_ARCHIVES_ACCESS_KEY_ID']
 CWWED_ARCHIVES_SECRET_ACCESS_KEY = os.environ['CWWED_ARCHIVES_SECRET_ACCESS_KEY']
+CWWED_ARCHIVES_MULTIPART_CHUNK_SIZE = 1024 * 1024 * 16  # s3 requires at least 5MB per part (except the last)
+CWWED_ARCHIVES_MULTIPART_CONCURRENCY = 4
 
 CWWED_PSA_USER_DATA_EXPORT_DAYS = 1
+CWWED_PSA_USER_DATA_EXPORT_TIMEOUT_HOURS = 6  # exports (and identical requests attached to them) are restarted if incomplete after this long
+CWWED_PSA_USER_DATA_EXPORT_TILE_DEGREES = 2  # large exports are created in parallel tiles of this size
 
 CWWED_CACHE_PSA_CONTOURS_DAYS = 365
 CWWED_CACHE_PSA_CONTOURS_SECONDS = 60 * 60 * 24 * CWWED_CACHE_PSA_CONTOURS_DAYS
 
+# storm -> current psa -> variables (invalidated via signals when a psa's validity changes)
+CWWED_CACHE_PSA_CURRENT_SECONDS = 60 * 60 * 24
+
 # separate queue to handle processing PSAs so they don't interfere with the default queue
 CWWED_QUEUE_PROCESS_PSA = 'process-psa'
 
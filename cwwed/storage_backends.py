@@ -1,8 +1,12 @@
 import os
 import boto3
 import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from botocore.client import Config as BotoCoreConfig
 from django.conf import settings
 from storages.backends.s3boto3 import S3Boto3Storage
+from named_storms.archive import ArchiveWriter
 from named_storms.utils import create_directory
 
 logger = logging.getLogger('cwwed')
@@ -94,6 +98,37 @@ class S3ObjectStoragePrivate(S3ObjectStorage):
         }
         s3.meta.client.copy(copy_source, self.bucket_name, destination_absolute)
 
+    def upload_directory_archive(self, directory_path: str, arcname: str, destination: str, codec: str):
+        """
+        Archives a directory straight into an S3 object by streaming it through tar and the codec into a multipart upload
+        """
+        s3 = self._get_s3_resource()
+        with S3MultipartUploadWriter(s3.meta.client, self.bucket_name, self.path(destination)) as writer:
+            with ArchiveWriter(writer, codec) as archive:
+                archive.add(directory_path, arcname=arcname)
+
+    def presigned_url(self, path: str, expires_in: int) -> str:
+        """
+        Creates a pre-signed url to download a private object
+        https://aws.amazon.com/premiumsupport/knowledge-center/presigned-url-s3-bucket-expiration/
+        """
+
+        # get the service client with sigv4 configured
+        s3_client = boto3.client(
+            's3',
+            aws_access_key_id=self.access_key,
+            aws_secret_access_key=self.secret_key,
+            config=BotoCoreConfig(signature_version='s3v4'))
+
+        return s3_client.generate_presigned_url(
+            ClientMethod='get_object',
+            Params={
+                'Bucket': self.bucket_name,
+                'Key': self.path(path),
+            },
+            ExpiresIn=expires_in,
+        )
+
     def path(self, path):
         """
         Include the storage "location" (prefix), i.e "local", "dev", "test" etc.  Will be empty when in production
@@ -107,3 +142,72 @@ class S3ObjectStoragePrivate(S3ObjectStorage):
             self.location,
             path,
         )
+
+
+class S3MultipartUploadWriter:
+    """
+    Write-only file object which uploads everything written to it as an S3 multipart upload.
+    Parts are uploaded concurrently while writing continues, and the number of parts
+    buffered in memory is bounded by the upload concurrency.
+    """
+
+    def __init__(self, s3_client, bucket: str, key: str):
+        self.s3_client = s3_client
+        self.bucket = bucket
+        self.key = key
+        self.chunk_size = settings.CWWED_ARCHIVES_MULTIPART_CHUNK_SIZE
+        self._buffer = bytearray()
+        self._futures = []
+        self._part_number = 0
+        self._executor = ThreadPoolExecutor(max_workers=settings.CWWED_ARCHIVES_MULTIPART_CONCURRENCY)
+        # limits the number of parts waiting to be uploaded
+        self._slots = threading.BoundedSemaphore(settings.CWWED_ARCHIVES_MULTIPART_CONCURRENCY * 2)
+        self._upload_id = self.s3_client.create_multipart_upload(Bucket=self.bucket, Key=self.key)['UploadId']
+
+    def write(self, data: bytes) -> int:
+        self._buffer.extend(data)
+        while len(self._buffer) >= self.chunk_size:
+            self._upload_part(bytes(self._buffer[:self.chunk_size]))
+            del self._buffer[:self.chunk_size]
+        return len(data)
+
+    def _upload_part(self, body: bytes):
+        self._slots.acquire()
+        self._part_number += 1
+        self._futures.append(self._executor.submit(self._upload_part_worker, self._part_number, body))
+
+    def _upload_part_worker(self, part_number: int, body: bytes) -> dict:
+        try:
+            response = self.s3_client.upload_part(
+                Bucket=self.bucket, Key=self.key, UploadId=self._upload_id, PartNumber=part_number, Body=body)
+            return {'PartNumber': part_number, 'ETag': response['ETag']}
+        finally:
+            self._slots.release()
+
+    def close(self):
+        # the last part may be smaller than the minimum part size
+        if self._buffer or not self._part_number:
+            self._upload_part(bytes(self._buffer))
+            self._buffer = bytearray()
+        parts = [future.result() for future in self._futures]
+        self._executor.shutdown()
+        self.s3_client.complete_multipart_upload(
+            Bucket=self.bucket, Key=self.key, UploadId=self._upload_id, MultipartUpload={'Parts': parts})
+
+    def abort(self):
+        self._executor.shutdown()
+        logger.warning('aborting multipart upload for {}'.format(self.key))
+        self.s3_client.abort_multipart_upload(Bucket=self.bucket, Key=self.key, UploadId=self._upload_id)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is None:
+            try:
+                self.close()
+            except Exception:
+                self.abort()
+                raise
+        else:
+            self.abort()
@@ -15,7 +15,7 @@ import * as _ from 'lodash';
   styleUrls: ['./psa-export.component.css']
 })
 export class PsaExportComponent implements OnInit {
-  public FORMAT_TYPES = ["netcdf", "shapefile", "geojson", "kml", "csv"];
+  public FORMAT_TYPES = ["netcdf", "shapefile", "geojson", "kml", "csv", "geoparquet", "flatgeobuf"];
   public storm: any;
   public format: string;
   public date: string;
@@ -1,3 +1,11 @@
+from typing import Sequence
+
+import pyarrow as pa
+from django.http import StreamingHttpResponse
+
+from cwwed.api.renderers import ArrowStreamRenderer, ParquetRenderer, stream_arrow, stream_parquet
+
+
 class UserReferenceViewSetMixin:
     """
     ViewSet Mixin which includes the "request" object in the serializer context
@@ -7,3 +15,38 @@ class UserReferenceViewSetMixin:
         context = super().get_serializer_context()
         context['request'] = self.request
         return context
+
+
+class PsaColumnarViewSetMixin:
+    """
+    ViewSet Mixin which streams psa values as Apache Arrow or Parquet record batches (i.e "?format=arrow")
+    - the view must include ArrowStreamRenderer and ParquetRenderer in its renderer_classes
+    """
+    COLUMNAR_BATCH_SIZE = 50000
+
+    COLUMNAR_SCHEMA = pa.schema([
+        ('lon', pa.float64()),
+        ('lat', pa.float64()),
+        ('date', pa.timestamp('us', tz='UTC')),
+        ('variable', pa.string()),
+        ('value', pa.float64()),
+    ])
+
+    def is_columnar_format(self) -> bool:
+        return isinstance(getattr(self.request, 'accepted_renderer', None), (ArrowStreamRenderer, ParquetRenderer))
+
+    def columnar_response(self, columns: Sequence[Sequence], file_name: str) -> StreamingHttpResponse:
+        """
+        :param columns: lon, lat, date, variable & value columns (lists or numpy arrays) of equal length
+        :param file_name: download name without the extension
+        """
+        renderer = self.request.accepted_renderer
+        stream = stream_parquet if isinstance(renderer, ParquetRenderer) else stream_arrow
+        table = pa.Table.from_arrays(
+            [pa.array(column, type=field.type) for column, field in zip(columns, self.COLUMNAR_SCHEMA)],
+            schema=self.COLUMNAR_SCHEMA,
+        )
+        batches = table.to_batches(max_chunksize=self.COLUMNAR_BATCH_SIZE)
+        response = StreamingHttpResponse(stream(self.COLUMNAR_SCHEMA, batches), content_type=renderer.media_type)
+        response['Content-Disposition'] = 'attachment; filename="{}.{}"'.format(file_name, renderer.format)
+        return response
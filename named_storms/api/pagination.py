@@ -0,0 +1,121 @@
+import json
+from base64 import b64decode, b64encode
+from django.db.models import BooleanField, Q, QuerySet
+from django.db.models.expressions import RawSQL
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, _positive_int
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param, remove_query_param
+from named_storms.models import NsemPsaData
+
+
+class NsemPsaDataKeysetPagination(BasePagination):
+    """
+    Keyset (cursor) pagination for the partitioned psa data table
+    - rows are ordered by (nsem_psa_variable, date, id) and each page starts after the previous page's last key
+      so every page costs the same regardless of depth (vs OFFSET scans)
+    - the queryset is expected to be filtered by a single variable
+    - no total count is calculated
+    - rows are expected to be model instances or named tuples (i.e values_list(..., named=True)) including the ordering fields
+    """
+    ordering = ('nsem_psa_variable_id', 'date', 'id')
+    page_size = api_settings.PAGE_SIZE
+    max_page_size = 1000
+    cursor_query_param = 'cursor'
+    cursor_query_description = 'The pagination cursor value.'
+    page_size_query_param = 'limit'
+    page_size_query_description = 'Number of results to return per page.'
+
+    def __init__(self):
+        self.base_url = None
+        self.next_key = None
+
+    def paginate_queryset(self, queryset: QuerySet, request, view=None):
+        self.base_url = request.build_absolute_uri()
+        page_size = self.get_page_size(request)
+
+        queryset = queryset.order_by(*self.ordering)
+
+        key = self.decode_cursor(request)
+        if key is not None:
+            queryset = queryset.filter(self._after_key_filter(*key))
+
+        # fetch an extra row to determine if there's another page
+        results = list(queryset[:page_size + 1])
+        if len(results) > page_size:
+            results = results[:page_size]
+            last = results[-1]
+            self.next_key = [getattr(last, field) for field in self.ordering]
+        else:
+            self.next_key = None
+
+        return results
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'results': data,
+        })
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'properties': {
+                'next': {
+                    'type': 'string',
+                    'nullable': True,
+                },
+                'results': schema,
+            },
+        }
+
+    def get_page_size(self, request):
+        try:
+            return _positive_int(request.query_params[self.page_size_query_param], strict=True, cutoff=self.max_page_size)
+        except (KeyError, ValueError):
+            return self.page_size
+
+    def get_next_link(self):
+        if self.next_key is None:
+            return None
+        return replace_query_param(self.base_url, self.cursor_query_param, self.encode_cursor(self.next_key))
+
+    def get_first_link(self):
+        return remove_query_param(self.base_url, self.cursor_query_param)
+
+    @staticmethod
+    def encode_cursor(key: list) -> str:
+        variable_id, date, pk = key
+        return b64encode(json.dumps([variable_id, date.isoformat() if date else None, pk]).encode()).decode()
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            variable_id, date, pk = json.loads(b64decode(encoded.encode()).decode())
+            date = parse_datetime(date) if date is not None else None
+            return int(variable_id), date, int(pk)
+        except (TypeError, ValueError):
+            raise NotFound('Invalid cursor')
+
+    @staticmethod
+    def _after_key_filter(variable_id: int, date, pk: int) -> Q:
+        # the listing is always filtered by a single variable so the key is compared within the variable.
+        # null dates ("max-values" variables) sort last so they follow every dated row
+        if date is None:
+            return Q(nsem_psa_variable_id=variable_id, date__isnull=True, id__gt=pk)
+        table = NsemPsaData._meta.db_table
+        # row value comparison of (date, id) > key which postgres can resolve through the (date, id) ordering
+        after_key = RawSQL('("{table}"."date", "{table}"."id") > (%s, %s)'.format(table=table), (date, pk), output_field=BooleanField())
+        return Q(nsem_psa_variable_id=variable_id) & (Q(after_key) | Q(date__isnull=True))
+
+
+class NsemPsaDataColumnarPagination(NsemPsaDataKeysetPagination):
+    """
+    Keyset pagination for the arrow/parquet psa data formats which use much larger pages
+    """
+    page_size = 100000
+    max_page_size = 500000
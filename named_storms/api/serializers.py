@@ -1,6 +1,7 @@
 import logging
 from django.conf import settings
 from django.contrib.auth.models import User
+from django.contrib.gis import geos
 from rest_framework import serializers
 from rest_framework import exceptions
 from rest_framework.settings import api_settings
@@ -8,6 +9,7 @@ from cwwed.storage_backends import S3ObjectStoragePrivate
 from named_storms.models import (
     NamedStorm, NamedStormCoveredData, CoveredData, NsemPsa, CoveredDataProvider,
     NsemPsaVariable, NsemPsaUserExport, NsemPsaManifestDataset, NamedStormCoveredDataSnapshot, NsemPsaData)
+from named_storms.sql import transect_length_query, transect_points_count
 from named_storms.utils import get_opendap_url_nsem, get_opendap_url_covered_data_snapshot
 
 logger = logging.getLogger('cwwed')
@@ -200,17 +202,14 @@ class NsemPsaUserExportSerializer(serializers.ModelSerializer):
     """
 
     user = serializers.PrimaryKeyRelatedField(queryset=User.objects.all())
+    eta = serializers.ReadOnlyField()
 
     def validate(self, data):
 
         data = super().validate(data)
 
         # require date_filter for specific formats
-        date_specific_formats = [
-            NsemPsaUserExport.FORMAT_CSV, NsemPsaUserExport.FORMAT_SHAPEFILE,
-            NsemPsaUserExport.FORMAT_GEOJSON, NsemPsaUserExport.FORMAT_KML,
-        ]
-        if data['format'] in date_specific_formats and not data.get('date_filter'):
+        if data['format'] in NsemPsaUserExport.FORMATS_DATE_FILTER and not data.get('date_filter'):
             raise serializers.ValidationError({"date_filter": ["date_filter required this export format"]})
 
         return data
@@ -218,6 +217,9 @@ class NsemPsaUserExportSerializer(serializers.ModelSerializer):
     class Meta:
         model = NsemPsaUserExport
         fields = '__all__'
+        read_only_fields = (
+            'fingerprint', 's3_key', 'reused_from', 'date_started', 'phase', 'phase_timings', 'progress', 'rows_processed', 'bytes_written',
+        )
 
 
 class NsemPsaDataSerializer(serializers.ModelSerializer):
@@ -235,6 +237,54 @@ class NsemPsaTimeSeriesSerializer(serializers.Serializer):
     values = serializers.ListField(child=serializers.FloatField())
 
 
+class NsemPsaTimeSeriesBatchPointSerializer(serializers.Serializer):
+    lat = serializers.FloatField(min_value=-90, max_value=90)
+    lon = serializers.FloatField(min_value=-180, max_value=180)
+
+
+class NsemPsaTimeSeriesBatchSerializer(serializers.Serializer):
+    """
+    Named Storm Event Model PSA Time Series Batch Serializer
+    - accepts either a list of points or a line (transect) sampled every `spacing` meters
+    """
+    EXPORT_JSON = 'json'
+    EXPORT_CSV = 'csv'
+    EXPORT_NETCDF = 'netcdf'
+    EXPORT_CHOICES = (
+        (EXPORT_JSON, EXPORT_JSON),
+        (EXPORT_CSV, EXPORT_CSV),
+        (EXPORT_NETCDF, EXPORT_NETCDF),
+    )
+
+    MAX_POINTS = 500
+
+    points = serializers.ListField(child=NsemPsaTimeSeriesBatchPointSerializer(), required=False, allow_empty=False, max_length=MAX_POINTS)
+    line = serializers.CharField(required=False, help_text='WKT LineString')
+    spacing = serializers.FloatField(required=False, min_value=1, help_text='sample spacing along the line (meters)')
+    export = serializers.ChoiceField(choices=EXPORT_CHOICES, default=EXPORT_JSON)
+
+    def validate_line(self, value):
+        try:
+            line = geos.GEOSGeometry(value, srid=4326)
+        except (ValueError, geos.GEOSException):
+            raise serializers.ValidationError('line must be WKT')
+        if not isinstance(line, geos.LineString):
+            raise serializers.ValidationError('line must be a LineString')
+        return line
+
+    def validate(self, data):
+        data = super().validate(data)
+        if bool(data.get('points')) == bool(data.get('line')):
+            raise serializers.ValidationError({api_settings.NON_FIELD_ERRORS_KEY: ['either points or line is required']})
+        if data.get('line'):
+            if not data.get('spacing'):
+                raise serializers.ValidationError({'spacing': ['spacing is required with line']})
+            # reject before sampling the points
+            if transect_points_count(transect_length_query(data['line']), data['spacing']) > self.MAX_POINTS:
+                raise serializers.ValidationError({'spacing': ['spacing produces more than {} points'.format(self.MAX_POINTS)]})
+        return data
+
+
 class NsemPsaWindBarbsSerializer(serializers.Serializer):
     # placeholder to satisfy api doc generation
     # output is geojson
@@ -0,0 +1,9 @@
+from rest_framework.throttling import AnonRateThrottle
+
+
+class NsemPsaTimeSeriesBatchAnonRateThrottle(AnonRateThrottle):
+    """
+    Anonymous users can query the batch time series but each request can query many points (or a transect)
+    so they're throttled separately from any other endpoint
+    """
+    scope = 'psa-time-series-batch-anon'
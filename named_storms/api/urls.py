@@ -19,6 +19,7 @@ urlpatterns = [
     re_path(r'^named-storm/(?P<storm_id>\d+)/psa/data/$', viewsets.NsemPsaDataViewSet.as_view({'get': 'list'}), name='psa-wind-barb-geojson'),
     re_path(r'^named-storm/(?P<storm_id>\d+)/psa/data/time-series/(?P<lat>[-+]?(\d*\.?\d+))/(?P<lon>[-+]?(\d*\.?\d+))/$',
             viewsets.NsemPsaTimeSeriesViewSet.as_view({'get': 'list'})),
+    re_path(r'^named-storm/(?P<storm_id>\d+)/psa/data/time-series/batch/$', viewsets.NsemPsaTimeSeriesBatchViewSet.as_view({'post': 'create'}), name='psa-time-series-batch'),
     re_path(r'^named-storm/(?P<storm_id>\d+)/psa/data/wind-barbs/(?P<date>\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2}Z)/$',
             viewsets.NsemPsaWindBarbsViewSet.as_view({'get': 'list'})),
     re_path(r'^named-storm/(?P<storm_id>\d+)/psa/variable/$', viewsets.NsemPsaVariableViewSet.as_view({'get': 'list'})),
@@ -1,43 +1,54 @@
 import csv
+import time
 import logging
+from datetime import timedelta
 
 import geojson
+import numpy as np
+import xarray as xr
 from celery import chain, group, chord
 from django.contrib.gis.db.models.functions import Distance
+from django.db.models import Prefetch
 from django.db.models.functions import Cast
 from django.http import JsonResponse, HttpResponse
 from django.utils.dateparse import parse_datetime
+from django.utils import timezone
 from django.utils.decorators import method_decorator
 from django.conf import settings
 from django.contrib.gis import geos
 from django.views.decorators.gzip import gzip_page
 from django.views.decorators.cache import cache_control, cache_page
-from django.contrib.gis.db.models import Collect, GeometryField
+from django.contrib.gis.db.models import Collect, GeometryField, Func, FloatField
 from rest_framework import viewsets, mixins
 from rest_framework import exceptions
 from rest_framework.decorators import action
-from rest_framework.permissions import DjangoModelPermissionsOrAnonReadOnly
+from rest_framework.permissions import DjangoModelPermissionsOrAnonReadOnly, AllowAny, IsAdminUser
 from rest_framework.response import Response
+from rest_framework.settings import api_settings
 from rest_framework.viewsets import GenericViewSet
 
+from cwwed.api.renderers import COLUMNAR_RENDERERS
 from named_storms.api.filters import NsemPsaContourFilter, NsemPsaDataFilter
-from named_storms.api.mixins import UserReferenceViewSetMixin
-from named_storms.sql import wind_barbs_query
+from named_storms.api.mixins import UserReferenceViewSetMixin, PsaColumnarViewSetMixin
+from named_storms.api.pagination import NsemPsaDataKeysetPagination, NsemPsaDataColumnarPagination
+from named_storms.api.throttles import NsemPsaTimeSeriesBatchAnonRateThrottle
+from named_storms.cache import PsaCurrent, get_psa_current
+from named_storms.sql import wind_barbs_query, transect_points_query, time_series_batch_query
 from named_storms.tasks import (
     create_named_storm_covered_data_snapshot_task, extract_nsem_psa_task, email_nsem_user_covered_data_complete_task,
-    extract_named_storm_covered_data_snapshot_task, create_psa_user_export_task,
-    email_psa_user_export_task, validate_nsem_psa_task,
+    extract_named_storm_covered_data_snapshot_task, email_psa_user_export_task, validate_nsem_psa_task,
+    reuse_psa_user_export, start_psa_user_export, restart_stale_psa_user_export_task,
     postprocess_psa_ingest_task, cache_psa_contour_task,
     ingest_nsem_psa_dataset_variable_task, postprocess_psa_validated_task,
 )
 from named_storms.models import (
-    NamedStorm, CoveredData, NsemPsa, NsemPsaVariable, NsemPsaContour, NsemPsaUserExport, NamedStormCoveredDataSnapshot,
+    NamedStorm, NamedStormCoveredData, CoveredData, NsemPsa, NsemPsaVariable, NsemPsaContour, NsemPsaUserExport, NamedStormCoveredDataSnapshot,
     NsemPsaData, NsemPsaManifestDataset,
 )
 from named_storms.api.serializers import (
     NamedStormSerializer, CoveredDataSerializer, NamedStormDetailSerializer, NsemPsaSerializer, NsemPsaVariableSerializer, NsemPsaUserExportSerializer,
     NamedStormCoveredDataSnapshotSerializer, NsemPsaDataSerializer, NsemPsaTimeSeriesSerializer, NsemPsaManifestDatasetSerializer, NsemPsaWindBarbsSerializer,
-    NsemPsaContourSerializer)
+    NsemPsaContourSerializer, NsemPsaTimeSeriesBatchSerializer)
 from named_storms.utils import get_geojson_feature_collection_from_psa_qs
 
 logger = logging.getLogger('cwwed')
@@ -52,6 +63,18 @@ class NamedStormViewSet(viewsets.ReadOnlyModelViewSet):
     filterset_fields = ('name',)
     search_fields = ('name',)
 
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        # the detailed representation includes the storm's covered data (and each covered data via depth=1)
+        if self.action == 'retrieve':
+            queryset = queryset.prefetch_related(
+                Prefetch('namedstormcovereddata_set', queryset=NamedStormCoveredData.objects.select_related('covered_data')),
+            )
+        # the listing includes the covered data ids
+        else:
+            queryset = queryset.prefetch_related('covered_data')
+        return queryset
+
     def get_serializer_class(self):
         # return a more detailed representation for a specific storm
         if self.action == 'retrieve':
@@ -60,7 +83,7 @@ class NamedStormViewSet(viewsets.ReadOnlyModelViewSet):
 
 
 class CoveredDataViewSet(viewsets.ReadOnlyModelViewSet):
-    queryset = CoveredData.objects.all()
+    queryset = CoveredData.objects.prefetch_related('covereddataprovider_set')
     serializer_class = CoveredDataSerializer
     filterset_fields = ('active',)
 
@@ -69,7 +92,7 @@ class NamedStormCoveredDataSnapshotViewSet(mixins.CreateModelMixin, mixins.Retri
     """
     Named Storm Covered Data Snapshot ViewSet
     """
-    queryset = NamedStormCoveredDataSnapshot.objects.all()
+    queryset = NamedStormCoveredDataSnapshot.objects.prefetch_related('covered_data_logs')
     serializer_class = NamedStormCoveredDataSnapshotSerializer
     permission_classes = (DjangoModelPermissionsOrAnonReadOnly,)
     filterset_fields = ('named_storm',)
@@ -90,7 +113,12 @@ class NsemPsaViewSet(mixins.CreateModelMixin, mixins.RetrieveModelMixin, mixins.
     """
     Named Storm Event Model ViewSet
     """
-    queryset = NsemPsa.objects.all()
+    # the serializer includes opendap urls built from the storm and the covered data snapshot's logs
+    queryset = NsemPsa.objects.select_related(
+        'named_storm', 'covered_data_snapshot__named_storm',
+    ).prefetch_related(
+        'covered_data_snapshot__covered_data_logs__covered_data',
+    )
     serializer_class = NsemPsaSerializer
     permission_classes = (DjangoModelPermissionsOrAnonReadOnly,)
     filterset_fields = ('named_storm', 'extracted', 'validated', 'processed')
@@ -98,7 +126,7 @@ class NsemPsaViewSet(mixins.CreateModelMixin, mixins.RetrieveModelMixin, mixins.
     @action(methods=['get'], detail=False, url_path='per-storm')
     def per_storm(self, request):
         # return the most recent/distinct NSEM records per storm
-        qs = self.filter_queryset(self.queryset).filter(extracted=True, validated=True, processed=True)
+        qs = self.filter_queryset(self.get_queryset()).filter(extracted=True, validated=True, processed=True)
         # order by named_storm_id vs named_storm to prevent table join which django has issues with using distinct on
         qs = qs.order_by('named_storm_id', '-date_created')
         qs = qs.distinct('named_storm_id')
@@ -158,25 +186,24 @@ class NsemPsaBaseViewSet(viewsets.ReadOnlyModelViewSet):
     #   - expects to be nested under a NamedStormViewSet detail
     storm: NamedStorm = None
     nsem: NsemPsa = None
+    psa_current: PsaCurrent = None
 
     def dispatch(self, request, *args, **kwargs):
         storm_id = kwargs.pop('storm_id')
 
-        # get the storm instance
-        storm = NamedStorm.objects.filter(id=storm_id)
-
-        # get the storm's most recent & valid nsem
-        self.nsem = NsemPsa.get_last_valid_psa(storm_id=storm_id)
+        # get the storm and its most recent & valid nsem (cached)
+        self.psa_current = get_psa_current(storm_id)
 
         # validate
-        if not storm.exists() or not self.nsem:
+        if not self.psa_current:
             # returning responses via dispatch isn't part of the drf workflow so manually returning JsonResponse instead
             return JsonResponse(
                 status=exceptions.NotFound.status_code,
                 data={'detail': exceptions.NotFound.default_detail},
             )
 
-        self.storm = storm.first()
+        self.storm = self.psa_current.storm
+        self.nsem = self.psa_current.nsem
 
         return super().dispatch(request, *args, **kwargs)
 
@@ -191,15 +218,66 @@ class NsemPsaVariableViewSet(NsemPsaBaseViewSet):
         return self.nsem.nsempsavariable_set.all() if self.nsem else NsemPsaVariable.objects.none()
 
 
-class NsemPsaTimeSeriesViewSet(NsemPsaBaseViewSet):
+class NsemPsaTimeSeriesViewSet(PsaColumnarViewSetMixin, NsemPsaBaseViewSet):
     """
     #### PSA Time Series
+
+    **optional params:**
+
+    - `export=csv`
+    - `format=arrow` or `format=parquet`
     """
     queryset = NsemPsaData.objects.all()  # defined in list()
     pagination_class = None
     serializer_class = NsemPsaTimeSeriesSerializer
+    renderer_classes = (*api_settings.DEFAULT_RENDERER_CLASSES, *COLUMNAR_RENDERERS)
 
     POINT_DISTANCE = 500  # meters
+    LATENCY_TARGET = .5  # seconds
+
+    def _time_series_variables(self) -> list:
+        return [
+            v for v in self.psa_current.variables
+            if v.data_type == NsemPsaVariable.DATA_TYPE_TIME_SERIES and v.geo_type == NsemPsaVariable.GEO_TYPE_POLYGON
+        ]
+
+    def _time_series_values(self, point: geos.Point, variables: list) -> dict:
+        """
+        Returns the values nearest the supplied point for every variable aligned with the psa's dates, i.e {variable_id: [values]}
+        """
+        fields_order = ['nsem_psa_variable_id', 'date']
+        fields_values = ('nsem_psa_variable_id', 'value', 'date')
+
+        time_started = time.time()
+
+        # time-series data nearest supplied point per variable/date
+        time_series_query = NsemPsaData.objects.annotate(
+            distance=Distance('point', point),
+        ).distinct(
+            *fields_order
+        ).filter(
+            point__dwithin=(point, self.POINT_DISTANCE),
+            nsem_psa_variable_id__in=[v.id for v in variables],  # avoids joining the variable table
+            storm_name=self.storm.name,  # helps with table partitioning
+        ).order_by(
+            # sort by ascending distance to get the first result in each group (i.e the nearest to supplied point)
+            *fields_order + ['distance']
+        ).values_list(
+            *fields_values
+        )
+
+        # fill each variable's values by indexing the psa dates and default absent values to zero
+        date_indexes = {date: i for i, date in enumerate(self.nsem.dates)}
+        values = {variable.id: [0] * len(date_indexes) for variable in variables}
+        for variable_id, value, date in time_series_query:
+            if date in date_indexes:
+                values[variable_id][date_indexes[date]] = value
+
+        time_elapsed = time.time() - time_started
+        if time_elapsed > self.LATENCY_TARGET:
+            logger.warning('Time series query for {} at {} took {:.2f}s (target {}s)'.format(self.nsem, point.coords, time_elapsed, self.LATENCY_TARGET))
+
+        return values
 
     def _as_csv(self, results, lat, lon):
         response = HttpResponse(content_type='text/csv')
@@ -231,54 +309,141 @@ class NsemPsaTimeSeriesViewSet(NsemPsaBaseViewSet):
 
         point = geos.Point(x=lon, y=lat, srid=4326)
 
-        fields_order = ['nsem_psa_variable__name', 'date']
-        fields_values = ('nsem_psa_variable__name', 'value', 'date')
-
-        # time-series data nearest supplied point per variable/date
-        time_series_query = NsemPsaData.objects.annotate(
-            distance=Distance('point', point),
-        ).distinct(
-            *fields_order
-        ).filter(
-            point__dwithin=(point, self.POINT_DISTANCE),
-            nsem_psa_variable__nsem=self.nsem,
-            storm_name=self.storm.name,  # helps with table partitioning
-        ).order_by(
-            # sort by ascending distance to get the first result in each group (i.e the nearest to supplied point)
-            *fields_order + ['distance']
-        ).only(
-            *fields_values
-        ).values(
-            *fields_values
-        )
-
-        results = []
+        variables = self._time_series_variables()
 
-        # time-series variables
-        variables = self.nsem.nsempsavariable_set.filter(
-            data_type=NsemPsaVariable.DATA_TYPE_TIME_SERIES,
-            geo_type=NsemPsaVariable.GEO_TYPE_POLYGON,
-        )
+        values = self._time_series_values(point, variables)
 
         # include data grouped by variable
-        for variable in variables:
-            result = {
-                'variable': variable,
-                'values': [],
-            }
-            for date in self.nsem.dates:
-                # find matching record if it exists
-                value = next((v['value'] for v in time_series_query if v['nsem_psa_variable__name'] == variable.name and v['date'] == date), 0)
-                result['values'].append(value)
-            results.append(result)
+        results = [{'variable': variable, 'values': values[variable.id]} for variable in variables]
 
         # csv export
         if request.query_params.get('export') == 'csv':
             return self._as_csv(results, lat, lon)
 
+        # arrow/parquet
+        if self.is_columnar_format():
+            size = len(variables) * len(self.nsem.dates)
+            columns = [
+                [lon] * size,
+                [lat] * size,
+                self.nsem.dates * len(variables),
+                [variable.name for variable in variables for _ in self.nsem.dates],
+                [value for variable in variables for value in values[variable.id]],
+            ]
+            return self.columnar_response(columns, '{}-time-series'.format(self.nsem.named_storm))
+
         return Response(self.serializer_class(results, many=True).data)
 
 
+class NsemPsaTimeSeriesBatchViewSet(NsemPsaTimeSeriesViewSet):
+    """
+    #### PSA Time Series (batch)
+
+    Time series for many points, or points sampled along a line (transect), in a single request.
+
+    **params (json body):**
+
+    - `points` i.e `[{"lat": 40.7, "lon": -74.0}, ...]`
+    - **or** `line` (WKT LineString) and `spacing` (meters)
+    - `export` (optional) `json`, `csv` or `netcdf`
+
+    **optional params:**
+
+    - `format=arrow` or `format=parquet`
+
+    Values are returned as a (point x variable x date) matrix.  Anonymous requests are throttled.
+    """
+    serializer_class = NsemPsaTimeSeriesBatchSerializer
+    # this is a read-only query but it's submitted via POST due to the size of the payload
+    permission_classes = (AllowAny,)
+    throttle_classes = (NsemPsaTimeSeriesBatchAnonRateThrottle,)
+
+    def create(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+
+        # sample points along the transect
+        if data.get('line'):
+            # the serializer already verified the number of points
+            points = transect_points_query(data['line'], data['spacing'])
+        else:
+            points = [geos.Point(x=p['lon'], y=p['lat'], srid=4326) for p in data['points']]
+
+        variables = self._time_series_variables()
+
+        # (point x variable x date) matrix and default absent values to zero
+        values = np.zeros((len(points), len(variables), len(self.nsem.dates)))
+        variable_indexes = {variable.id: i for i, variable in enumerate(variables)}
+        date_indexes = {date: i for i, date in enumerate(self.nsem.dates)}
+
+        if variables:
+            results = time_series_batch_query(self.storm.name, variable_indexes.keys(), points, self.POINT_DISTANCE)
+            for point_idx, variable_id, date, value in results:
+                if date in date_indexes:
+                    values[point_idx, variable_indexes[variable_id], date_indexes[date]] = value
+
+        # arrow/parquet
+        if self.is_columnar_format():
+            # flatten the (point x variable x date) matrix
+            point_size = len(variables) * len(self.nsem.dates)
+            columns = [
+                np.repeat([point.x for point in points], point_size),
+                np.repeat([point.y for point in points], point_size),
+                self.nsem.dates * (len(points) * len(variables)),
+                [variable.name for variable in variables for _ in self.nsem.dates] * len(points),
+                values.reshape(-1),
+            ]
+            return self.columnar_response(columns, '{}-time-series'.format(self.nsem.named_storm))
+
+        if data['export'] == NsemPsaTimeSeriesBatchSerializer.EXPORT_CSV:
+            return self._as_csv_batch(points, variables, values)
+        elif data['export'] == NsemPsaTimeSeriesBatchSerializer.EXPORT_NETCDF:
+            return self._as_netcdf_batch(points, variables, values)
+
+        return Response({
+            'dates': self.nsem.dates,
+            'points': [[p.y, p.x] for p in points],  # lat, lon
+            'variables': NsemPsaVariableSerializer(variables, many=True).data,
+            'values': values.tolist(),
+        })
+
+    def _as_csv_batch(self, points: list, variables: list, values: np.ndarray):
+        response = HttpResponse(content_type='text/csv')
+        response['Content-Disposition'] = 'attachment; filename="{}-time-series.csv"'.format(self.nsem.named_storm)
+
+        writer = csv.writer(response)
+        writer.writerow(['date', 'lat', 'lon', 'name', 'units', 'value'])
+        for point_idx, point in enumerate(points):
+            for variable_idx, variable in enumerate(variables):
+                for date_idx, date in enumerate(self.nsem.dates):
+                    writer.writerow([
+                        date,
+                        point.y,
+                        point.x,
+                        variable.name,
+                        variable.units,
+                        values[point_idx, variable_idx, date_idx],
+                    ])
+
+        return response
+
+    def _as_netcdf_batch(self, points: list, variables: list, values: np.ndarray):
+        ds = xr.Dataset(
+            {variable.name: (['point', 'time'], values[:, i, :], variable.meta) for i, variable in enumerate(variables)},
+            coords={
+                'time': (['time'], self.nsem.naive_dates()),
+                'lat': (['point'], [p.y for p in points]),
+                'lon': (['point'], [p.x for p in points]),
+            },
+        )
+
+        response = HttpResponse(ds.to_netcdf(), content_type='application/x-netcdf')
+        response['Content-Disposition'] = 'attachment; filename="{}-time-series.nc"'.format(self.nsem.named_storm)
+
+        return response
+
+
 class NsemPsaWindBarbsViewSet(NsemPsaBaseViewSet):
     """
     #### Named Storm PSA Wind Barbs
@@ -310,7 +475,7 @@ class NsemPsaWindBarbsViewSet(NsemPsaBaseViewSet):
             raise exceptions.ValidationError({'center': ['center point must be WKT']})
 
         # build wind barbs query depending on the presence of wind_speed or wind_gust
-        nsem_variables = self.nsem.nsempsavariable_set.values_list('name', flat=True)
+        nsem_variables = self.psa_current.get_variable_names()
         if NsemPsaVariable.VARIABLE_DATASET_WIND_SPEED in nsem_variables:
             results = wind_barbs_query(self.storm.name, self.nsem.id, date=date, center=center, step=step)
         elif NsemPsaVariable.VARIABLE_DATASET_WIND_GUST:
@@ -394,29 +559,38 @@ class NsemPsaContourViewSet(NsemPsaBaseViewSet):
     def _validate(self):
 
         # verify the requested variable exists
-        nsem_psa_variable_query = self.nsem.nsempsavariable_set.filter(name=self.request.query_params['nsem_psa_variable'])
-        if not nsem_psa_variable_query.exists():
+        nsem_psa_variable = self.psa_current.get_variable(self.request.query_params['nsem_psa_variable'])
+        if not nsem_psa_variable:
             raise exceptions.ValidationError('No data exists for variable "{}"'.format(self.request.query_params['nsem_psa_variable']))
 
         # verify if the variable requires a date filter
-        if nsem_psa_variable_query[0].data_type == NsemPsaVariable.DATA_TYPE_TIME_SERIES and not self.request.query_params.get('date'):
+        if nsem_psa_variable.data_type == NsemPsaVariable.DATA_TYPE_TIME_SERIES and not self.request.query_params.get('date'):
             raise exceptions.ValidationError({'date': ['required for this type of variable']})
 
 
 @method_decorator(gzip_page, name='dispatch')
-class NsemPsaDataViewSet(NsemPsaBaseViewSet):
+class NsemPsaDataViewSet(PsaColumnarViewSetMixin, NsemPsaBaseViewSet):
     """
     #### Named Storm PSA Data
 
     **required params:**
 
     - `nsem_psa_variable`
+
+    **optional params:**
+
+    - `format=arrow` or `format=parquet` returns large pages of `lon`, `lat`, `date`, `variable` & `value` (the next page is in the `Link` header)
     """
     # Named Storm Event Model PSA Data ViewSet
     #   - expects to be nested under a NamedStormViewSet detail
 
     filterset_class = NsemPsaDataFilter
-    serializer_class = NsemPsaDataSerializer
+    serializer_class = NsemPsaDataSerializer  # only used for api docs since list() skips serialization
+    pagination_class = NsemPsaDataKeysetPagination
+    renderer_classes = (*api_settings.DEFAULT_RENDERER_CLASSES, *COLUMNAR_RENDERERS)
+
+    # NsemPsaDataSerializer's fields
+    FIELDS = ('id', 'nsem_psa_variable', 'storm_name', 'point', 'date', 'value')
 
     def get_queryset(self):
         # filter by nested nsem
@@ -427,13 +601,73 @@ class NsemPsaDataViewSet(NsemPsaBaseViewSet):
         # the query is too expensive and we can benefit from the DRF filter being presented in the API view
         if 'nsem_psa_variable' not in request.query_params:
             return Response([])
-        return super().list(request, *args, **kwargs)
+
+        # fetch raw tuples and compute the coordinates in the database which skips model instantiation,
+        # geometry parsing and per-field serialization
+        queryset = self.filter_queryset(self.get_queryset())
+        queryset = queryset.annotate(
+            x=Func(Cast('point', GeometryField()), function='ST_X', output_field=FloatField()),
+            y=Func(Cast('point', GeometryField()), function='ST_Y', output_field=FloatField()),
+        )
+
+        # arrow/parquet - large pages which link to the next page through the "Link" header
+        if self.is_columnar_format():
+            return self._columnar_page(queryset)
+
+        queryset = queryset.values_list('id', 'nsem_psa_variable_id', 'storm_name', 'x', 'y', 'date', 'value', named=True)  # named for the keyset pagination
+
+        page = self.paginate_queryset(queryset)
+        rows = page if page is not None else queryset
+
+        results = [
+            dict(zip(self.FIELDS, (pk, variable_id, storm_name, self._point_ewkt(x, y), date, value)))
+            for pk, variable_id, storm_name, x, y, date, value in rows
+        ]
+
+        if page is not None:
+            return self.get_paginated_response(results)
+        return Response(results)
+
+    def _columnar_page(self, queryset):
+        paginator = NsemPsaDataColumnarPagination()
+        page = paginator.paginate_queryset(
+            queryset.values_list('id', 'nsem_psa_variable_id', 'x', 'y', 'date', 'value', named=True), self.request, view=self)
+
+        variable_names = {v.id: v.name for v in self.psa_current.variables}
+        columns = [
+            [row.x for row in page],
+            [row.y for row in page],
+            [row.date for row in page],
+            [variable_names[row.nsem_psa_variable_id] for row in page],
+            [row.value for row in page],
+        ]
+
+        response = self.columnar_response(columns, '{}-{}'.format(self.nsem.named_storm, self.request.query_params['nsem_psa_variable']))
+        next_link = paginator.get_next_link()
+        if next_link:
+            response['Link'] = '<{}>; rel="next"'.format(next_link)
+        return response
+
+    @staticmethod
+    def _point_ewkt(x: float, y: float) -> str:
+        # matches the string representation of a geos point (i.e "SRID=4326;POINT (-74.0059 40.7127)")
+        # where geos writes "trimmed" numbers using 16 significant digits
+        return 'SRID=4326;POINT ({:.16g} {:.16g})'.format(x, y)
 
 
 class NsemPsaUserExportViewSet(UserReferenceViewSetMixin, viewsets.ModelViewSet):
     serializer_class = NsemPsaUserExportSerializer
     queryset = NsemPsaUserExport.objects.all()
 
+    # bbox size (square degrees) buckets when aggregating export statistics
+    STATS_BBOX_SIZES = (
+        (1, 'small'),
+        (4, 'medium'),
+        (16, 'large'),
+    )
+    STATS_BBOX_SIZE_MAX = 'x-large'
+    STATS_DAYS = 30
+
     def get_queryset(self):
         # only include objects the requesting user owns
         if self.request.user.is_authenticated:
@@ -446,14 +680,76 @@ class NsemPsaUserExportViewSet(UserReferenceViewSetMixin, viewsets.ModelViewSet)
         request.data['user'] = request.user.id
         return super().create(request, *args, **kwargs)
 
+    @action(methods=['get'], detail=False, permission_classes=(IsAdminUser,))
+    def stats(self, request, *args, **kwargs):
+        """
+        Aggregates the timings of recently completed exports by format and bbox size to find the slowest export shapes
+        """
+        try:
+            days = int(request.query_params.get('days') or self.STATS_DAYS)
+            if days < 1:
+                raise ValueError
+        except ValueError:
+            raise exceptions.ValidationError({'days': ['days must be a positive integer']})
+
+        exports = NsemPsaUserExport.objects.filter(
+            success=True,
+            reused_from__isnull=True,  # reused exports didn't create anything
+            date_started__isnull=False,
+            date_created__gte=timezone.now() - timedelta(days=days),
+        ).only('format', 'bbox', 'date_started', 'date_completed', 'phase_timings', 'rows_processed', 'bytes_written')
+
+        buckets = {}
+        for export in exports:
+            buckets.setdefault((export.format, self._stats_bbox_size(export.bbox)), []).append(export)
+
+        results = []
+        for (export_format, bbox_size), bucket in buckets.items():
+            durations = [(e.date_completed - e.date_started).total_seconds() for e in bucket]
+            phases = {phase for e in bucket for phase in e.phase_timings}
+            results.append({
+                'format': export_format,
+                'bbox_size': bbox_size,
+                'count': len(bucket),
+                'duration_mean': float(np.mean(durations)),
+                'duration_max': max(durations),
+                'phase_timings_mean': {
+                    phase: float(np.mean([e.phase_timings[phase] for e in bucket if phase in e.phase_timings])) for phase in phases
+                },
+                'rows_processed_mean': float(np.mean([e.rows_processed for e in bucket])),
+                'bytes_written_mean': float(np.mean([e.bytes_written for e in bucket])),
+            })
+
+        # slowest first
+        return Response(sorted(results, key=lambda r: r['duration_mean'], reverse=True))
+
+    def _stats_bbox_size(self, bbox: geos.Polygon) -> str:
+        for area, name in self.STATS_BBOX_SIZES:
+            if bbox.area <= area:
+                return name
+        return self.STATS_BBOX_SIZE_MAX
+
     def perform_create(self, serializer):
         super().perform_create(serializer)
 
-        # create tasks to build the export and email the user when complete
-        chain(
-            create_psa_user_export_task.s(nsem_psa_user_export_id=serializer.instance.id),
-            email_psa_user_export_task.si(nsem_psa_user_export_id=serializer.instance.id),
-        ).apply_async()
+        # reuse an identical export's results (or attach to it while it's in progress) rather than creating it again
+        reusable_export = serializer.instance.get_reusable_export()
+        if reusable_export:
+            reuse_psa_user_export(serializer.instance, reusable_export)
+            # the identical export may have completed since it was found
+            if not serializer.instance.date_completed:
+                reusable_export.refresh_from_db()
+                if reusable_export.date_completed:
+                    reuse_psa_user_export(serializer.instance, reusable_export)
+            # otherwise the user is emailed when the identical export completes (or it's restarted if it times out)
+            if serializer.instance.date_completed:
+                email_psa_user_export_task.delay(nsem_psa_user_export_id=serializer.instance.id)
+            else:
+                restart_stale_psa_user_export_task.apply_async(
+                    args=(serializer.instance.id,), eta=reusable_export.date_created + NsemPsaUserExport.get_timeout())
+            return
+
+        start_psa_user_export(serializer.instance)
 
 
 class NsemPsaUserExportNestedViewSet(NsemPsaBaseViewSet, NsemPsaUserExportViewSet):
@@ -0,0 +1,176 @@
+import os
+import gzip
+import shutil
+import logging
+import tarfile
+import threading
+import subprocess
+import zstandard
+from typing import BinaryIO, Optional
+from django.conf import settings
+
+logger = logging.getLogger('cwwed')
+
+CODEC_GZIP = 'gzip'  # single threaded gzip
+CODEC_PIGZ = 'pigz'  # multi-threaded gzip compatible output (falls back to gzip when pigz isn't installed)
+CODEC_ZSTD = 'zstd'
+CODEC_STORE = 'store'  # uncompressed tar
+CODECS = (CODEC_GZIP, CODEC_PIGZ, CODEC_ZSTD, CODEC_STORE)
+
+CODEC_EXTENSIONS = {
+    CODEC_GZIP: 'tgz',
+    CODEC_PIGZ: 'tgz',
+    CODEC_ZSTD: 'tar.zst',
+    CODEC_STORE: 'tar',
+}
+
+MAGIC_GZIP = b'\x1f\x8b'
+MAGIC_ZSTD = b'\x28\xb5\x2f\xfd'
+MAGIC_HDF5 = b'\x89HDF\r\n\x1a\n'  # NetCDF4 files are HDF5
+
+PIPE_CHUNK_SIZE = 1024 * 1024
+
+
+def get_archive_extension(codec: str) -> str:
+    return CODEC_EXTENSIONS[codec]
+
+
+def is_archive(path: str) -> bool:
+    return any(path.endswith('.{}'.format(extension)) for extension in set(CODEC_EXTENSIONS.values()))
+
+
+def _is_compressed_file(path: str) -> bool:
+    """
+    Whether a file's payload is already compressed according to its extension
+    """
+    extension = os.path.splitext(path)[1].lstrip('.').lower()
+    if extension in settings.CWWED_ARCHIVE_COMPRESSED_EXTENSIONS:
+        return True
+    # netcdf4 (hdf5) and netcdf classic share the ".nc" extension but only netcdf4 is compressed
+    if extension == 'nc':
+        with open(path, 'rb') as f:
+            return f.read(len(MAGIC_HDF5)) == MAGIC_HDF5
+    return False
+
+
+def get_archive_codec(directory_path: str) -> str:
+    """
+    Chooses the codec for archiving a directory.  It's stored without compression when nearly all of its
+    payload is already compressed (netcdf4, hdf5, gzip etc) since recompressing it is wasted cpu time.
+    """
+    total_size = compressed_size = 0
+    for root, _, files in os.walk(directory_path):
+        for f in files:
+            path = os.path.join(root, f)
+            size = os.path.getsize(path)
+            total_size += size
+            if _is_compressed_file(path):
+                compressed_size += size
+    if total_size and compressed_size / total_size >= settings.CWWED_ARCHIVE_STORE_COMPRESSED_RATIO:
+        return CODEC_STORE
+    return settings.CWWED_ARCHIVE_CODEC
+
+
+class ArchiveWriter:
+    """
+    Writes a tar archive, compressed by the codec, as a stream into a file object
+    """
+
+    def __init__(self, fileobj: BinaryIO, codec: str):
+        if codec not in CODECS:
+            raise ValueError('Unknown archive codec {}'.format(codec))
+        if codec == CODEC_PIGZ and not shutil.which('pigz'):
+            logger.warning('pigz is not installed so falling back to single threaded gzip')
+            codec = CODEC_GZIP
+        self.codec = codec
+        self.fileobj = fileobj
+        self._compressor = None  # type: Optional[BinaryIO]
+        self._process = None  # type: Optional[subprocess.Popen]
+        self._pipe_thread = None  # type: Optional[threading.Thread]
+        self._pipe_error = None  # type: Optional[BaseException]
+        self._tar = None  # type: Optional[tarfile.TarFile]
+
+    def __enter__(self):
+        if self.codec == CODEC_GZIP:
+            self._compressor = gzip.GzipFile(fileobj=self.fileobj, mode='wb', compresslevel=settings.CWWED_ARCHIVE_CODEC_LEVEL)
+        elif self.codec == CODEC_PIGZ:
+            self._process = subprocess.Popen(
+                ['pigz', '-c', '-{}'.format(settings.CWWED_ARCHIVE_CODEC_LEVEL), '-p', str(settings.CWWED_ARCHIVE_CODEC_THREADS)],
+                stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+            # pipe the compressed output into the file object while the tar is written into pigz
+            self._pipe_thread = threading.Thread(target=self._pipe, daemon=True)
+            self._pipe_thread.start()
+            self._compressor = self._process.stdin
+        elif self.codec == CODEC_ZSTD:
+            compressor = zstandard.ZstdCompressor(level=settings.CWWED_ARCHIVE_CODEC_LEVEL, threads=settings.CWWED_ARCHIVE_CODEC_THREADS)
+            self._compressor = compressor.stream_writer(self.fileobj, closefd=False)
+        else:
+            self._compressor = None
+        self._tar = tarfile.open(fileobj=self._compressor or self.fileobj, mode='w|')
+        return self
+
+    def _pipe(self):
+        try:
+            shutil.copyfileobj(self._process.stdout, self.fileobj, PIPE_CHUNK_SIZE)
+        except BaseException as e:
+            # record the failure (i.e writing to the file object failed) and stop pigz since nothing is reading
+            # its output anymore, which would otherwise block the tar being written into it
+            self._pipe_error = e
+            self._process.kill()
+
+    def add(self, path: str, arcname: str):
+        try:
+            self._tar.add(path, arcname=arcname)
+        except OSError:
+            # writing into pigz fails once the pipe failed so raise the actual failure
+            if self._pipe_error is not None:
+                raise self._pipe_error
+            raise
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        try:
+            self._tar.close()
+            if self._compressor:
+                self._compressor.close()
+        except OSError:
+            # closing pigz's input fails once the pipe failed (which is raised below)
+            if self._pipe_error is None:
+                raise
+        finally:
+            if self._process:
+                # make sure pigz sees the end of its input so the pipe finishes
+                try:
+                    self._process.stdin.close()
+                except OSError:
+                    pass
+                self._pipe_thread.join()
+                self._process.wait()
+
+        if self._process and exc_type is None:
+            if self._pipe_error is not None:
+                raise self._pipe_error
+            if self._process.returncode != 0:
+                raise Exception('pigz failed with exit code {}'.format(self._process.returncode))
+
+
+def write_archive(directory_path: str, arcname: str, archive_path: str, codec: str):
+    with open(archive_path, 'wb') as f:
+        with ArchiveWriter(f, codec) as writer:
+            writer.add(directory_path, arcname=arcname)
+
+
+def extract_archive(archive_path: str, destination: str):
+    """
+    Extracts an archive written by any codec (detected by its contents rather than its extension)
+    """
+    with open(archive_path, 'rb') as f:
+        magic = f.read(len(MAGIC_ZSTD))
+        f.seek(0)
+        if magic.startswith(MAGIC_ZSTD):
+            with zstandard.ZstdDecompressor().stream_reader(f) as reader:
+                with tarfile.open(fileobj=reader, mode='r|') as tar:
+                    tar.extractall(destination)
+        else:
+            # gzip or uncompressed
+            with tarfile.open(fileobj=f, mode='r:*') as tar:
+                tar.extractall(destination)
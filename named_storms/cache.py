@@ -0,0 +1,112 @@
+import uuid
+from typing import List, NamedTuple, Optional
+from django.conf import settings
+from django.core.cache import cache
+
+from named_storms.models import NamedStorm, NsemPsa, NsemPsaVariable
+
+# shared (redis) cache keys
+CACHE_KEY_PSA_CURRENT_GENERATION = 'psa-current-generation'
+CACHE_KEY_PSA_CURRENT = 'psa-current:{generation}:{storm_id}'
+CACHE_KEY_PSA_PROCESSED = 'psa-processed:{generation}'
+
+# stored in the shared cache when a storm doesn't have a valid psa so misses don't keep hitting the database
+PSA_CURRENT_MISSING = 'missing'
+
+
+class PsaCurrent(NamedTuple):
+    storm: NamedStorm
+    nsem: NsemPsa
+    variables: List[NsemPsaVariable]
+
+    def get_variable(self, name: str) -> Optional[NsemPsaVariable]:
+        return next((v for v in self.variables if v.name == name), None)
+
+    def get_variable_names(self) -> List[str]:
+        return [v.name for v in self.variables]
+
+
+# per-process cache of storm id -> (generation, PsaCurrent)
+_psa_current_local = {}
+
+# per-process cache of (generation, processed psa ids)
+_psa_processed_local = {}
+
+
+def _get_psa_current_generation() -> str:
+    generation = cache.get(CACHE_KEY_PSA_CURRENT_GENERATION)
+    if generation is None:
+        generation = uuid.uuid4().hex
+        # another process may have created it in the meantime so only add it if it's still absent
+        if not cache.add(CACHE_KEY_PSA_CURRENT_GENERATION, generation, timeout=None):
+            generation = cache.get(CACHE_KEY_PSA_CURRENT_GENERATION, generation)
+    return generation
+
+
+def _build_psa_current(storm_id: int) -> Optional[PsaCurrent]:
+    storm = NamedStorm.objects.filter(id=storm_id).first()
+    if not storm:
+        return None
+    nsem = NsemPsa.get_last_valid_psa(storm_id=storm_id)
+    if not nsem:
+        return None
+    # populate the relation up front so it travels with the cached psa
+    nsem.named_storm = storm
+    return PsaCurrent(storm=storm, nsem=nsem, variables=list(nsem.nsempsavariable_set.all()))
+
+
+def get_psa_current(storm_id: int) -> Optional[PsaCurrent]:
+    """
+    Returns the storm, its most recent valid psa and the psa's variables.
+    The result is cached per-process and in the shared cache and both are invalidated
+    through a new "generation" whenever a psa's validity changes (see named_storms.signals).
+    """
+    storm_id = int(storm_id)
+    generation = _get_psa_current_generation()
+
+    # per-process cache
+    local = _psa_current_local.get(storm_id)
+    if local and local[0] == generation:
+        return local[1]
+
+    # shared cache
+    cache_key = CACHE_KEY_PSA_CURRENT.format(generation=generation, storm_id=storm_id)
+    psa_current = cache.get(cache_key)
+    if psa_current is None:
+        psa_current = _build_psa_current(storm_id) or PSA_CURRENT_MISSING
+        cache.set(cache_key, psa_current, timeout=settings.CWWED_CACHE_PSA_CURRENT_SECONDS)
+
+    psa_current = psa_current if psa_current != PSA_CURRENT_MISSING else None
+    _psa_current_local[storm_id] = (generation, psa_current)
+
+    return psa_current
+
+
+def is_psa_processed(nsem_id: int) -> bool:
+    """
+    Whether a psa has been processed, using the ids of all processed psas which are cached for the current generation.
+    Processing a psa always starts a new generation so this is never stale.
+    """
+    generation = _get_psa_current_generation()
+
+    # per-process cache
+    local = _psa_processed_local.get('ids')
+    if not local or local[0] != generation:
+        # shared cache
+        cache_key = CACHE_KEY_PSA_PROCESSED.format(generation=generation)
+        processed_ids = cache.get(cache_key)
+        if processed_ids is None:
+            processed_ids = set(NsemPsa.objects.filter(processed=True).values_list('id', flat=True))
+            cache.set(cache_key, processed_ids, timeout=settings.CWWED_CACHE_PSA_CURRENT_SECONDS)
+        local = _psa_processed_local['ids'] = (generation, processed_ids)
+
+    return nsem_id in local[1]
+
+
+def invalidate_psa_current():
+    """
+    Starts a new generation which makes every process ignore its previously cached values
+    """
+    _psa_current_local.clear()
+    _psa_processed_local.clear()
+    cache.set(CACHE_KEY_PSA_CURRENT_GENERATION, uuid.uuid4().hex, timeout=None)
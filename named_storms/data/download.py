@@ -0,0 +1,230 @@
+import os
+import json
+import time
+import ftplib
+import hashlib
+import logging
+from typing import NamedTuple, Optional
+from urllib.parse import urlparse
+import requests
+from django.conf import settings
+from named_storms.data.http import pooled_session
+
+logger = logging.getLogger('cwwed')
+
+HTTP_TIMEOUT = (10, 60)  # (connect, read) seconds
+FTP_TIMEOUT = 60
+
+# pooled keep-alive sessions reused by every download in the process (keyed by ssl verification)
+_sessions = {}
+
+
+class DownloadError(Exception):
+    pass
+
+
+class DownloadResult(NamedTuple):
+    path: str
+    bytes: int  # total size of the file
+    bytes_downloaded: int  # bytes transferred during this download (excludes resumed bytes)
+    seconds: float
+
+    @property
+    def bytes_per_second(self) -> float:
+        return self.bytes_downloaded / self.seconds if self.seconds else 0
+
+
+def shared_session(verify=True) -> requests.Session:
+    if verify not in _sessions:
+        _sessions[verify] = pooled_session(verify=verify)
+    return _sessions[verify]
+
+
+def download(url: str, path: str, verify=True, checksum: str = None, attempts: int = None) -> DownloadResult:
+    """
+    Downloads a url (http or ftp) to a path.
+    An existing partial file at the path is resumed (i.e from a dropped connection or a previous task attempt)
+    as long as the remote file hasn't changed since (http partial files are resumed using their ETag/Last-Modified)
+    and the download resumes again after any failures until the attempts are exhausted.
+    :param url: url to download
+    :param path: path to write to
+    :param verify: whether to verify ssl
+    :param checksum: optional checksum to verify in the format "algorithm:hex digest", i.e "md5:d41d8cd98f00b204e9800998ecf8427e"
+    :param attempts: number of attempts
+    """
+    attempts = attempts or settings.CWWED_DOWNLOAD_ATTEMPTS
+    downloader = _download_ftp if urlparse(url).scheme == 'ftp' else _download_http
+
+    started = time.time()
+    offset = os.path.getsize(path) if os.path.exists(path) else 0
+    for attempt in range(1, attempts + 1):
+        try:
+            downloader(url, path, verify)
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout, requests.exceptions.ChunkedEncodingError,
+                ftplib.Error, OSError, DownloadError) as e:
+            # continue where we left off
+            if attempt == attempts:
+                raise
+            logger.warning('Retrying download ({} of {}) of {}: {}'.format(attempt, attempts, url, e))
+            time.sleep(attempt)
+        else:
+            break
+
+    if checksum:
+        _verify_checksum(path, checksum)
+
+    result = DownloadResult(
+        path=path,
+        bytes=os.path.getsize(path),
+        bytes_downloaded=max(os.path.getsize(path) - offset, 0),
+        seconds=time.time() - started,
+    )
+    logger.info('Downloaded {} ({} bytes at {:.0f} bytes/sec)'.format(url, result.bytes, result.bytes_per_second))
+    return result
+
+
+def _download_http(url: str, path: str, verify: bool):
+    offset = os.path.getsize(path) if os.path.exists(path) else 0
+    validator = _read_validator(path, url) if offset else None
+
+    # ranges are in bytes of the encoded representation so request the file as is
+    headers = {'Accept-Encoding': 'identity'}
+
+    # only resume when the partial file's version is known so bytes from two versions are never spliced together
+    if offset and validator:
+        headers.update({'Range': 'bytes={}-'.format(offset), 'If-Range': validator})
+    else:
+        offset = 0
+
+    with shared_session(verify).get(url, headers=headers, stream=True, timeout=HTTP_TIMEOUT) as response:
+
+        # the partial file may already be complete
+        if offset and response.status_code == requests.codes.requested_range_not_satisfiable:
+            _verify_partial_size(url, path, verify, response)
+            _remove_validator(path)
+            return
+
+        response.raise_for_status()
+
+        # the server doesn't support ranges or the file has changed so start over
+        if response.status_code != requests.codes.partial_content:
+            offset = 0
+
+        content_length = response.headers.get('Content-Length')
+        expected_size = offset + int(content_length) if content_length is not None and not response.headers.get('Content-Encoding') else None
+
+        # record the version being downloaded so a dropped connection resumes the same version
+        # (unless the server encoded it anyway since the decoded bytes written don't line up with its ranges)
+        if not offset:
+            if response.headers.get('Content-Encoding'):
+                _remove_validator(path)
+            else:
+                _write_validator(path, url, response)
+
+        with open(path, 'ab' if offset else 'wb') as f:
+            for chunk in response.iter_content(chunk_size=settings.CWWED_DOWNLOAD_CHUNK_SIZE):
+                f.write(chunk)
+
+    _verify_size(url, path, expected_size)
+    _remove_validator(path)
+
+
+def _verify_partial_size(url: str, path: str, verify: bool, response: requests.Response):
+    """
+    Verifies a partial file the server considers complete against the total size from the Content-Range (i.e "bytes */1234")
+    or a HEAD request and removes it if it doesn't match (or can't be verified) so the next attempt starts over
+    """
+    content_range = response.headers.get('Content-Range', '')
+    total = content_range.rsplit('/', 1)[-1] if content_range.startswith('bytes') else None
+    if total is None or not total.isdigit():
+        head = shared_session(verify).head(url, allow_redirects=True, timeout=HTTP_TIMEOUT)
+        head.raise_for_status()
+        total = head.headers.get('Content-Length') if not head.headers.get('Content-Encoding') else None
+
+    try:
+        if total is None:
+            raise DownloadError('Unable to verify the size of {}'.format(url))
+        _verify_size(url, path, int(total))
+    except DownloadError:
+        os.remove(path)
+        _remove_validator(path)
+        raise
+
+
+def _validator_path(path: str) -> str:
+    return '{}.json'.format(path)
+
+
+def _read_validator(path: str, url: str) -> Optional[str]:
+    """
+    :return: the ETag or Last-Modified value of the url's version being downloaded to the path
+    """
+    try:
+        with open(_validator_path(path)) as f:
+            metadata = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return metadata.get('validator') if metadata.get('url') == url else None
+
+
+def _write_validator(path: str, url: str, response: requests.Response):
+    etag = response.headers.get('ETag')
+    # weak etags can't be used with If-Range
+    validator = etag if etag and not etag.startswith('W/') else response.headers.get('Last-Modified')
+    if validator:
+        with open(_validator_path(path), 'w') as f:
+            json.dump({'url': url, 'validator': validator}, f)
+    else:
+        _remove_validator(path)
+
+
+def _remove_validator(path: str):
+    if os.path.exists(_validator_path(path)):
+        os.remove(_validator_path(path))
+
+
+def _download_ftp(url: str, path: str, verify: bool):
+    url_parsed = urlparse(url)
+    offset = os.path.getsize(path) if os.path.exists(path) else 0
+
+    ftp = ftplib.FTP(url_parsed.hostname, timeout=FTP_TIMEOUT)
+    try:
+        ftp.login()
+        ftp.voidcmd('TYPE I')  # binary mode is required for SIZE
+        try:
+            expected_size = ftp.size(url_parsed.path)
+        except ftplib.error_perm:
+            expected_size = None
+
+        # the remote file shrank since the partial download (i.e it was replaced) so start over
+        if expected_size is not None and offset > expected_size:
+            logger.warning('Restarting download of {} since it is smaller than the partial download'.format(url))
+            os.remove(path)
+            offset = 0
+
+        if expected_size is None or offset < expected_size or not os.path.exists(path):
+            with open(path, 'ab' if offset else 'wb') as f:
+                ftp.retrbinary('RETR {}'.format(url_parsed.path), f.write, blocksize=settings.CWWED_DOWNLOAD_CHUNK_SIZE, rest=offset or None)
+    finally:
+        ftp.close()
+
+    _verify_size(url, path, expected_size)
+
+
+def _verify_size(url: str, path: str, expected_size: Optional[int]):
+    size = os.path.getsize(path)
+    if expected_size is not None and size != expected_size:
+        raise DownloadError('Incomplete download of {}: {} of {} bytes'.format(url, size, expected_size))
+
+
+def _verify_checksum(path: str, checksum: str):
+    algorithm, expected = checksum.split(':', 1)
+    digest = hashlib.new(algorithm)
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(settings.CWWED_DOWNLOAD_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    if digest.hexdigest().lower() != expected.lower():
+        # remove the corrupt file so it isn't resumed
+        os.remove(path)
+        _remove_validator(path)
+        raise DownloadError('Checksum mismatch for {}'.format(path))
@@ -4,24 +4,23 @@ import re
 import tempfile
 
 from stormevents.usgs.events import USGS_Event
-import celery
 import pandas as pd
 import pytz
 import requests
 from ftplib import FTP
 from functools import cmp_to_key
 from datetime import datetime, timedelta
-from django.utils.dateparse import parse_date
-from django.contrib.gis.geos import Point
 from lxml import etree
-from typing import List
-from io import BytesIO
+from typing import List, Optional
 from urllib import parse
 from named_storms.data.decorators import register_factory
-from named_storms import tasks
-from named_storms.data.processors import ProcessorData
+from named_storms.data import thredds
+from named_storms.data.http import pooled_session, concurrent_map
+from named_storms.data.processors import ProcessorData, GenericFileProcessor
+from named_storms.data.stations import NDBCStationRegistry, CoopsStationRegistry
 from named_storms import models as storm_models
-from named_storms.models import CoveredDataProvider, NamedStorm, NamedStormCoveredData, PROCESSOR_DATA_SOURCE_FILE_TEMPORARY
+from named_storms.models import (
+    CoveredDataProvider, NamedStorm, NamedStormCoveredData, PROCESSOR_DATA_SOURCE_FILE_TEMPORARY, PROCESSOR_DATA_SOURCE_FILE_GENERIC)
 from named_storms.utils import named_storm_covered_data_tmp_path
 
 
@@ -230,17 +229,13 @@ class USGSProcessorFactory(ProcessorCoreFactory):
 
 class THREDDSCatalogBaseFactory(ProcessorCoreFactory):
 
-    namespaces = {
-        'catalog': 'http://www.unidata.ucar.edu/namespaces/thredds/InvCatalog/v1.0',
-        'xlink': 'http://www.w3.org/1999/xlink',
-    }
+    namespaces = thredds.NAMESPACES
 
     def _catalog_ref_title(self, catalog_ref: etree.Element) -> str:
         """
         :return: title value for a particular catalogRef element
         """
-        title_key = '{{{}}}title'.format(self.namespaces['xlink'])
-        return catalog_ref.get(title_key)
+        return thredds.catalog_ref_title(catalog_ref)
 
     def _catalog_ref_href(self, catalog_ref: etree.Element) -> str:
         """
@@ -254,33 +249,27 @@ class THREDDSCatalogBaseFactory(ProcessorCoreFactory):
             parse.urlparse(catalog_path).path,
         )
 
-    def _is_using_dataset(self, dataset: str) -> bool:
-        return True
-
-    def _catalog_ref_elements(self, catalog_url: str) -> List[etree.ElementTree]:
+    def _catalog_ref_url(self, catalog_ref: etree.Element) -> str:
         """
-        Fetches a catalog and returns all catalogRef elements from a catalog url
+        :return: absolute catalog url for a particular catalogRef element
         """
+        return self._catalog_ref_href(catalog_ref)
 
-        # fetch and parse the main catalog
-        catalog_response = requests.get(catalog_url, verify=self._verify_ssl, timeout=30)
-        catalog_response.raise_for_status()
-        catalog = etree.parse(BytesIO(catalog_response.content))
-
-        # return all catalogRef elements
-        return catalog.xpath('//catalog:catalogRef', namespaces=self.namespaces)
+    def _is_using_dataset(self, dataset: str) -> bool:
+        return True
 
-    def _catalog_documents(self, catalog_urls) -> List[etree.ElementTree]:
+    def _crawl_datasets(self, level_filters: List[Optional[thredds.LevelFilter]], dataset_filter: thredds.DatasetFilter = None) -> List[etree.Element]:
         """
-        Fetches the catalog urls in parallel via tasks.
-        :param catalog_urls: list of catalog urls
-        :return: list of lxml catalog elements
+        Crawls the provider's catalog level by level and returns the relevant dataset elements
         """
-        task_group = celery.group([tasks.fetch_url_task.s(url, self._verify_ssl) for url in catalog_urls])
-        task_promise = task_group()
-        catalogs = task_promise.get()
-        catalogs = [etree.parse(BytesIO(s.encode())) for s in catalogs]
-        return catalogs
+        crawler = thredds.THREDDSCatalogCrawler(
+            self._provider.url,
+            catalog_ref_url=self._catalog_ref_url,
+            level_filters=level_filters,
+            dataset_filter=dataset_filter,
+            verify=self._verify_ssl,
+        )
+        return crawler.datasets()
 
 
 class JPLProcessorBaseFactory(THREDDSCatalogBaseFactory):
@@ -305,68 +294,32 @@ class JPLProcessorBaseFactory(THREDDSCatalogBaseFactory):
             )
         )
 
-    def _filter_catalog_refs_by_year(self, catalog_refs: etree.ElementTree) -> List[etree.ElementTree]:
+    def _is_using_year(self, title: str, parents: List[str]) -> bool:
         """
-        Filters a list of top level (i.e titled by "year") catalogRef's
+        Filters the top level catalogRef's which are titled by "year", i.e "2018"
         """
-        results = []
-        for ref in catalog_refs:
-            # the "title" will be the year, i.e "2018"
-            year = int(self._catalog_ref_title(ref))
-            if year in [self._named_storm_covered_data.date_start.year, self._named_storm_covered_data.date_end.year]:
-                results.append(ref)
-        return results
+        return int(title) in [self._named_storm_covered_data.date_start.year, self._named_storm_covered_data.date_end.year]
 
-    def _filter_catalog_refs_by_day(self, year: int, catalog_refs: etree.ElementTree) -> List[etree.ElementTree]:
+    def _is_using_day(self, title: str, parents: List[str]) -> bool:
         """
-        Filters a list of 2nd level catalogRef's, titled by "day of year" (i.e "123" is the 123rd day of the year)
-        :param year YYYY
+        Filters the 2nd level catalogRef's which are titled by "day of year" (i.e "123" is the 123rd day of the year)
+        :param parents: titles of the parent catalogRef's, i.e the year
         """
-        results = []
-        year_start_date = datetime(year, 1, 1).replace(tzinfo=pytz.utc)
-        for ref in catalog_refs:
-            # the "title" will be the day of the year, i.e "123"
-            day_of_year = int(self._catalog_ref_title(ref))
-            data_days_since_year_start_date = (self._named_storm_covered_data.date_start - year_start_date).days + 1
-            data_days_since_year_end_date = (self._named_storm_covered_data.date_end - year_start_date).days + 1
-            if data_days_since_year_end_date >= day_of_year >= data_days_since_year_start_date:
-                results.append(ref)
-        return results
+        day_of_year = int(title)
+        year_start_date = datetime(int(parents[0]), 1, 1).replace(tzinfo=pytz.utc)
+        data_days_since_year_start_date = (self._named_storm_covered_data.date_start - year_start_date).days + 1
+        data_days_since_year_end_date = (self._named_storm_covered_data.date_end - year_start_date).days + 1
+        return data_days_since_year_end_date >= day_of_year >= data_days_since_year_start_date
 
     def _processors_data(self) -> List[ProcessorData]:
-        dataset_paths = []
         processors_data = []
 
-        # fetch and build first level catalog refs (i.e designated by year)
-        catalog_ref_elements_year = self._catalog_ref_elements(self._provider.url)
-        catalog_ref_elements_year = self._filter_catalog_refs_by_year(catalog_ref_elements_year)
-
-        # fetch and build second level catalogs (i.e for day of the year)
-        catalog_refs = []
-        for ref_year in catalog_ref_elements_year:
-            year = int(self._catalog_ref_title(ref_year))
-            url = self._catalog_ref_url(ref_year)
-
-            catalog_documents_day = self._catalog_documents([url])
-
-            catalog_ref_elements_day = []
-            for catalog in catalog_documents_day:
-                catalog_ref_elements_day += catalog.xpath('//catalog:catalogRef', namespaces=self.namespaces)
-            catalog_ref_elements_day = self._filter_catalog_refs_by_day(year, catalog_ref_elements_day)
-
-            catalog_refs += catalog_ref_elements_day
-
-        # build a list of actual URLs for each yearly catalog
-        catalog_ref_urls_day = []
-        for ref in catalog_refs:
-            catalog_ref_urls_day.append(self._catalog_ref_url(ref))
-
-        # build a list of relevant datasets for each catalog
-        catalog_documents = self._catalog_documents(catalog_ref_urls_day)
-        for catalog_document in catalog_documents:
-            for dataset in catalog_document.xpath('//catalog:dataset', namespaces=self.namespaces):
-                if self._is_using_dataset(dataset.get('name')):
-                    dataset_paths.append(dataset.get('ID'))
+        # crawl the year and day of year catalogs for the relevant datasets
+        datasets = self._crawl_datasets(
+            level_filters=[self._is_using_year, self._is_using_day],
+            dataset_filter=lambda dataset, parents: self._is_using_dataset(dataset.get('name')),
+        )
+        dataset_paths = [dataset.get('ID') for dataset in datasets]
 
         # build a list of processors for all the relevant datasets
         for dataset_path in dataset_paths:
@@ -461,7 +414,6 @@ class NDBCProcessorFactory(THREDDSCatalogBaseFactory):
         - "Real-time" data is in the format "20cm4h9999.nc"
     NOTE: NDBC's SSL certs aren't validating, so let's just not verify.
     """
-    API_STATION_METADATA_URL = 'https://www.ndbc.noaa.gov/metadata/stationmetadata.xml'
     RE_PATTERN = re.compile(r'^(?P<station>\w{5})\w(?P<year>\d{4})\.nc$')
     # number of days "real-time" data is stored separately from the timestamped files
     REALTIME_DAYS = 45
@@ -473,45 +425,14 @@ class NDBCProcessorFactory(THREDDSCatalogBaseFactory):
     def _processors_data(self) -> List[ProcessorData]:
         dataset_paths = []
 
-        # TODO - should use historical data, like https://www.ndbc.noaa.gov/view_text_file.php?filename=pclf1h2021.txt.gz&dir=data/historical/stdmet/
-        df_station_heights = pd.read_fwf(
-            'https://www.ndbc.noaa.gov/data/stations/non_ndbc_heights.txt',
-            skiprows=6,
-            header=0,
-            names=['id', 'Site Height', 'ATMP Height', 'Anemometer Height', 'Tide Ref', 'Barometer Height', 'WTMP Height', 'Water Depth', 'Watch Circle']
-        ).set_index('id')
-        df_station_heights['Unit Heights'] = 'meters'
-
-        # collection station's metadata
-        request = requests.get('https://www.ndbc.noaa.gov/metadata/stationmetadata.xml', timeout=30)
-        root = etree.fromstring(request.content)
-        stations = []
-        for station in root.xpath('//station'):
-            for history in station.findall('history'):
-                station_point = Point(x=float(history.get('lng')), y=float(history.get('lat')))
-                date_start = parse_date(history.get('start') or '')
-                date_end = parse_date(history.get('end') or '')
-                valid_station = (
-                        self._named_storm.geo.contains(station_point) and  # valid geo
-                        date_start and self._named_storm.date_start.date() >= date_start and  # valid start date
-                        (date_end is None or self._named_storm.date_end.date() <= date_end)  # valid end date
-                )
-                if valid_station:
-                    stations.append({
-                        'id': station.get('id').lower(),
-                        'name': station.get('name'),
-                        'lat': history.get('lat'),
-                        'lng': history.get('lng'),
-                        'elevation': history.get('elev'),
-                        'date_start': date_start.isoformat(),
-                        'date_end': date_end.isoformat() if date_end else None,
-                    })
-                    break
+        # query the shared station registry for stations within the storm's geo which were active during the storm
+        df_stations = NDBCStationRegistry().query(self._named_storm.geo, self._named_storm.date_start, self._named_storm.date_end)
+        df_stations = df_stations.set_index('id')
+        df_stations['date_start'] = df_stations['date_start'].dt.strftime('%Y-%m-%d')
+        df_stations['date_end'] = df_stations['date_end'].dt.strftime('%Y-%m-%d')
 
         # write valid stations as csv
         temp_path = tempfile.mktemp(dir=named_storm_covered_data_tmp_path(self._named_storm))
-        df_stations = pd.DataFrame.from_records(stations).set_index('id')
-        df_stations = df_stations.join(df_station_heights)
         df_stations.to_csv(temp_path)
         processors_data = [
             ProcessorData(
@@ -524,22 +445,14 @@ class NDBCProcessorFactory(THREDDSCatalogBaseFactory):
             )
         ]
 
-        # build catalogRefs and filter
-        catalog_refs = self._catalog_ref_elements(self._provider.url)
-
-        # build list of catalog urls
-        catalog_urls = [self._catalog_ref_href(ref) for ref in catalog_refs]
-
-        # build a list of relevant datasets for each station
-        catalogs = self._catalog_documents(catalog_urls)
-        for station in catalogs:
-            for dataset in station.xpath('//catalog:dataset', namespaces=self.namespaces):
-                station_name = dataset.get('name').lower()[:5]  # stations are in the format of SSSSShYYYY.nc so use the first 5 characters
-                if station_name not in df_stations.index:
-                    logging.warning('Skipping invalid dataset {}'.format(dataset.get('name')))
-                    continue
-                if self._is_using_dataset(dataset.get('name')):
-                    dataset_paths.append(dataset.get('urlPath'))
+        # crawl every station's catalog and build a list of relevant datasets
+        for dataset in self._crawl_datasets(level_filters=[None]):
+            station_name = dataset.get('name').lower()[:5]  # stations are in the format of SSSSShYYYY.nc so use the first 5 characters
+            if station_name not in df_stations.index:
+                logging.warning('Skipping invalid dataset {}'.format(dataset.get('name')))
+                continue
+            if self._is_using_dataset(dataset.get('name')):
+                dataset_paths.append(dataset.get('urlPath'))
 
         # build a list of processors for all the relevant datasets
         for dataset_path in dataset_paths:
@@ -610,7 +523,6 @@ class TidesAndCurrentsProcessorFactory(ProcessorCoreFactory):
             format=xml
     Datum options: https://tidesandcurrents.noaa.gov/datum_options.html
     """
-    API_STATIONS_URL_JSON = 'https://api.tidesandcurrents.noaa.gov/mdapi/prod/webapi/stations.json'
     API_STATIONS_URL_XML = 'https://api.tidesandcurrents.noaa.gov/mdapi/prod/webapi/stations.xml'
     API_DATA_URL = 'https://tidesandcurrents.noaa.gov/api/datagetter'
     # datums required for water level product
@@ -634,17 +546,23 @@ class TidesAndCurrentsProcessorFactory(ProcessorCoreFactory):
         PRODUCT_METEOROLOGICAL_WIND,
     ]
 
-    def _processors_data(self) -> List[ProcessorData]:
+    # units of each product - we know it's one of the following because we specified "english" in the data query param "units"
+    PRODUCT_UNITS = {
+        PRODUCT_METEOROLOGICAL_WIND[0]: 'knots',
+        PRODUCT_METEOROLOGICAL_AIR_TEMPERATURE[0]: 'fahrenheit',
+        PRODUCT_METEOROLOGICAL_AIR_PRESSURE[0]: 'mb',
+        PRODUCT_WATER_LEVEL[0]: 'feet',
+    }
+    # station metadata mapped via (item name, item key)
+    STATION_ITEMS = [('sensors', 'sensors'), ('datums', 'datums'), ('supersededdatums', 'datums')]
 
-        # fetch and parse the station listings
-        stations_response = requests.get(self.API_STATIONS_URL_JSON, timeout=30)
-        stations_response.raise_for_status()
-        stations_json = stations_response.json()
-        stations = stations_json['stations']
+    def _processors_data(self) -> List[ProcessorData]:
+        session = pooled_session()
+        station_registry = CoopsStationRegistry()
 
         # first save all stations' metadata as csv
         temp_path = tempfile.mktemp(dir=named_storm_covered_data_tmp_path(self._named_storm))
-        pd.DataFrame.from_records(stations).to_csv(temp_path)
+        pd.DataFrame.from_records(station_registry.records(station_registry.stations())).to_csv(temp_path)
         processors_data = [
             ProcessorData(
                 named_storm_id=self._named_storm.id,
@@ -655,26 +573,19 @@ class TidesAndCurrentsProcessorFactory(ProcessorCoreFactory):
                 label='stations.csv',
             )]
 
-        # build a list of stations to collect data
-        for station in stations:
+        # query the shared station registry for stations within our covered data's geo
+        stations = station_registry.records(station_registry.query(self._named_storm_covered_data.geo))
 
-            lat = station['lat']
-            lng = station['lng']
-            station_point = Point(x=lng, y=lat)
+        # fetch every station's metadata and products concurrently
+        stations_metadata = concurrent_map(lambda station: self._station_metadata(session, station), stations)
 
-            # skip this station if it's outside our covered data's geo
-            if not self._named_storm_covered_data.geo.contains(station_point):
-                continue
+        # build a list of stations to collect data
+        for station, station_metadata in zip(stations, stations_metadata):
 
-            for item_name, item_key in [('sensors', 'sensors'), ('datums', 'datums'), ('supersededdatums', 'datums')]:
-                if item_name not in station:
-                    logging.warning('item name {} not found in station {}'.format(item_key, station['id']))
-                    continue
-                item_response = requests.get(station[item_name]['self'], timeout=30)
-                if not item_response.ok:
-                    logging.warning('skipping bad response from {}'.format(station[item_key]))
+            for item_name, item_key in self.STATION_ITEMS:
+                station_item_data = station_metadata.get(item_name)
+                if station_item_data is None:
                     continue
-                station_item_data = item_response.json()
                 if not station_item_data.get(item_key):
                     logging.warning('skipping absent items: name={name}, key={key}, station={station}'.format(
                         name=item_name, key=item_key, station=station['id']))
@@ -699,11 +610,9 @@ class TidesAndCurrentsProcessorFactory(ProcessorCoreFactory):
                 ))
 
             # get a list of products this station offers
-            products_request = requests.get(station['products']['self'], timeout=30)
-            if products_request.ok:
-                station_products = [p['name'] for p in products_request.json()['products']]
-            else:
+            if station_metadata.get('products') is None:
                 continue
+            station_products = [p['name'] for p in station_metadata['products']['products']]
 
             # build a list for each product that's available
             for product in self.PRODUCTS:
@@ -729,10 +638,9 @@ class TidesAndCurrentsProcessorFactory(ProcessorCoreFactory):
                 if product[0] == self.PRODUCT_WATER_LEVEL[0]:
 
                     # get this product's datums
-                    datum_request = requests.get(station['datums']['self'], timeout=30)
-                    if not datum_request.ok:
+                    if station_metadata.get('datums') is None:
                         continue
-                    product_datums = [d['name'] for d in datum_request.json()['datums']]
+                    product_datums = [d['name'] for d in station_metadata['datums']['datums']]
 
                     # query product for each datum
                     queries = []
@@ -760,48 +668,48 @@ class TidesAndCurrentsProcessorFactory(ProcessorCoreFactory):
                     ]
 
                 #
-                # add to processors
+                # add to processors, which download the products in parallel tasks
                 #
 
                 for query in queries:
-
-                    url = '{}?{}'.format(self.API_DATA_URL, parse.urlencode(query['args']))
-                    # convert to csv and save as temporary file
-                    try:
-                        df = pd.read_csv(url)
-                    except Exception as e:
-                        logging.exception(e)
-                        logging.warning('skipping bad data request for station {}'.format(station['id']))
-                        continue
-                    # generate temporary path
-                    temp_path = tempfile.mktemp(dir=named_storm_covered_data_tmp_path(self._named_storm))
-
-                    # add units - we know it's one of the following because we specified "english" in the data query param "units"
-                    if product == self.PRODUCT_METEOROLOGICAL_WIND:
-                        df['Units'] = 'knots'
-                    elif product == self.PRODUCT_METEOROLOGICAL_AIR_TEMPERATURE:
-                        df['Units'] = 'fahrenheit'
-                    elif product == self.PRODUCT_METEOROLOGICAL_AIR_PRESSURE:
-                        df['Units'] = 'mb'
-                    elif product == self.PRODUCT_WATER_LEVEL:
-                        df['Units'] = 'feet'
-
-                    # save to temp path as csv
-                    df.to_csv(temp_path)
-
+                    kwargs = self._processor_kwargs()
+                    kwargs.update({
+                        GenericFileProcessor.CSV_COLUMNS: {'Units': self.PRODUCT_UNITS[product[0]]},
+                    })
                     processors_data.append(ProcessorData(
                         named_storm_id=self._named_storm.id,
                         provider_id=self._provider.id,
-                        # override the processor to use a pre-collected temporary file
-                        override_provider_processor_class=PROCESSOR_DATA_SOURCE_FILE_TEMPORARY,
-                        url=temp_path,  # temporary file path
+                        override_provider_processor_class=PROCESSOR_DATA_SOURCE_FILE_GENERIC,
+                        url='{}?{}'.format(self.API_DATA_URL, parse.urlencode(query['args'])),
                         label=query['label'],
-                        kwargs=self._processor_kwargs(),
+                        kwargs=kwargs,
                         group=product[1],
                     ))
 
         return processors_data
 
+    def _station_metadata(self, session: requests.Session, station: dict) -> dict:
+        """
+        Fetches a station's metadata items and products
+        :return: dictionary of the json responses keyed by item name (missing items and failed requests are excluded)
+        """
+        metadata = {}
+        for item_name in [name for name, _ in self.STATION_ITEMS] + ['products']:
+            if item_name not in station:
+                logging.warning('item name {} not found in station {}'.format(item_name, station['id']))
+                continue
+            try:
+                item_response = session.get(station[item_name]['self'], timeout=30)
+            except requests.RequestException as e:
+                # one unreachable station shouldn't fail the whole provider
+                logging.warning('skipping failed request to {}: {}'.format(station[item_name]['self'], e))
+                continue
+            if not item_response.ok:
+                logging.warning('skipping bad response from {}'.format(station[item_name]['self']))
+                continue
+            metadata[item_name] = item_response.json()
+        return metadata
+
 
 @register_factory(storm_models.PROCESSOR_DATA_FACTORY_NWM)
 class NWMProcessorFactory(ProcessorCoreFactory):
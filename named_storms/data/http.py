@@ -0,0 +1,85 @@
+import os
+import json
+import hashlib
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Iterable, List
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from named_storms.utils import create_directory
+
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+
+def pooled_session(verify=True, host_concurrency: int = None) -> requests.Session:
+    """
+    Keep-alive session whose connections are pooled per host.
+    The pools block once they're exhausted which caps the number of concurrent requests to any single host.
+    """
+    host_concurrency = host_concurrency or settings.CWWED_COVERED_DATA_HTTP_HOST_CONCURRENCY
+    adapter = HTTPAdapter(
+        pool_maxsize=host_concurrency,
+        pool_block=True,
+        # return the last response once the status retries are exhausted so callers handle it like any other bad status
+        max_retries=Retry(total=3, backoff_factor=1, status_forcelist=RETRY_STATUSES, raise_on_status=False),
+    )
+    session = requests.Session()
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    session.verify = verify
+    return session
+
+
+def concurrent_map(fn: Callable, items: Iterable, max_workers: int = None) -> List:
+    """
+    Runs `fn` for every item concurrently (i.e for http requests) and returns the results in order
+    """
+    with ThreadPoolExecutor(max_workers=max_workers or settings.CWWED_COVERED_DATA_HTTP_CONCURRENCY) as executor:
+        return list(executor.map(fn, items))
+
+
+def fetch_cached(url: str, cache_dir: str, session: requests.Session = None) -> str:
+    """
+    Downloads a url into an on-disk cache and returns its path.
+    Conditional requests (ETag/If-Modified-Since) skip the download when the cached copy is still current.
+    """
+    path = os.path.join(cache_dir, hashlib.sha1(url.encode()).hexdigest())
+    metadata_path = '{}.json'.format(path)
+    session = session or pooled_session()
+
+    headers = {}
+    if os.path.exists(path) and os.path.exists(metadata_path):
+        with open(metadata_path) as f:
+            metadata = json.load(f)
+        if metadata.get('etag'):
+            headers['If-None-Match'] = metadata['etag']
+        if metadata.get('last_modified'):
+            headers['If-Modified-Since'] = metadata['last_modified']
+
+    response = session.get(url, headers=headers, timeout=30)
+
+    # unchanged
+    if response.status_code == requests.codes.not_modified:
+        return path
+
+    response.raise_for_status()
+
+    # write to temporary files and then replace the cached copies so concurrent readers never see partial files
+    create_directory(cache_dir)
+    _write_atomic(path, response.content)
+    _write_atomic(metadata_path, json.dumps({
+        'url': url,
+        'etag': response.headers.get('ETag'),
+        'last_modified': response.headers.get('Last-Modified'),
+    }).encode())
+
+    return path
+
+
+def _write_atomic(path: str, content: bytes):
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+    with os.fdopen(fd, 'wb') as f:
+        f.write(content)
+    os.replace(tmp_path, path)
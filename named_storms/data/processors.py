@@ -1,10 +1,9 @@
 import os
-import tempfile
 import shutil
+import hashlib
 import ssl
 import logging
 import pandas as pd
-from ftplib import FTP
 from urllib.parse import urlparse, ParseResult
 import h5py
 import numpy
@@ -12,7 +11,8 @@ from typing import List, NamedTuple
 import requests
 import xarray.backends
 from named_storms.models import CoveredDataProvider, NamedStorm, NamedStormCoveredData
-from named_storms.utils import named_storm_covered_data_incomplete_path, create_directory
+from named_storms.data.download import download, DownloadResult
+from named_storms.utils import named_storm_covered_data_incomplete_path, named_storm_covered_data_tmp_path, create_directory
 
 logger = logging.getLogger('cwwed')
 
@@ -190,6 +190,10 @@ class GenericFileProcessor(BaseProcessor):
     CONVERT_JSON_TO_CSV = 'convert_json_to_csv'
     CONVERT_XML_TO_CSV = 'convert_xml_to_csv'
     CONVERT_XML_XPATH = 'convert_xml_xpath'
+    CSV_COLUMNS = 'csv_columns'  # constant columns to add to a csv, i.e {"Units": "feet"}
+    CHECKSUM = 'checksum'  # optional checksum to verify, i.e "md5:d41d8cd98f00b204e9800998ecf8427e"
+
+    _download_result: DownloadResult = None
 
     def _pre_process(self, tmp_file: str):
         # conditionally convert json to csv
@@ -207,6 +211,11 @@ class GenericFileProcessor(BaseProcessor):
                 logger.exception(e)
             else:
                 df.to_csv(tmp_file, index=False)
+        elif self.CSV_COLUMNS in self._kwargs:
+            df = pd.read_csv(tmp_file)
+            for column, value in self._kwargs[self.CSV_COLUMNS].items():
+                df[column] = value
+            df.to_csv(tmp_file)
 
     def _post_process(self):
         pass
@@ -219,18 +228,25 @@ class GenericFileProcessor(BaseProcessor):
         return super()._get_file_extension()
 
     def _fetch(self):
-        if self._is_ftp():
-            self._fetch_ftp()
-        else:
-            self._fetch_http()
+        tmp_file = self._get_tmp_file()
+
+        # download (resuming any partial download from a previous attempt) to tmp space then move
+        self._download_result = download(self._url, tmp_file, verify=self._verify_ssl(), checksum=self._kwargs.get(self.CHECKSUM))
+
+        # run any pre process logic
+        self._pre_process(tmp_file)
+
+        self._move_tmp_file_to_complete(tmp_file)
 
         # run any post processing on the dataset
         self._post_process()
 
-    @staticmethod
-    def _get_tmp_file():
-        _, tmp_file = tempfile.mkstemp()
-        return tmp_file
+    def _get_tmp_file(self):
+        # a stable path in the storm's shared temporary directory so a retried task resumes the partial download
+        return os.path.join(
+            named_storm_covered_data_tmp_path(self._named_storm),
+            '{}.part'.format(hashlib.sha1(self._output_path.encode()).hexdigest()),
+        )
 
     def _move_tmp_file_to_complete(self, tmp_file):
         # set file permissions -rw-r--r-- (using octal literal notation)
@@ -238,35 +254,14 @@ class GenericFileProcessor(BaseProcessor):
 
         shutil.move(tmp_file, self._output_path)
 
-    def _is_ftp(self):
-        return self._url.startswith('ftp://')
-
-    def _fetch_ftp(self):
-        # connect, login and retrieve file
-        ftp = FTP(self._url_parsed.hostname)
-        ftp.login()
-        tmp_file = self._get_tmp_file()
-        ftp.retrbinary('RETR {}'.format(self._url_parsed.path), open(tmp_file, 'wb').write)
-
-        # run any pre process logic
-        self._pre_process(tmp_file)
-
-        self._move_tmp_file_to_complete(tmp_file)
-
-    def _fetch_http(self):
-        # fetch the actual file
-        file_req = requests.get(self._url, stream=True, timeout=30)
-
-        # write to tmp space then move
-        tmp_file = self._get_tmp_file()
-        with open(tmp_file, 'wb') as f:
-            for chunk in file_req.iter_content(chunk_size=1024):
-                f.write(chunk)
-
-        # run any pre process logic
-        self._pre_process(tmp_file)
-
-        self._move_tmp_file_to_complete(tmp_file)
+    def to_dict(self):
+        data = super().to_dict()
+        if self._download_result:
+            data.update({
+                'bytes': self._download_result.bytes,
+                'bytes_per_second': self._download_result.bytes_per_second,
+            })
+        return data
 
 
 class HierarchicalDataFormatProcessor(GenericFileProcessor):
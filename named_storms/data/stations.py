@@ -0,0 +1,186 @@
+import os
+import json
+import time
+import logging
+import tempfile
+from datetime import datetime
+from io import BytesIO
+from typing import List
+import numpy as np
+import pandas as pd
+from django.conf import settings
+from django.contrib.gis import geos
+from lxml import etree
+from shapely import vectorized, wkb
+from named_storms.data.http import pooled_session
+from named_storms.utils import create_directory
+
+logger = logging.getLogger('cwwed')
+
+
+class StationRegistry:
+    """
+    Station catalog which is downloaded at most once per ttl and stored in shared storage for every storm's collection.
+    The stations are sorted by longitude which serves as a spatial index when querying by a storm's geometry.
+    """
+    name = None  # type: str
+
+    # in-memory copies of the catalogs keyed by path and file modification time
+    _loaded = {}
+
+    def __init__(self, ttl_hours: float = None):
+        self.ttl_seconds = (ttl_hours or settings.CWWED_STATION_REGISTRY_HOURS) * 60 * 60
+
+    def _download(self) -> pd.DataFrame:
+        """
+        :return: stations with (at least) "lng" and "lat" columns
+        """
+        raise NotImplementedError
+
+    def path(self) -> str:
+        return os.path.join(settings.CWWED_DATA_DIR, settings.CWWED_STATION_REGISTRY_DIR_NAME, '{}.parquet'.format(self.name))
+
+    def is_stale(self) -> bool:
+        path = self.path()
+        return not os.path.exists(path) or time.time() - os.path.getmtime(path) > self.ttl_seconds
+
+    def refresh(self):
+        df = self._download()
+        df['lng'] = df['lng'].astype(float)
+        df['lat'] = df['lat'].astype(float)
+        df = df.sort_values('lng', kind='mergesort').reset_index(drop=True)
+
+        # write to a temporary file and then replace the catalog so concurrent readers never see a partial file
+        create_directory(os.path.dirname(self.path()))
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(self.path()))
+        os.close(fd)  # parquet opens the path itself
+        try:
+            df.to_parquet(tmp_path, index=False)
+            os.replace(tmp_path, self.path())
+        except Exception:
+            os.remove(tmp_path)
+            raise
+
+        logger.info('Refreshed {} station registry with {} stations'.format(self.name, len(df)))
+
+    def stations(self) -> pd.DataFrame:
+        """
+        :return: all stations, refreshing the catalog if it's stale
+        """
+        if self.is_stale():
+            self.refresh()
+        path = self.path()
+        modified = os.path.getmtime(path)
+        loaded = self._loaded.get(path)
+        if loaded is None or loaded[0] != modified:
+            loaded = self._loaded[path] = (modified, pd.read_parquet(path))
+        return loaded[1]
+
+    def query(self, geo: geos.GEOSGeometry, date_start: datetime = None, date_end: datetime = None) -> pd.DataFrame:
+        """
+        :return: stations within the geometry (and optionally active during the date range)
+        """
+        df = self.stations()
+
+        # narrow down to the geometry's extent using the longitude sorting and then the latitude
+        lng_min, lat_min, lng_max, lat_max = geo.extent
+        idx_start = np.searchsorted(df['lng'].values, lng_min, side='left')
+        idx_end = np.searchsorted(df['lng'].values, lng_max, side='right')
+        df = df.iloc[idx_start:idx_end]
+        df = df[(df['lat'] >= lat_min) & (df['lat'] <= lat_max)]
+
+        # test the remaining stations against the actual geometry all at once
+        df = df[vectorized.contains(wkb.loads(bytes(geo.wkb)), df['lng'].values, df['lat'].values)]
+
+        if date_start is not None and date_end is not None:
+            df = self._filter_dates(df, date_start, date_end)
+
+        return df
+
+    def _filter_dates(self, df: pd.DataFrame, date_start: datetime, date_end: datetime) -> pd.DataFrame:
+        return df
+
+
+class NDBCStationRegistry(StationRegistry):
+    """
+    NDBC station metadata with a row for every station's deployment history
+    https://www.ndbc.noaa.gov/docs/ndbc_web_data_guide.pdf
+    """
+    name = 'ndbc'
+
+    API_STATION_METADATA_URL = 'https://www.ndbc.noaa.gov/metadata/stationmetadata.xml'
+    API_STATION_HEIGHTS_URL = 'https://www.ndbc.noaa.gov/data/stations/non_ndbc_heights.txt'
+    STATION_HEIGHTS_COLUMNS = [
+        'id', 'Site Height', 'ATMP Height', 'Anemometer Height', 'Tide Ref', 'Barometer Height', 'WTMP Height', 'Water Depth', 'Watch Circle',
+    ]
+
+    def _download(self) -> pd.DataFrame:
+        session = pooled_session()
+
+        # TODO - should use historical data, like https://www.ndbc.noaa.gov/view_text_file.php?filename=pclf1h2021.txt.gz&dir=data/historical/stdmet/
+        heights_response = session.get(self.API_STATION_HEIGHTS_URL, timeout=30)
+        heights_response.raise_for_status()
+        df_station_heights = pd.read_fwf(
+            BytesIO(heights_response.content),
+            skiprows=6,
+            header=0,
+            names=self.STATION_HEIGHTS_COLUMNS,
+        ).set_index('id')
+        df_station_heights['Unit Heights'] = 'meters'
+
+        # collect each station's history
+        metadata_response = session.get(self.API_STATION_METADATA_URL, timeout=30)
+        metadata_response.raise_for_status()
+        root = etree.fromstring(metadata_response.content)
+        stations = []
+        for station in root.xpath('//station'):
+            for history in station.findall('history'):
+                stations.append({
+                    'id': station.get('id').lower(),
+                    'name': station.get('name'),
+                    'lat': history.get('lat'),
+                    'lng': history.get('lng'),
+                    'elevation': history.get('elev'),
+                    'date_start': history.get('start'),
+                    'date_end': history.get('end'),
+                })
+
+        df = pd.DataFrame.from_records(stations)
+        df['history'] = range(len(df))  # catalog order since the registry is re-sorted by longitude
+        df['date_start'] = pd.to_datetime(df['date_start'], errors='coerce')
+        df['date_end'] = pd.to_datetime(df['date_end'], errors='coerce')
+
+        return df.join(df_station_heights, on='id')
+
+    def _filter_dates(self, df: pd.DataFrame, date_start: datetime, date_end: datetime) -> pd.DataFrame:
+        date_start = pd.Timestamp(date_start.date())
+        date_end = pd.Timestamp(date_end.date())
+        df = df[
+            df['date_start'].notnull() & (df['date_start'] <= date_start) &  # valid start date
+            (df['date_end'].isnull() | (df['date_end'] >= date_end))  # valid end date
+        ]
+        # use the first valid history for each station
+        return df.sort_values('history').drop_duplicates('id', keep='first').drop(columns='history')
+
+
+class CoopsStationRegistry(StationRegistry):
+    """
+    NOAA CO-OPS (Tides and Currents) stations
+    https://api.tidesandcurrents.noaa.gov/mdapi/prod/webapi/stations.json
+    """
+    name = 'coops'
+
+    API_STATIONS_URL_JSON = 'https://api.tidesandcurrents.noaa.gov/mdapi/prod/webapi/stations.json'
+
+    def _download(self) -> pd.DataFrame:
+        response = pooled_session().get(self.API_STATIONS_URL_JSON, timeout=30)
+        response.raise_for_status()
+        return pd.DataFrame.from_records([
+            # store the complete station since it's nested (i.e links to its products, datums etc)
+            {'id': station['id'], 'lat': station['lat'], 'lng': station['lng'], 'record': json.dumps(station)}
+            for station in response.json()['stations']
+        ])
+
+    @staticmethod
+    def records(df: pd.DataFrame) -> List[dict]:
+        return [json.loads(record) for record in df['record']]
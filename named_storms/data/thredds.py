@@ -0,0 +1,74 @@
+from typing import Callable, List, Optional, Tuple
+from lxml import etree
+from named_storms.data.http import pooled_session, concurrent_map, fetch_cached
+from named_storms.utils import thredds_catalog_cache_path
+
+NAMESPACES = {
+    'catalog': 'http://www.unidata.ucar.edu/namespaces/thredds/InvCatalog/v1.0',
+    'xlink': 'http://www.w3.org/1999/xlink',
+}
+
+# (title, parent titles) -> whether to crawl the catalogRef
+LevelFilter = Callable[[str, List[str]], bool]
+# (dataset element, parent titles) -> whether to use the dataset
+DatasetFilter = Callable[[etree.Element, List[str]], bool]
+
+
+def catalog_ref_title(catalog_ref: etree.Element) -> str:
+    """
+    :return: title value for a particular catalogRef element
+    """
+    return catalog_ref.get('{{{}}}title'.format(NAMESPACES['xlink']))
+
+
+class THREDDSCatalogCrawler:
+    """
+    Crawls a THREDDS catalog breadth-first, fetching every catalog of a level concurrently.
+    Each level (i.e "year" then "day of year") filters which of its catalogRefs are crawled
+    and the datasets in the last level are filtered by the dataset predicate.
+    """
+
+    def __init__(self, catalog_url: str, catalog_ref_url: Callable[[etree.Element], str], level_filters: List[Optional[LevelFilter]],
+                 dataset_filter: DatasetFilter = None, verify=True, concurrency: int = None):
+        """
+        :param catalog_url: top level catalog url
+        :param catalog_ref_url: returns the absolute catalog url for a catalogRef element
+        :param level_filters: filter for each level of catalogRefs to crawl (None crawls every catalogRef)
+        :param dataset_filter: filter for the datasets (None uses every dataset)
+        :param verify: whether to verify ssl
+        :param concurrency: maximum number of catalogs fetched at once
+        """
+        self.catalog_url = catalog_url
+        self.catalog_ref_url = catalog_ref_url
+        self.level_filters = level_filters
+        self.dataset_filter = dataset_filter
+        self.concurrency = concurrency
+        self.session = pooled_session(verify=verify)
+
+    def datasets(self) -> List[etree.Element]:
+        # catalog urls to fetch paired with their parent catalogRef titles
+        catalogs = [(self.catalog_url, [])]  # type: List[Tuple[str, List[str]]]
+
+        for level_filter in self.level_filters:
+            next_catalogs = []
+            for (_, parents), catalog in zip(catalogs, self._fetch([url for url, _ in catalogs])):
+                for catalog_ref in catalog.xpath('//catalog:catalogRef', namespaces=NAMESPACES):
+                    title = catalog_ref_title(catalog_ref)
+                    if level_filter is None or level_filter(title, parents):
+                        next_catalogs.append((self.catalog_ref_url(catalog_ref), parents + [title]))
+            catalogs = next_catalogs
+
+        datasets = []
+        for (_, parents), catalog in zip(catalogs, self._fetch([url for url, _ in catalogs])):
+            for dataset in catalog.xpath('//catalog:dataset', namespaces=NAMESPACES):
+                if self.dataset_filter is None or self.dataset_filter(dataset, parents):
+                    datasets.append(dataset)
+        return datasets
+
+    def _fetch(self, catalog_urls: List[str]) -> List[etree.ElementTree]:
+        """
+        Fetches catalogs concurrently through the shared catalog cache
+        """
+        cache_path = thredds_catalog_cache_path()
+        paths = concurrent_map(lambda url: fetch_cached(url, cache_path, session=self.session), catalog_urls, max_workers=self.concurrency)
+        return [etree.parse(path) for path in paths]
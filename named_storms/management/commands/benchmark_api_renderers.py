@@ -0,0 +1,56 @@
+import json
+import timeit
+
+from django.core.management import BaseCommand
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIRequestFactory
+
+from cwwed.api.renderers import ORJSONRenderer
+from named_storms.api.viewsets import NamedStormViewSet, NsemPsaViewSet, CoveredDataViewSet, NsemPsaVariableViewSet
+from named_storms.models import NsemPsa
+
+
+class Command(BaseCommand):
+    help = 'Benchmark the JSON renderers against the heaviest API listing responses'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--iterations', type=int, default=50)
+        parser.add_argument('--limit', type=int, default=1000, help='page size for the listings')
+
+    def handle(self, *args, **options):
+        factory = APIRequestFactory()
+        params = {'limit': options['limit']}
+
+        listings = [
+            ('named storms', NamedStormViewSet.as_view({'get': 'list'}), {}),
+            ('covered data', CoveredDataViewSet.as_view({'get': 'list'}), {}),
+            ('psa', NsemPsaViewSet.as_view({'get': 'list'}), {}),
+            ('psa per storm', NsemPsaViewSet.as_view({'get': 'per_storm'}), {}),
+        ]
+        for storm_id in NsemPsa.objects.filter(processed=True).values_list('named_storm_id', flat=True).distinct():
+            listings.append(('psa variables (storm {})'.format(storm_id), NsemPsaVariableViewSet.as_view({'get': 'list'}), {'storm_id': storm_id}))
+
+        renderers = [
+            ('json', JSONRenderer()),
+            ('orjson', ORJSONRenderer()),
+        ]
+
+        for name, view, kwargs in listings:
+            response = view(factory.get('/', params), **kwargs)
+            data = response.data
+
+            # verify the renderers are interchangeable before timing them
+            rendered = [renderer.render(data) for _, renderer in renderers]
+            if len({json.dumps(json.loads(r), sort_keys=True) for r in rendered}) != 1:
+                self.stdout.write(self.style.WARNING('{}: renderer output differs'.format(name)))
+
+            timings = {}
+            for renderer_name, renderer in renderers:
+                timings[renderer_name] = min(timeit.repeat(lambda: renderer.render(data), number=options['iterations'], repeat=3)) / options['iterations']
+
+            self.stdout.write(self.style.SUCCESS('{name} ({size} bytes): {timings} ({speedup:.1f}x)'.format(
+                name=name,
+                size=len(rendered[0]),
+                timings=', '.join('{}={:.2f}ms'.format(k, v * 1000) for k, v in timings.items()),
+                speedup=timings['json'] / timings['orjson'] if timings['orjson'] else 0,
+            )))
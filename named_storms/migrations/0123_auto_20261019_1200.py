@@ -0,0 +1,17 @@
+# Generated by Django 3.1.3 on 2026-10-19 12:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('named_storms', '0122_auto_20220524_2127'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='nsempsadata',
+            index=models.Index(fields=['nsem_psa_variable', 'date', 'id'], name='named_storm_nsem_ps_a19452_idx'),
+        ),
+    ]
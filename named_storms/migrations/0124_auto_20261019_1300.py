@@ -0,0 +1,30 @@
+# Generated by Django 3.1.3 on 2026-10-19 13:00
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('named_storms', '0123_auto_20261019_1200'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='nsempsauserexport',
+            name='fingerprint',
+            field=models.CharField(blank=True, db_index=True, default='', help_text='identifies identical export requests', max_length=64),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='nsempsauserexport',
+            name='s3_key',
+            field=models.CharField(blank=True, help_text='object storage key of the exported archive', max_length=1500, null=True),
+        ),
+        migrations.AddField(
+            model_name='nsempsauserexport',
+            name='reused_from',
+            field=models.ForeignKey(blank=True, help_text='export whose results are reused', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='reused_by', to='named_storms.NsemPsaUserExport'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.1.3 on 2026-10-19 14:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('named_storms', '0124_auto_20261019_1300'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='nsempsauserexport',
+            name='format',
+            field=models.CharField(choices=[('netcdf', 'netcdf'), ('shapefile', 'shapefile'), ('geojson', 'geojson'), ('kml', 'kml'), ('csv', 'csv'), ('geoparquet', 'geoparquet'), ('flatgeobuf', 'flatgeobuf')], max_length=30),
+        ),
+    ]
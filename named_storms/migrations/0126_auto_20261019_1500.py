@@ -0,0 +1,43 @@
+# Generated by Django 3.1.3 on 2026-10-19 15:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('named_storms', '0125_auto_20261019_1400'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='nsempsauserexport',
+            name='date_started',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='nsempsauserexport',
+            name='phase',
+            field=models.CharField(blank=True, help_text='current phase while the export is created', max_length=20, null=True),
+        ),
+        migrations.AddField(
+            model_name='nsempsauserexport',
+            name='phase_timings',
+            field=models.JSONField(blank=True, default=dict, help_text='seconds spent in each phase'),
+        ),
+        migrations.AddField(
+            model_name='nsempsauserexport',
+            name='progress',
+            field=models.FloatField(default=0, help_text='percent complete'),
+        ),
+        migrations.AddField(
+            model_name='nsempsauserexport',
+            name='rows_processed',
+            field=models.BigIntegerField(default=0, help_text='number of values/features exported'),
+        ),
+        migrations.AddField(
+            model_name='nsempsauserexport',
+            name='bytes_written',
+            field=models.BigIntegerField(default=0, help_text='size of the exported files'),
+        ),
+    ]
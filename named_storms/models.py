@@ -1,10 +1,14 @@
-from datetime import datetime
+import json
+import hashlib
+from datetime import datetime, timedelta
+from typing import Optional
 from psqlextra.types import PostgresPartitioningMethod
 from psqlextra.models import PostgresPartitionedModel
+from django.conf import settings
 from django.contrib.auth.models import User
 from django.contrib.gis.db import models
 from django.core.exceptions import ValidationError
-from django.db.models import Index
+from django.db.models import Index, Q
 from django.utils import timezone
 from django.contrib.postgres import fields
 
@@ -412,6 +416,7 @@ class NsemPsaData(PostgresPartitionedModel):
     class Meta:
         indexes = [
             Index(fields=['nsem_psa_variable', 'date', 'point']),
+            Index(fields=['nsem_psa_variable', 'date', 'id']),  # keyset pagination
         ]
 
 
@@ -437,13 +442,32 @@ class NsemPsaUserExport(models.Model):
     FORMAT_GEOJSON = 'geojson'
     FORMAT_KML = 'kml'
     FORMAT_CSV = 'csv'
+    FORMAT_GEOPARQUET = 'geoparquet'
+    FORMAT_FLATGEOBUF = 'flatgeobuf'
     FORMAT_CHOICES = (
         (FORMAT_NETCDF, FORMAT_NETCDF),
         (FORMAT_SHAPEFILE, FORMAT_SHAPEFILE),
         (FORMAT_GEOJSON, FORMAT_GEOJSON),
         (FORMAT_KML, FORMAT_KML),
         (FORMAT_CSV, FORMAT_CSV),
+        (FORMAT_GEOPARQUET, FORMAT_GEOPARQUET),
+        (FORMAT_FLATGEOBUF, FORMAT_FLATGEOBUF),
     )
+    # formats exported for a specific date
+    FORMATS_DATE_FILTER = (
+        FORMAT_CSV, FORMAT_SHAPEFILE, FORMAT_GEOJSON, FORMAT_KML, FORMAT_GEOPARQUET, FORMAT_FLATGEOBUF,
+    )
+    # formats whose large exports can be created in tiles and merged
+    FORMATS_TILED = (
+        FORMAT_NETCDF, FORMAT_CSV, FORMAT_SHAPEFILE, FORMAT_GEOJSON,
+    )
+    # bbox precision (~10m) when identifying identical exports
+    FINGERPRINT_BBOX_DECIMALS = 4
+
+    # export phases
+    PHASE_WRITE = 'write'  # query and write the export's files
+    PHASE_MERGE = 'merge'  # merge the files of a tiled export
+    PHASE_UPLOAD = 'upload'  # archive and upload the files
 
     nsem = models.ForeignKey(NsemPsa, on_delete=models.CASCADE)
     user = models.ForeignKey(User, on_delete=models.CASCADE)
@@ -456,3 +480,65 @@ class NsemPsaUserExport(models.Model):
     date_expires = models.DateTimeField(null=True, blank=True)
     success = models.BooleanField(default=False)
     exception = models.CharField(null=True, blank=True, max_length=1000, help_text='message for an unsuccessful export')
+    fingerprint = models.CharField(max_length=64, blank=True, db_index=True, help_text='identifies identical export requests')
+    s3_key = models.CharField(max_length=1500, null=True, blank=True, help_text='object storage key of the exported archive')
+    reused_from = models.ForeignKey(
+        'self', null=True, blank=True, on_delete=models.SET_NULL, related_name='reused_by', help_text='export whose results are reused')
+    date_started = models.DateTimeField(null=True, blank=True)
+    phase = models.CharField(max_length=20, null=True, blank=True, help_text='current phase while the export is created')
+    phase_timings = models.JSONField(default=dict, blank=True, help_text='seconds spent in each phase')
+    progress = models.FloatField(default=0, help_text='percent complete')
+    rows_processed = models.BigIntegerField(default=0, help_text='number of values/features exported')
+    bytes_written = models.BigIntegerField(default=0, help_text='size of the exported files')
+
+    @property
+    def eta(self) -> Optional[datetime]:
+        """
+        Estimated completion date using the progress so far
+        """
+        if self.date_completed or not self.date_started or not self.progress:
+            return None
+        elapsed = timezone.now() - self.date_started
+        return self.date_started + elapsed * (100 / self.progress)
+
+    def __str__(self):
+        return '{}: {} ({})'.format(self.nsem, self.format, self.id)
+
+    def save(self, *args, **kwargs):
+        self.fingerprint = self.get_fingerprint()
+        super().save(*args, **kwargs)
+
+    def get_fingerprint(self) -> str:
+        """
+        Identifies the export request by its psa, format, rounded bbox and date
+        """
+        bbox = [
+            [round(x, self.FINGERPRINT_BBOX_DECIMALS), round(y, self.FINGERPRINT_BBOX_DECIMALS)]
+            for x, y in self.bbox.exterior_ring.coords
+        ]
+        # the date filter is ignored by formats that export every date
+        date_filter = self.date_filter.isoformat() if self.date_filter and self.format in self.FORMATS_DATE_FILTER else None
+        request = json.dumps([self.nsem_id, self.format, bbox, date_filter])
+        return hashlib.sha256(request.encode()).hexdigest()
+
+    @staticmethod
+    def get_timeout() -> timedelta:
+        """
+        How long an export can take before it's considered to have failed
+        """
+        return timedelta(hours=settings.CWWED_PSA_USER_DATA_EXPORT_TIMEOUT_HOURS)
+
+    def get_reusable_export(self):
+        """
+        Returns an identical export that either succeeded and hasn't expired or is still being created (and hasn't timed out)
+        """
+        now = timezone.now()
+        return NsemPsaUserExport.objects.filter(
+            fingerprint=self.get_fingerprint(),
+            reused_from__isnull=True,  # only the original exports actually create the results
+        ).filter(
+            Q(success=True, date_expires__gt=now) |
+            Q(date_completed__isnull=True, date_created__gt=now - self.get_timeout())
+        ).exclude(
+            id=self.id,
+        ).order_by('-date_created').first()
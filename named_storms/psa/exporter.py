@@ -0,0 +1,458 @@
+import os
+import json
+import logging
+import itertools
+from contextlib import ExitStack
+from datetime import datetime
+from typing import List, Optional, Iterable, Iterator
+from xml.sax.saxutils import escape
+
+import fiona
+import netCDF4
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+import xarray as xr
+from django.contrib.gis import geos
+from fiona.crs import from_epsg
+from matplotlib.path import Path
+from shapely import wkb
+from shapely.geometry import mapping, shape, MultiPolygon
+from shapely.ops import unary_union
+
+from named_storms.models import NsemPsaManifestDataset, NsemPsaVariable
+from named_storms.utils import named_storm_nsem_version_path
+
+
+logger = logging.getLogger('cwwed')
+
+COMPRESSION_LEVEL = 4
+NODE_CHUNK_SIZE = 100000  # max number of nodes per netcdf chunk
+VECTOR_WRITE_CHUNK_SIZE = 500  # number of features written at a time
+
+# vector drivers
+DRIVER_SHAPEFILE = 'ESRI Shapefile'
+DRIVER_FLATGEOBUF = 'FlatGeobuf'
+
+# https://github.com/opengeospatial/geoparquet/blob/v1.0.0/format-specs/geoparquet.md
+GEOPARQUET_VERSION = '1.0.0'
+GEOPARQUET_COMPRESSION = 'zstd'
+
+# little-endian wkb points
+WKB_POINT_DTYPE = np.dtype([('byte_order', 'u1'), ('geometry_type', '<u4'), ('x', '<f8'), ('y', '<f8')])
+
+
+class PsaDatasetExporter:
+    """
+    Subsets a psa dataset directly from its source netcdf file
+    - use as a context manager (or call close()) to close the source dataset
+    """
+    dataset: xr.Dataset
+    psa_manifest_dataset: NsemPsaManifestDataset
+
+    def __init__(self, psa_manifest_dataset: NsemPsaManifestDataset):
+        self.psa_manifest_dataset = psa_manifest_dataset
+        self.dataset = xr.open_dataset(os.path.join(
+            named_storm_nsem_version_path(self.psa_manifest_dataset.nsem),
+            self.psa_manifest_dataset.path)
+        )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        self.dataset.close()
+
+    def subset(self, bbox: geos.Polygon, dates: List[datetime]) -> Optional[xr.Dataset]:
+        """
+        Returns the dataset's time-series variables for the dates and the nodes within the bounding box
+        as (time, node) arrays, or None if the bounding box doesn't contain any data
+        """
+
+        variables = [
+            v for v in self.psa_manifest_dataset.variables
+            if v in self.dataset and NsemPsaVariable.get_variable_attribute(v, 'data_type') == NsemPsaVariable.DATA_TYPE_TIME_SERIES
+        ]
+
+        # lon/lat are either shared node coordinates (unstructured) or separate grid dimensions (structured)
+        # so broadcast them together to get every node's position along the dataset's spatial dimensions
+        lon, lat = xr.broadcast(self.dataset['lon'], self.dataset['lat'])
+
+        # mask of the nodes within the bounding box
+        contains = Path(np.array(bbox.exterior_ring.coords)).contains_points(
+            np.column_stack([lon.values.ravel(), lat.values.ravel()]))
+        node_idx = np.flatnonzero(contains)
+
+        if not variables or not len(node_idx):
+            return None
+
+        # pointwise indexers along each spatial dimension which only read the bbox's hull from the source file
+        indexers = {
+            dim: xr.DataArray(idx, dims='node')
+            for dim, idx in zip(lon.dims, np.unravel_index(node_idx, lon.shape))
+        }
+
+        data = {}
+        for variable in variables:
+            logger.info('{}: exporting {} for {} nodes'.format(self.psa_manifest_dataset, variable, len(node_idx)))
+            da = self.dataset[variable].sel(time=dates).isel(indexers)
+            data[variable] = (da.transpose('time', 'node').values, da.attrs)
+
+        # only include nodes with data for any variable
+        has_data = np.any([np.any(~np.isnan(values), axis=0) for values, _ in data.values()], axis=0)
+        if not has_data.any():
+            return None
+
+        ds_out = xr.Dataset(
+            {variable: (['time', 'node'], values[:, has_data], attrs) for variable, (values, attrs) in data.items()},
+            coords={
+                'time': (['time'], dates),
+                'lon': (['node'], lon.values.ravel()[node_idx][has_data]),
+                'lat': (['node'], lat.values.ravel()[node_idx][has_data]),
+            },
+            # include supplied metadata from the manifest
+            attrs=self.psa_manifest_dataset.meta,
+        )
+
+        # include metadata for space and time
+        ds_out.time.attrs = self.psa_manifest_dataset.meta_time
+        ds_out.lat.attrs = self.psa_manifest_dataset.meta_lat
+        ds_out.lon.attrs = self.psa_manifest_dataset.meta_lon
+
+        return ds_out
+
+    @staticmethod
+    def netcdf_encoding(ds: xr.Dataset) -> dict:
+        """
+        Compression and chunking encodings for writing an exported dataset
+        """
+        encoding = {}
+        for variable in ds.variables:
+            encoding[variable] = {'zlib': True, 'complevel': COMPRESSION_LEVEL}
+            if ds[variable].dims == ('time', 'node'):
+                # chunk by time since exports are read a date at a time
+                encoding[variable]['chunksizes'] = (1, min(ds.dims['node'], NODE_CHUNK_SIZE))
+        return encoding
+
+
+def write_contours_shapefile(path: str, contours: Iterable[tuple]) -> int:
+    """
+    Writes (value, color, wkb) contours to a shapefile
+    """
+    # shapefiles only support 10 character field names so the color isn't included
+    return write_contours_vector(path, contours, driver=DRIVER_SHAPEFILE, include_color=False)
+
+
+def write_contours_vector(path: str, contours: Iterable[tuple], driver: str, include_color=True) -> int:
+    """
+    Writes (value, color, wkb) contours with a vector driver in chunks as they're streamed from the database
+    and returns the number of features written (the file isn't created when there aren't any)
+    """
+    schema = {
+        'geometry': 'MultiPolygon',
+        'properties': {'value': 'float', 'color': 'str'} if include_color else {'value': 'float'},
+    }
+
+    contours = iter(contours)
+    count = 0
+    dst = None
+
+    try:
+        while True:
+            chunk = list(itertools.islice(contours, VECTOR_WRITE_CHUNK_SIZE))
+            if not chunk:
+                break
+            records = []
+            for value, color, geometry in chunk:
+                geometry = wkb.loads(bytes(geometry))
+                # the schema requires a single geometry type
+                if geometry.geom_type == 'Polygon':
+                    geometry = MultiPolygon([geometry])
+                properties = {'value': value, 'color': color} if include_color else {'value': value}
+                records.append({'geometry': mapping(geometry), 'properties': properties})
+            if dst is None:
+                dst = fiona.open(path, 'w', driver=driver, crs=from_epsg(4326), schema=schema)
+            dst.writerecords(records)
+            count += len(records)
+    finally:
+        if dst is not None:
+            dst.close()
+
+    return count
+
+
+def write_contours_geoparquet(path: str, contours: Iterable[tuple]) -> int:
+    """
+    Writes (value, color, wkb) contours to GeoParquet in row groups as they're streamed from the database
+    and returns the number of features written (the file isn't created when there aren't any)
+    """
+    schema = _geoparquet_schema([
+        pa.field('value', pa.float64()),
+        pa.field('color', pa.string()),
+    ], geometry_types=['Polygon', 'MultiPolygon'])
+
+    contours = iter(contours)
+    count = 0
+    writer = None
+
+    try:
+        while True:
+            chunk = list(itertools.islice(contours, VECTOR_WRITE_CHUNK_SIZE))
+            if not chunk:
+                break
+            values, colors, geometries = zip(*chunk)
+            batch = pa.RecordBatch.from_arrays([
+                pa.array(values, pa.float64()),
+                pa.array(colors, pa.string()),
+                pa.array([bytes(g) for g in geometries], pa.binary()),
+            ], schema=schema)
+            if writer is None:
+                writer = pq.ParquetWriter(path, schema, compression=GEOPARQUET_COMPRESSION)
+            writer.write_table(pa.Table.from_batches([batch]))
+            count += len(chunk)
+    finally:
+        if writer is not None:
+            writer.close()
+
+    return count
+
+
+def write_points_vector(path: str, ds: xr.Dataset, driver: str) -> int:
+    """
+    Writes the first date of an exported (time, node) dataset as point features with a vector driver
+    """
+    variables = list(ds.data_vars)
+    schema = {
+        'geometry': 'Point',
+        'properties': {variable: 'float' for variable in variables},
+    }
+    lons, lats = ds['lon'].values, ds['lat'].values
+    values = {variable: ds[variable].values[0] for variable in variables}
+
+    with fiona.open(path, 'w', driver=driver, crs=from_epsg(4326), schema=schema) as dst:
+        for start in range(0, len(lons), VECTOR_WRITE_CHUNK_SIZE):
+            dst.writerecords([
+                {
+                    'geometry': {'type': 'Point', 'coordinates': (float(lons[i]), float(lats[i]))},
+                    'properties': {variable: _to_float(values[variable][i]) for variable in variables},
+                }
+                for i in range(start, min(start + VECTOR_WRITE_CHUNK_SIZE, len(lons)))
+            ])
+
+    return len(lons)
+
+
+def write_points_geoparquet(path: str, ds: xr.Dataset) -> int:
+    """
+    Writes the first date of an exported (time, node) dataset as GeoParquet points
+    """
+    variables = list(ds.data_vars)
+    schema = _geoparquet_schema(
+        [pa.field(variable, pa.float64()) for variable in variables],
+        geometry_types=['Point'],
+    )
+
+    # build the wkb points in a single vectorized pass
+    points = np.empty(len(ds['lon']), dtype=WKB_POINT_DTYPE)
+    points['byte_order'] = 1
+    points['geometry_type'] = 1
+    points['x'] = ds['lon'].values
+    points['y'] = ds['lat'].values
+    offsets = np.arange(len(points) + 1, dtype=np.int32) * WKB_POINT_DTYPE.itemsize
+    geometries = pa.Array.from_buffers(pa.binary(), len(points), [None, pa.py_buffer(offsets), pa.py_buffer(points.tobytes())])
+
+    table = pa.Table.from_arrays(
+        [pa.array(ds[variable].values[0], pa.float64(), from_pandas=True) for variable in variables] + [geometries],
+        schema=schema,
+    )
+    pq.write_table(table, path, compression=GEOPARQUET_COMPRESSION, row_group_size=NODE_CHUNK_SIZE)
+
+    return len(points)
+
+
+def _geoparquet_schema(fields: List[pa.Field], geometry_types: List[str]) -> pa.Schema:
+    # the "geo" metadata identifies the wkb geometry column (the crs defaults to longitude/latitude)
+    metadata = {
+        'version': GEOPARQUET_VERSION,
+        'primary_column': 'geometry',
+        'columns': {
+            'geometry': {'encoding': 'WKB', 'geometry_types': geometry_types},
+        },
+    }
+    return pa.schema(fields + [pa.field('geometry', pa.binary())], metadata={'geo': json.dumps(metadata)})
+
+
+def _to_float(value) -> Optional[float]:
+    return None if np.isnan(value) else float(value)
+
+
+def write_contours_geojson(path: str, psa_variable: NsemPsaVariable, date: Optional[datetime], contours: Iterable[tuple]) -> int:
+    """
+    Writes (value, color, geojson) contours as a feature collection one feature at a time as they're streamed from the database
+    and returns the number of features written (the file isn't created when there aren't any)
+    """
+    count = 0
+    fh = None
+
+    try:
+        for value, color, geometry in contours:
+            if fh is None:
+                fh = open(path, 'w')
+                fh.write('{"type": "FeatureCollection", "features": [')
+            feature = json.dumps({
+                "type": "Feature",
+                "properties": {
+                    "name": psa_variable.name,
+                    "display_name": psa_variable.display_name,
+                    "units": psa_variable.units,
+                    "value": value,
+                    "data_type": psa_variable.data_type,
+                    "date": date.isoformat() if date else None,
+                    "fill": color,
+                    "stroke": color,
+                },
+                "geometry": "@@geometry@@",  # placeholder to swap since the geometry is already serialized by the database
+            })
+            fh.write('{}{}'.format(',' if count else '', feature.replace('"@@geometry@@"', geometry)))
+            count += 1
+        if fh is not None:
+            fh.write(']}')
+    finally:
+        if fh is not None:
+            fh.close()
+
+    return count
+
+
+def write_contours_kml(path: str, psa_variable: NsemPsaVariable, contours: Iterable[tuple]) -> int:
+    """
+    Writes (value, color, kml) contours as placemarks one at a time as they're streamed from the database
+    and returns the number of placemarks written (the file isn't created when there aren't any)
+    """
+    count = 0
+    fh = None
+    units = escape(psa_variable.units or '')
+
+    try:
+        for value, color, geometry in contours:
+            if fh is None:
+                fh = open(path, 'w')
+                fh.write('<?xml version="1.0" encoding="UTF-8"?>\n')
+                fh.write('<kml xmlns="http://www.opengis.net/kml/2.2"><Document><name>{}</name>\n'.format(escape(str(psa_variable))))
+            # styles are included inline since the placemarks are written as they're streamed
+            # "7f" is 50% alpha - https://developers.google.com/kml/documentation/kmlreference#color
+            fh.write(
+                '<Placemark><name>{value} ({units})</name>'
+                '<Style><PolyStyle><color>7f{color}</color></PolyStyle></Style>'
+                '<ExtendedData>'
+                '<Data name="value"><value>{value}</value></Data>'
+                '<Data name="units"><value>{units}</value></Data>'
+                '</ExtendedData>'
+                '{geometry}</Placemark>\n'.format(value=value, units=units, color=escape(color[1:]), geometry=geometry)
+            )
+            count += 1
+        if fh is not None:
+            fh.write('</Document></kml>\n')
+    finally:
+        if fh is not None:
+            fh.close()
+
+    return count
+
+
+def merge_netcdf_tiles(path: str, tile_paths: List[str]) -> int:
+    """
+    Merges exported (time, node) tile datasets by appending each tile's nodes along the output's unlimited node dimension
+    one tile at a time (skipping any nodes duplicated along the tiles' shared edges) and returns the number of nodes
+    """
+    seen = set()
+    count = 0
+
+    for tile_path in tile_paths:
+        with xr.open_dataset(tile_path) as ds:
+
+            coords = list(zip(ds['lon'].values.tolist(), ds['lat'].values.tolist()))
+            is_new = np.array([c not in seen for c in coords], dtype=bool)
+            seen.update(coords)
+            if not is_new.any():
+                continue
+            ds = ds.isel(node=is_new)
+
+            # the first tile creates the output
+            if not count:
+                encoding = PsaDatasetExporter.netcdf_encoding(ds)
+                for variable in encoding:
+                    if 'chunksizes' in encoding[variable]:
+                        encoding[variable]['chunksizes'] = (1, NODE_CHUNK_SIZE)
+                ds.to_netcdf(path, encoding=encoding, unlimited_dims=['node'])
+
+            # the rest are appended a variable at a time
+            else:
+                with netCDF4.Dataset(path, 'a') as nc:
+                    for name, variable in ds.variables.items():
+                        if 'node' not in variable.dims:
+                            continue
+                        index = [slice(None)] * variable.ndim
+                        index[variable.dims.index('node')] = slice(count, count + ds.sizes['node'])
+                        nc[name][tuple(index)] = variable.values
+
+            count += ds.sizes['node']
+
+    return count
+
+
+def merge_csv_tiles(path: str, tile_paths: List[str]) -> int:
+    """
+    Concatenates exported csv tiles (indexed by date, lon & lat) one line at a time, writing the header once
+    and skipping any rows duplicated along the tiles' shared edges, and returns the number of rows
+    """
+    seen = set()
+    count = 0
+    header = None
+
+    with open(path, 'w') as fh_out:
+        for tile_path in tile_paths:
+            with open(tile_path) as fh:
+                tile_header = fh.readline()
+                if header is None:
+                    header = tile_header
+                    fh_out.write(header)
+                elif tile_header != header:
+                    raise ValueError('Tile {} has different columns than the other tiles'.format(tile_path))
+                for line in fh:
+                    index = tuple(line.split(',', 3)[:3])
+                    if index in seen:
+                        continue
+                    seen.add(index)
+                    fh_out.write(line)
+                    count += 1
+
+    return count
+
+
+def dissolve_contour_tiles(tile_paths: List[str]) -> Iterator[tuple]:
+    """
+    Yields (value, color, geometry) for each value in the exported contour tiles (shapefile or geojson)
+    where each value's geometries, which were clipped by the tiles, are unioned together one value at a time
+    """
+    with ExitStack() as stack:
+        tiles = [stack.enter_context(fiona.open(tile_path)) for tile_path in tile_paths]
+
+        # locate each value's features in the tiles
+        features = {}
+        for tile in tiles:
+            for fid, feature in tile.items():
+                features.setdefault(feature['properties']['value'], []).append((tile, fid))
+
+        for value in sorted(features):
+            geometries = []
+            color = None
+            for tile, fid in features[value]:
+                feature = tile[fid]
+                geometries.append(shape(feature['geometry']))
+                # shapefiles don't include the color
+                color = color or feature['properties'].get('fill')
+            yield value, color, unary_union(geometries)
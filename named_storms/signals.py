@@ -1,11 +1,49 @@
 from django.conf import settings
+from django.db import transaction
 from django.dispatch import receiver
-from django.db.models.signals import post_save
+from django.db.models.signals import post_save, pre_save, post_delete
 from rest_framework.authtoken.models import Token
 
+from named_storms.cache import invalidate_psa_current, is_psa_processed
+from named_storms.models import NamedStorm, NsemPsa, NsemPsaVariable
+
+# psa fields which determine whether a psa is a storm's current/valid psa (see NsemPsa.get_last_valid_psa())
+PSA_CURRENT_FIELDS = ('extracted', 'validated', 'processed')
+
 
 @receiver(post_save, sender=settings.AUTH_USER_MODEL)
 def create_auth_token(sender, instance=None, created=False, **kwargs):
     """Automatically create API Tokens for new users"""
     if created:
         Token.objects.create(user=instance)
+
+
+@receiver(pre_save, sender=NsemPsa)
+def track_psa_current_fields(sender, instance: NsemPsa, **kwargs):
+    """Flag whether the psa's validity is changing so the current psa cache only gets invalidated when necessary"""
+    previous = NsemPsa.objects.filter(pk=instance.pk).values(*PSA_CURRENT_FIELDS).first() if instance.pk else None
+    current = {field: getattr(instance, field) for field in PSA_CURRENT_FIELDS}
+    instance._psa_current_changed = previous != current
+
+
+@receiver(post_save, sender=NsemPsa)
+def invalidate_psa_current_on_psa_save(sender, instance: NsemPsa, **kwargs):
+    if getattr(instance, '_psa_current_changed', True):
+        # wait for the transaction to commit so other processes don't re-cache the stale psa
+        transaction.on_commit(invalidate_psa_current)
+
+
+@receiver(post_save, sender=NsemPsaVariable)
+@receiver(post_delete, sender=NsemPsaVariable)
+def invalidate_psa_current_on_variable_change(sender, instance: NsemPsaVariable, **kwargs):
+    # variables are saved repeatedly while a psa is being ingested so only invalidate for processed psas
+    # (checked against the cached processed psa ids to avoid a query for every variable save)
+    if is_psa_processed(instance.nsem_id):
+        transaction.on_commit(invalidate_psa_current)
+
+
+@receiver(post_delete, sender=NsemPsa)
+@receiver(post_save, sender=NamedStorm)
+@receiver(post_delete, sender=NamedStorm)
+def invalidate_psa_current_on_change(sender, **kwargs):
+    transaction.on_commit(invalidate_psa_current)
@@ -1,8 +1,18 @@
+import math
 from django.contrib.gis import geos
 from django.db import connection
 from datetime import datetime
+from typing import List, Iterator
 from named_storms.models import NsemPsaVariable
 
+# number of rows fetched at a time from server-side cursors
+CURSOR_ITER_SIZE = 2000
+
+# output formats of exported geometries
+GEOMETRY_FORMAT_WKB = 'ST_AsBinary'
+GEOMETRY_FORMAT_KML = 'ST_AsKML'
+GEOMETRY_FORMAT_GEOJSON = 'ST_AsGeoJSON'
+
 
 def wind_barbs_query(storm_name: str, psa_id: int, date: datetime, center: geos.Point, step=10, wind_speed_variable=NsemPsaVariable.VARIABLE_DATASET_WIND_SPEED):
 
@@ -53,3 +63,150 @@ def wind_barbs_query(storm_name: str, psa_id: int, date: datetime, center: geos.
         cursor.execute(sql, params)
 
         return cursor.fetchall()
+
+
+def transect_length_query(line: geos.LineString) -> float:
+    """
+    Returns the geodesic length of a line in meters
+    """
+
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT ST_Length(ST_GeomFromText(%(line)s, 4326)::geography)', {'line': line.wkt})
+        return cursor.fetchone()[0]
+
+
+def transect_points_count(length: float, spacing: float) -> int:
+    """
+    Returns how many points transect_points_query() samples along a line of the supplied length (including both ends of the line)
+    """
+    return math.ceil(length / spacing) + 1 if length else 1
+
+
+def transect_points_query(line: geos.LineString, spacing: float) -> List[geos.Point]:
+    """
+    Returns points sampled along a line every `spacing` meters (including both ends of the line)
+    """
+
+    with connection.cursor() as cursor:
+        sql = '''
+            WITH transect AS (
+                SELECT ST_GeomFromText(%(line)s, 4326) AS line
+            )
+            SELECT ST_AsText(ST_StartPoint(line)) FROM transect
+            UNION ALL
+            SELECT ST_AsText((ST_Dump(ST_LineInterpolatePoints(
+                line,
+                LEAST(1, %(spacing)s / GREATEST(ST_Length(line::geography), %(spacing)s)),
+                true
+            ))).geom) FROM transect
+            UNION ALL
+            SELECT ST_AsText(ST_EndPoint(line)) FROM transect
+        '''
+
+        params = {
+            'line': line.wkt,
+            'spacing': spacing,
+        }
+
+        cursor.execute(sql, params)
+
+        # remove any duplicate end point produced when the line length is a multiple of the spacing
+        points = []
+        for result in cursor.fetchall():
+            point = geos.fromstr(result[0], srid=4326)
+            if not points or not points[-1].equals(point):
+                points.append(point)
+
+        return points
+
+
+def time_series_batch_query(storm_name: str, variable_ids: List[int], points: List[geos.Point], distance: float):
+    """
+    Returns the values nearest each point per variable/date, i.e [(point index, variable id, date, value), ...]
+    - resolves every point in a single query via a lateral join
+    - point indexes are 0-based and match the order of the supplied points
+    """
+
+    with connection.cursor() as cursor:
+        sql = '''
+            WITH points AS (
+                SELECT
+                    p.idx - 1 AS idx,
+                    ST_SetSRID(ST_MakePoint(p.lon, p.lat), 4326)::geography AS point
+                FROM unnest(%(lons)s::float8[], %(lats)s::float8[]) WITH ORDINALITY AS p(lon, lat, idx)
+            )
+            SELECT
+                p.idx,
+                d.nsem_psa_variable_id,
+                d.date,
+                d.value
+            FROM points p
+                CROSS JOIN LATERAL (
+                    SELECT DISTINCT ON (nsem_psa_variable_id, date)
+                        nsem_psa_variable_id,
+                        date,
+                        value
+                    FROM named_storms_nsempsadata
+                    WHERE
+                        storm_name = %(storm_name)s AND
+                        nsem_psa_variable_id = ANY(%(variable_ids)s) AND
+                        ST_DWithin(point, p.point, %(distance)s)
+                    -- sort by ascending distance to get the first result in each group (i.e the nearest to the point)
+                    ORDER BY nsem_psa_variable_id, date, ST_Distance(point, p.point)
+                ) d
+        '''
+
+        params = {
+            'storm_name': storm_name,
+            'variable_ids': list(variable_ids),
+            'lons': [p.x for p in points],
+            'lats': [p.y for p in points],
+            'distance': distance,
+        }
+
+        cursor.execute(sql, params)
+
+        return cursor.fetchall()
+
+
+def psa_contour_export_query(variable_id: int, bbox: geos.Polygon, date: datetime = None, geometry_format=GEOMETRY_FORMAT_WKB) -> Iterator[tuple]:
+    """
+    Streams a psa variable's contours clipped to the bbox and grouped by value, i.e [(value, color, geometry), ...]
+    - the date only applies to time-series variables
+    - uses a server-side cursor so the results are never all held in memory
+    - use ST_MakeValid due to ring self-intersections which ST_Intersection chokes on
+    - use ST_CollectionHomogenize to guarantee we only get (multi)geometries
+    """
+
+    assert geometry_format in [GEOMETRY_FORMAT_WKB, GEOMETRY_FORMAT_KML, GEOMETRY_FORMAT_GEOJSON]
+
+    with connection.chunked_cursor() as cursor:
+        cursor.cursor.itersize = CURSOR_ITER_SIZE
+        sql = '''
+            SELECT
+                c.value,
+                c.color,
+                {geometry_format}(ST_CollectionHomogenize(ST_Collect(ST_Intersection(ST_MakeValid(c.geo::geometry), b.geom))))
+            FROM named_storms_nsempsacontour c
+                CROSS JOIN (SELECT ST_GeomFromText(%(bbox)s, 4326) AS geom) b
+            WHERE
+                c.nsem_psa_variable_id = %(variable_id)s AND
+                {date_filter}
+                ST_Intersects(c.geo, b.geom::geography)
+            GROUP BY c.value, c.color
+            ORDER BY c.value
+        '''.format(
+            geometry_format=geometry_format,
+            date_filter='c.date = %(date)s AND' if date else '',
+        )
+
+        params = {
+            'variable_id': variable_id,
+            'bbox': bbox.wkt,
+            'date': date,
+        }
+
+        cursor.execute(sql, params)
+
+        for row in cursor:
+            yield row
@@ -1,44 +1,49 @@
 import os
+import json
+import time
 import shutil
 import pytz
-import tarfile
 import requests
 import xarray as xr
-import boto3
 import numpy as np
 import pandas as pd
+from celery import chain, chord
 from celery.utils.log import get_task_logger
 from cfchecker import cfchecks
-from botocore.client import Config as BotoCoreConfig
 from datetime import datetime, timedelta
+from typing import Callable, Iterator, List
 from django.contrib.auth.models import User
+from django.contrib.gis import geos
 from django.conf import settings
-from django.contrib.gis.db.models import Collect, GeometryField, Func, F
-from django.contrib.gis.db.models.functions import Intersection, MakeValid, AsKML, GeoHash
-from django.core.exceptions import EmptyResultSet
 from django.core.mail import send_mail
-from django.db import connection
-from django.db.models import CharField
-from django.db.models.functions import Cast
+from django.db.models import F
+from django.db.models.functions import Least
 from django.http import Http404
 from django.shortcuts import get_object_or_404
 from django.template.loader import render_to_string
 from django.urls import reverse
 from django.utils import timezone
-from geopandas import GeoDataFrame
+from shapely.geometry import mapping
 from cwwed.celery import app
 from cwwed.storage_backends import S3ObjectStoragePrivate
+from named_storms.archive import get_archive_codec, get_archive_extension, write_archive, extract_archive, is_archive
 from named_storms.data.processors import ProcessorData
+from named_storms.psa.exporter import (
+    PsaDatasetExporter, write_contours_shapefile, write_contours_geojson, write_contours_kml, write_contours_vector,
+    write_contours_geoparquet, write_points_vector, write_points_geoparquet, merge_netcdf_tiles, merge_csv_tiles,
+    dissolve_contour_tiles, DRIVER_FLATGEOBUF)
 from named_storms.psa.processor import PsaDatasetProcessor
 from named_storms.models import (
     NamedStorm, CoveredDataProvider, CoveredData, NamedStormCoveredDataLog, NsemPsa, NsemPsaUserExport,
-    NsemPsaContour, NsemPsaVariable, NamedStormCoveredDataSnapshot, NsemPsaManifestDataset, NsemPsaData)
+    NsemPsaVariable, NamedStormCoveredDataSnapshot, NsemPsaManifestDataset, NamedStormCoveredData)
 from named_storms.psa.validator import PsaDatasetValidator
+from named_storms.sql import psa_contour_export_query, GEOMETRY_FORMAT_KML, GEOMETRY_FORMAT_GEOJSON
 from named_storms.utils import (
-    processor_class, copy_path_to_default_storage, get_superuser_emails,
+    processor_class, processor_factory_class, copy_path_to_default_storage, get_superuser_emails,
     named_storm_nsem_version_path, root_data_path, create_directory,
-    get_geojson_feature_collection_from_psa_qs, named_storm_path,
-    named_storm_covered_data_current_path)
+    named_storm_path, slack_channel,
+    named_storm_covered_data_current_path, named_storm_covered_data_current_path_root,
+    named_storm_covered_data_incomplete_path, named_storm_covered_data_tmp_path)
 
 # celery logger
 logger = get_task_logger(__name__)
@@ -60,27 +65,18 @@ TASK_ARGS_ACK_LATE = dict(
     task_reject_on_worker_lost=True,
 )
 
+# user exports are hard limited to their timeout so a hung export can't outlive it
+PSA_USER_EXPORT_TASK_ARGS = TASK_ARGS_RETRY.copy()  # type: dict
+PSA_USER_EXPORT_TASK_ARGS.update({
+    'time_limit': settings.CWWED_PSA_USER_DATA_EXPORT_TIMEOUT_HOURS * 60 * 60,
+})
 
-@app.task(**TASK_ARGS_RETRY)
-def fetch_url_task(url, verify=True, write_to_path=None):
-    """
-    :param url: URL to fetch
-    :param verify: whether to verify ssl
-    :param write_to_path: path to store the output vs returning it
-    """
-    stream = write_to_path is not None
-    response = requests.get(url, verify=verify, timeout=10, stream=stream)
-    response.raise_for_status()
-
-    # save content
-    if write_to_path is not None:
-        with open(write_to_path, 'wb') as f:
-            for chunk in response.iter_content(chunk_size=1024):
-                f.write(chunk)
-        return None
-
-    # return content
-    return response.content.decode()  # must return bytes for serialization
+# percent complete once each phase of a user export is complete
+PSA_USER_EXPORT_PHASE_PROGRESS = {
+    NsemPsaUserExport.PHASE_WRITE: 80,
+    NsemPsaUserExport.PHASE_MERGE: 90,
+    NsemPsaUserExport.PHASE_UPLOAD: 100,
+}
 
 
 @app.task(**TASK_ARGS_RETRY)
@@ -88,6 +84,25 @@ def process_covered_data_dataset_task(data: list):
     """
     Run the covered data dataset processor
     """
+    return _process_covered_data_dataset(data)
+
+
+@app.task(bind=True, default_retry_delay=TASK_ARGS_RETRY['default_retry_delay'], max_retries=TASK_ARGS_RETRY['max_retries'])
+def process_covered_data_dataset_chord_task(self, data: list):
+    """
+    Run the covered data dataset processor but return None once its retries are exhausted so a failed
+    dataset doesn't fail the provider's whole chord
+    """
+    try:
+        return _process_covered_data_dataset(data)
+    except Exception as e:
+        if self.request.retries < self.max_retries:
+            raise self.retry(exc=e)
+        logger.exception(e)
+        return None
+
+
+def _process_covered_data_dataset(data: list):
     processor_data = ProcessorData(*data)
     named_storm = get_object_or_404(NamedStorm, pk=processor_data.named_storm_id)
     provider = get_object_or_404(CoveredDataProvider, pk=processor_data.provider_id)
@@ -126,15 +141,14 @@ def archive_named_storm_covered_data_task(named_storm_id, covered_data_id, log_i
     log = get_object_or_404(NamedStormCoveredDataLog, pk=log_id)
 
     archive_path = named_storm_covered_data_current_path(named_storm, covered_data)
+    codec = get_archive_codec(archive_path)
     tar_path = '{}.{}'.format(
         os.path.join(os.path.dirname(archive_path), os.path.basename(archive_path)),  # guarantees no trailing slash
-        settings.CWWED_ARCHIVE_EXTENSION,
+        get_archive_extension(codec),
     )
 
     # create tar in local storage
-    tar = tarfile.open(tar_path, mode=settings.CWWED_NSEM_ARCHIVE_WRITE_MODE)
-    tar.add(archive_path, arcname=os.path.basename(archive_path))
-    tar.close()
+    write_archive(archive_path, os.path.basename(archive_path), tar_path, codec)
 
     storage_path = os.path.join(
         settings.CWWED_COVERED_ARCHIVE_DIR_NAME,
@@ -156,6 +170,139 @@ def archive_named_storm_covered_data_task(named_storm_id, covered_data_id, log_i
     return log.snapshot
 
 
+@app.task(bind=True)
+def collect_covered_data_provider_task(self, named_storm_id: int, covered_data_id: int, provider_ids: List[int]):
+    """
+    Collects a storm's covered data from the first provider and falls back to the next provider on failure.
+    The task replaces itself with a chord of the provider's dataset processors which then completes the collection.
+    """
+    named_storm = get_object_or_404(NamedStorm, pk=named_storm_id)
+    covered_data = get_object_or_404(CoveredData, pk=covered_data_id)
+
+    if not provider_ids:
+        logger.error('Error collecting {} for {} from ALL providers'.format(covered_data, named_storm))
+        return False
+
+    provider = get_object_or_404(CoveredDataProvider, pk=provider_ids[0])
+
+    log = NamedStormCoveredDataLog(
+        named_storm=named_storm,
+        covered_data=covered_data,
+        provider=provider,
+    )
+
+    # build the factory and fetch all the processors data
+    try:
+        # the factory runs inside this worker so it must never wait on other tasks (i.e catalogs are crawled in-process)
+        factory_cls = processor_factory_class(provider)
+        factory = factory_cls(named_storm, provider)
+        processors_data = factory.processors_data()
+    except Exception as e:
+        # failed building processors data so log error and try the next provider
+        logger.exception(e)
+        logger.error('Error building factory for {}'.format(provider))
+        log.success = False
+        log.exception = str(e)
+        log.save()
+        return self.replace(collect_covered_data_provider_task.si(named_storm_id, covered_data_id, provider_ids[1:]))
+
+    if not processors_data:
+        logger.warning('No data found for {} from {}.  Trying next provider'.format(named_storm, provider))
+        log.success = False
+        log.exception = 'No data found for storm'
+        log.save()
+        return self.replace(collect_covered_data_provider_task.si(named_storm_id, covered_data_id, provider_ids[1:]))
+
+    # fetch data in parallel and complete the collection once all the datasets have been processed
+    return self.replace(chord(
+        header=[process_covered_data_dataset_chord_task.s(data) for data in processors_data],
+        body=complete_covered_data_provider_task.s(named_storm_id, covered_data_id, provider_ids),
+    ))
+
+
+@app.task(bind=True)
+def complete_covered_data_provider_task(self, tasks_results: list, named_storm_id: int, covered_data_id: int, provider_ids: List[int]):
+    """
+    Moves a provider's collected covered data into place and archives it, or falls back to the next provider if everything failed
+    :param tasks_results: results of the provider's dataset processors (None for the failures)
+    """
+    named_storm = get_object_or_404(NamedStorm, pk=named_storm_id)
+    covered_data = get_object_or_404(CoveredData, pk=covered_data_id)
+    provider = get_object_or_404(CoveredDataProvider, pk=provider_ids[0])
+
+    log = NamedStormCoveredDataLog(
+        named_storm=named_storm,
+        covered_data=covered_data,
+        provider=provider,
+    )
+
+    total_tasks = len(tasks_results)
+    total_tasks_failed = len([result for result in tasks_results if result is None])
+
+    # handle total failure for provider
+    if total_tasks == total_tasks_failed:
+        # failed running processor tasks so log error and try the next provider
+        logger.error('Error collecting ALL data for {provider}: {num_failed} failed out of {total}'.format(
+            provider=provider, num_failed=total_tasks_failed, total=total_tasks))
+        log.success = False
+        log.save()
+        return self.replace(collect_covered_data_provider_task.si(named_storm_id, covered_data_id, provider_ids[1:]))
+    elif total_tasks_failed > 0:
+        logger.error('Error collecting some data for {provider}: {num_failed} failed out of {total}'.format(
+            provider=provider, num_failed=total_tasks_failed, total=total_tasks))
+
+    # save the log
+    log.success = True
+    log.save()
+
+    complete_path = named_storm_covered_data_current_path_root(named_storm)
+    data_path = os.path.join(complete_path, covered_data.name)
+    data_path_incomplete = os.path.join(named_storm_covered_data_incomplete_path(named_storm), covered_data.name)
+
+    try:
+        # remove any previous version in the complete path
+        if os.path.exists(data_path):
+            shutil.rmtree(data_path)
+        # move the covered data outputs from the incomplete/staging directory to the complete directory
+        shutil.move(data_path_incomplete, complete_path)
+    except OSError as e:
+        logger.error(e)
+        logger.error('Error moving path for {}'.format(provider))
+        log.success = False
+        log.exception = str(e)
+        log.save()
+        return self.replace(collect_covered_data_provider_task.si(named_storm_id, covered_data_id, provider_ids[1:]))
+
+    # set the date collected on the named storm covered data instance
+    storm_covered_data = NamedStormCoveredData.objects.get(named_storm=named_storm, covered_data=covered_data)
+    storm_covered_data.date_collected = datetime.utcnow()
+    storm_covered_data.save()
+
+    # create a task to archive the data
+    archive_named_storm_covered_data_task.delay(
+        named_storm_id=named_storm.id,
+        covered_data_id=covered_data.id,
+        log_id=log.id,
+    )
+
+    return True
+
+
+@app.task()
+def complete_named_storm_covered_data_collection_task(named_storm_id: int):
+    """
+    Removes a storm's temporary files once all of its covered data has been collected
+    """
+    named_storm = get_object_or_404(NamedStorm, pk=named_storm_id)
+    shutil.rmtree(named_storm_covered_data_tmp_path(named_storm), ignore_errors=True)
+
+
+@app.task()
+def complete_covered_data_collection_task():
+    if not settings.DEBUG:
+        slack_channel('Finished collecting covered data', '#events')
+
+
 @app.task(**TASK_ARGS_RETRY)
 def create_named_storm_covered_data_snapshot_task(named_storm_covered_data_snapshot_id):
     """
@@ -220,11 +367,9 @@ def extract_named_storm_covered_data_snapshot_task(nsem_psa_id):
 
     # extract the archives
     for file in os.listdir(file_system_path):
-        if file.endswith(settings.CWWED_ARCHIVE_EXTENSION):
+        if is_archive(file):
             file_path = os.path.join(file_system_path, file)
-            tar = tarfile.open(file_path, settings.CWWED_NSEM_ARCHIVE_READ_MODE)
-            tar.extractall(file_system_path)
-            tar.close()
+            extract_archive(file_path, file_system_path)
             # remove the original archive now that it's extracted
             os.remove(file_path)
 
@@ -303,9 +448,7 @@ def extract_nsem_psa_task(nsem_id):
     storage.download_file(storage.path(storage_path), file_system_path)
 
     # extract the tgz
-    tar = tarfile.open(file_system_path, settings.CWWED_NSEM_ARCHIVE_READ_MODE)
-    tar.extractall(os.path.dirname(file_system_path))
-    tar.close()
+    extract_archive(file_system_path, os.path.dirname(file_system_path))
 
     # recursively update the permissions for all extracted directories and files
     for root, dirs, files in os.walk(os.path.dirname(file_system_path)):
@@ -505,132 +648,130 @@ def validate_nsem_psa_task(nsem_id):
     nsem_psa.save()
 
 
-@app.task(**TASK_ARGS_RETRY)
-def create_psa_user_export_task(nsem_psa_user_export_id: int):
-
-    nsem_psa_user_export = get_object_or_404(NsemPsaUserExport, id=nsem_psa_user_export_id)
-    nsem_psa = nsem_psa_user_export.nsem
-    storm_name = nsem_psa.named_storm.name
-
-    date_expires = pytz.utc.localize(datetime.utcnow()) + timedelta(days=settings.CWWED_PSA_USER_DATA_EXPORT_DAYS)
-
-    tmp_user_export_path = os.path.join(
+def _psa_user_export_path(nsem_psa_user_export: NsemPsaUserExport) -> str:
+    return os.path.join(
         root_data_path(),
         settings.CWWED_NSEM_TMP_USER_EXPORT_DIR_NAME,
         str(nsem_psa_user_export.id),
     )
-    tar_path = os.path.join(
-        tmp_user_export_path,
-        '{}.tgz'.format(nsem_psa_user_export.nsem.named_storm),
+
+
+def _psa_user_export_tile_path(nsem_psa_user_export: NsemPsaUserExport, tile_index: int = None) -> str:
+    # tiles are kept outside the export's path since everything in the export's path is archived
+    path = '{}-tiles'.format(_psa_user_export_path(nsem_psa_user_export))
+    return os.path.join(path, str(tile_index)) if tile_index is not None else path
+
+
+def _psa_user_export_tile_rows_path(nsem_psa_user_export: NsemPsaUserExport, tile_index: int) -> str:
+    # each tile's row count is kept beside its directory so a retried tile replaces (rather than adds to) its count
+    return os.path.join(_psa_user_export_tile_path(nsem_psa_user_export), '{}.rows'.format(tile_index))
+
+
+def get_psa_user_export_tiles(nsem_psa_user_export: NsemPsaUserExport) -> List[geos.Polygon]:
+    """
+    Splits a large export's bbox into a grid of tiles which can be exported in parallel
+    """
+    tile_size = settings.CWWED_PSA_USER_DATA_EXPORT_TILE_DEGREES
+    bbox = nsem_psa_user_export.bbox
+
+    # only the formats which can be merged are tiled
+    if nsem_psa_user_export.format not in NsemPsaUserExport.FORMATS_TILED:
+        return [bbox]
+
+    x_min, y_min, x_max, y_max = bbox.extent
+    tiles = []
+    for x in np.arange(x_min, x_max, tile_size):
+        for y in np.arange(y_min, y_max, tile_size):
+            tile = bbox.intersection(geos.Polygon.from_bbox((x, y, min(x + tile_size, x_max), min(y + tile_size, y_max))))
+            # intersections of irregular polygons can be multi polygons
+            tiles += [t for t in (tile if isinstance(tile, geos.MultiPolygon) else [tile]) if isinstance(t, geos.Polygon) and not t.empty]
+    return tiles or [bbox]
+
+
+def _start_psa_user_export_phase(nsem_psa_user_export_id: int, phase: str) -> float:
+    """
+    Flags the export's current phase and returns when it started
+    """
+    NsemPsaUserExport.objects.filter(id=nsem_psa_user_export_id, date_started__isnull=True).update(date_started=timezone.now())
+    NsemPsaUserExport.objects.filter(id=nsem_psa_user_export_id).update(phase=phase)
+    return time.time()
+
+
+def _complete_psa_user_export_phase(nsem_psa_user_export_id: int, phase: str, started: float, **updates):
+    """
+    Records the phase's timing and the export's progress (and any other supplied field updates)
+    """
+    # phases run sequentially (tiles are timed together once they're merged) so the timings can be safely updated in place
+    phase_timings = NsemPsaUserExport.objects.values_list('phase_timings', flat=True).get(id=nsem_psa_user_export_id)
+    phase_timings[phase] = round(time.time() - started, 3)
+    NsemPsaUserExport.objects.filter(id=nsem_psa_user_export_id).update(
+        phase_timings=phase_timings,
+        progress=PSA_USER_EXPORT_PHASE_PROGRESS[phase],
+        **updates
     )
 
-    # create temporary directory
-    create_directory(tmp_user_export_path)
+
+def _psa_user_export_units(nsem_psa_user_export_id: int, units: list, progress_share: float, rows: Callable[[], int]) -> Iterator:
+    """
+    Yields each dataset/variable an export writes and records the export's progress and rows processed as each one is written
+    :param units: datasets/variables to write
+    :param progress_share: percent of the export's progress the units account for
+    :param rows: returns the number of rows written so far
+    """
+    rows_recorded = rows()
+    for unit in units:
+        yield unit
+        rows_written = rows()
+        NsemPsaUserExport.objects.filter(id=nsem_psa_user_export_id).update(
+            rows_processed=F('rows_processed') + rows_written - rows_recorded,
+            # retried writes can't exceed the phase's progress
+            progress=Least(F('progress') + progress_share / len(units), PSA_USER_EXPORT_PHASE_PROGRESS[NsemPsaUserExport.PHASE_WRITE]),
+        )
+        rows_recorded = rows_written
+
+
+def _write_psa_user_export(nsem_psa_user_export: NsemPsaUserExport, bbox: geos.Polygon, output_path: str, progress_share: float = None) -> int:
+    """
+    Writes the export's files for the bbox to the output path and returns the number of values/features written
+    - progress is recorded after each dataset/variable is written
+    :param progress_share: percent of the export's progress this write accounts for (defaults to the whole write phase)
+    """
+    if progress_share is None:
+        progress_share = PSA_USER_EXPORT_PHASE_PROGRESS[NsemPsaUserExport.PHASE_WRITE]
+
+    rows = 0
+
+    datasets = list(nsem_psa_user_export.nsem.nsempsamanifestdataset_set.all())
+    polygon_variables = list(nsem_psa_user_export.nsem.nsempsavariable_set.filter(geo_type=NsemPsaVariable.GEO_TYPE_POLYGON))
+
+    def units(items: list, share: float = progress_share):
+        return _psa_user_export_units(nsem_psa_user_export.id, items, share, lambda: rows)
 
     # netcdf/csv - extract raw point data
     if nsem_psa_user_export.format in [NsemPsaUserExport.FORMAT_NETCDF, NsemPsaUserExport.FORMAT_CSV]:
 
         # csv exports to a specific date while netcdf includes all
-        dates_to_export = [nsem_psa_user_export.date_filter] if nsem_psa_user_export.format == NsemPsaUserExport.FORMAT_CSV else nsem_psa.dates
+        dates_to_export = [nsem_psa_user_export.date_filter] if nsem_psa_user_export.format == NsemPsaUserExport.FORMAT_CSV else nsem_psa_user_export.nsem.dates
         # remove tz to use dates as indexes
         dates_to_export = [d.replace(tzinfo=None) for d in dates_to_export]
 
-        for psa_dataset in nsem_psa_user_export.nsem.nsempsamanifestdataset_set.all():
-
-            # create export dataset including any supplied metadata from the manifest
-            ds_out = xr.Dataset(attrs=psa_dataset.meta)
-
-            ds_out_path = os.path.join(tmp_user_export_path, psa_dataset.path)  # dataset extension is expected to already be .nc
-
-            # filter points within the user's bounding box
-            all_data = NsemPsaData.objects.annotate(
-                geo_hash=GeoHash('point'),
-                geom_point=Cast('point', GeometryField()),
-            ).filter(
-                nsem_psa_variable__name__in=psa_dataset.variables,
-                nsem_psa_variable__nsem=nsem_psa,
-                geom_point__within=nsem_psa_user_export.bbox,
-                storm_name=storm_name,  # helps with table partitioning
-            ).distinct(
-                'geo_hash',
-            ).order_by(
-                'geo_hash',
-            ).only(
-                'point',
-            )
+        for psa_dataset in units(datasets):
 
-            # export's bounding box didn't contain any points/data
-            if not all_data.exists():
-                continue
+            ds_out_path = os.path.join(output_path, psa_dataset.path)  # dataset extension is expected to already be .nc
 
-            all_points = [d.point for d in all_data]
+            # subset the psa's source dataset using the export's bounding box and dates
+            with PsaDatasetExporter(psa_dataset) as exporter:
+                ds_out = exporter.subset(bbox, dates_to_export)
 
-            # build the dataset coordinates
-            coords = np.array([p.coords for p in all_points])
-            ds_coords = {
-                'time': (['time'], dates_to_export),
-                'lon': (['node'], coords[:, 0]),
-                'lat': (['node'], coords[:, 1]),
-            }
-
-            # add every time-series variable to the out dataset for this psa dataset
-            variable_kwargs = dict(
-                data_type=NsemPsaVariable.DATA_TYPE_TIME_SERIES,
-                name__in=psa_dataset.variables,
-            )
-            for psa_variable in psa_dataset.nsem.nsempsavariable_set.filter(**variable_kwargs):
-
-                # build results for data in each date in the psa
-                results = []
-                for date in dates_to_export:
-                    variable_data = psa_variable.nsempsadata_set.annotate(
-                        geo_hash=GeoHash('point'),
-                    ).filter(
-                        geo_hash__in=[d.geo_hash for d in all_data],
-                        date=pytz.utc.localize(date),  # add utc timezone
-                        storm_name=storm_name,  # helps with table partitioning
-                    ).only(
-                        'value',
-                        'point',
-                    ).order_by(
-                        'geo_hash',
-                    )
-                    variable_data = list(variable_data)
-                    variable_points = [d.point for d in variable_data]
-                    result = []
-
-                    # iterate over point/data list and insert NaN for absent values
-                    for point in all_points:
-                        try:
-                            idx = variable_points.index(point)
-                        # no value at this point
-                        except ValueError:
-                            result.append(np.nan)
-                        # insert value for this located point
-                        else:
-                            result.append(variable_data[idx].value)
-                            # remove found object from lists
-                            variable_data.pop(idx)
-                            variable_points.pop(idx)
-
-                    results.append(result)
-
-                # add the data array to the dataset
-                ds_out[psa_variable.name] = xr.DataArray(
-                    np.array(results),
-                    coords=ds_coords,
-                    dims=['time', 'node'],
-                    attrs=psa_variable.meta,
-                )
+            # export's bounding box didn't contain any points/data
+            if ds_out is None:
+                continue
 
-            # include metadata for space and time
-            ds_out.time.attrs = psa_dataset.meta_time
-            ds_out.lat.attrs = psa_dataset.meta_lat
-            ds_out.lon.attrs = psa_dataset.meta_lon
+            rows += ds_out.sizes['time'] * ds_out.sizes['node'] * len(ds_out.data_vars)
 
             # netcdf
             if nsem_psa_user_export.format == NsemPsaUserExport.FORMAT_NETCDF:
-                ds_out.to_netcdf(ds_out_path)
+                ds_out.to_netcdf(ds_out_path, encoding=PsaDatasetExporter.netcdf_encoding(ds_out))
 
             # csv
             elif nsem_psa_user_export.format == NsemPsaUserExport.FORMAT_CSV:
@@ -662,169 +803,356 @@ def create_psa_user_export_task(nsem_psa_user_export_id: int):
 
                 # write csv
                 df_out.to_csv(
-                    os.path.join(tmp_user_export_path, '{}.csv'.format(psa_dataset.path)))
+                    os.path.join(output_path, '{}.csv'.format(psa_dataset.path)))
 
     # shapefile - extract pre-processed contour data from db
     elif nsem_psa_user_export.format == NsemPsaUserExport.FORMAT_SHAPEFILE:
 
         # generate shapefiles for all time-series polygon variables
-        for psa_geom_variable in nsem_psa_user_export.nsem.nsempsavariable_set.filter(geo_type=NsemPsaVariable.GEO_TYPE_POLYGON):
+        for psa_geom_variable in units(polygon_variables):
+
+            # only include date if it's a time series variable
+            date = nsem_psa_user_export.date_filter if psa_geom_variable.data_type == NsemPsaVariable.DATA_TYPE_TIME_SERIES else None
 
-            #
-            # generate sql query to send to geopanda's GeoDataFrame.from_postgis() to create a shapefile
-            #
+            # stream the contours grouped by value and clipped by the bbox straight into the shapefile
+            contours = psa_contour_export_query(psa_geom_variable.id, bbox, date)
+            written = write_contours_shapefile(os.path.join(output_path, '{}.shp'.format(psa_geom_variable.name)), contours)
+            if not written:
+                logger.info('empty result for {}'.format(psa_geom_variable))
+            rows += written
 
-            # NOTE: we have to fetch all the ids of the actual data up front because we need to send the raw query to
-            # GeoPandas, but django doesn't produce valid sql when using QuerySet.query due to it not quoting params (specifically dates),
-            # so this technique is a workaround
+    # extract pre-processed geo data from db
+    elif nsem_psa_user_export.format in [NsemPsaUserExport.FORMAT_GEOJSON, NsemPsaUserExport.FORMAT_KML]:
 
-            # fetch the ids of the psa data for this psa variable and that intersects the export's requested bbox
-            kwargs = dict(
-                nsem_psa_variable__id=psa_geom_variable.id,
-                geo__intersects=nsem_psa_user_export.bbox,
-            )
+        for psa_variable in units(polygon_variables):
 
             # only include date if it's a time series variable
-            if psa_geom_variable.data_type == NsemPsaVariable.DATA_TYPE_TIME_SERIES:
-                kwargs['date'] = nsem_psa_user_export.date_filter
-
-            qs = NsemPsaContour.objects.filter(**kwargs)
-            data_ids = [r['id'] for r in qs.values('id')]
-
-            # group all intersecting geometries together by value and clip the result using the export's bbox intersection
-            # cast to CharField for GeoPandas
-            # use ST_MakeValid due to ring self-intersections which ST_Intersection chokes on
-            # use ST_CollectionHomogenize to guarantee we only get (multi)geometries
-            qs = NsemPsaContour.objects.filter(id__in=data_ids)
-            qs = qs.values('value')
-            qs = qs.annotate(
-                geom=Cast(
-                        Func(
-                            Collect(Intersection(MakeValid(Cast('geo', GeometryField())), nsem_psa_user_export.bbox)),
-                            function='ST_CollectionHomogenize',
-                        ),
-                        CharField()
-                ),
-            )
-
-            # create GeoDataFrame from query
-            try:
-                gdf = GeoDataFrame.from_postgis(str(qs.query), connection, geom_col='geom')
-            # https://docs.djangoproject.com/en/3.0/ref/exceptions/#emptyresultset
-            except EmptyResultSet:
-                logger.info('empty result for {}', psa_geom_variable)
-                continue
+            date = nsem_psa_user_export.date_filter if psa_variable.data_type == NsemPsaVariable.DATA_TYPE_TIME_SERIES else None
 
-            # save to temporary user path
-            gdf.to_file(os.path.join(tmp_user_export_path, '{}.shp'.format(psa_geom_variable.name)))
+            # stream the contours grouped by value and clipped by the bbox straight into the file
+            if nsem_psa_user_export.format == NsemPsaUserExport.FORMAT_KML:
+                contours = psa_contour_export_query(psa_variable.id, bbox, date, geometry_format=GEOMETRY_FORMAT_KML)
+                rows += write_contours_kml(os.path.join(output_path, '{}.kml'.format(psa_variable.name)), psa_variable, contours)
+            elif nsem_psa_user_export.format == NsemPsaUserExport.FORMAT_GEOJSON:
+                contours = psa_contour_export_query(psa_variable.id, bbox, date, geometry_format=GEOMETRY_FORMAT_GEOJSON)
+                rows += write_contours_geojson(os.path.join(output_path, '{}.json'.format(psa_variable.name)), psa_variable, date, contours)
 
-    # extract pre-processed geo data from db
-    elif nsem_psa_user_export.format in [NsemPsaUserExport.FORMAT_GEOJSON, NsemPsaUserExport.FORMAT_KML]:
+    # geoparquet/flatgeobuf - contours from the db and point data from the source datasets
+    elif nsem_psa_user_export.format in [NsemPsaUserExport.FORMAT_GEOPARQUET, NsemPsaUserExport.FORMAT_FLATGEOBUF]:
+
+        extension = 'parquet' if nsem_psa_user_export.format == NsemPsaUserExport.FORMAT_GEOPARQUET else 'fgb'
+
+        # the progress is shared by the contours and the points
+        variables_share = progress_share * len(polygon_variables) / max(len(polygon_variables) + len(datasets), 1)
+
+        for psa_geom_variable in units(polygon_variables, variables_share):
 
-        for psa_variable in nsem_psa_user_export.nsem.nsempsavariable_set.all():
-            data_kwargs = dict(
-                geo__intersects=nsem_psa_user_export.bbox,
-            )
             # only include date if it's a time series variable
-            if psa_variable.data_type == NsemPsaVariable.DATA_TYPE_TIME_SERIES:
-                data_kwargs['date'] = nsem_psa_user_export.date_filter
-
-            # group all intersecting geometries together by variable & value and
-            # only return the export's bbox intersection
-            # NOTE: using ST_MakeValid to fix any ring self-intersections which ST_Intersection chokes on
-            qs = psa_variable.nsempsacontour_set.filter(**data_kwargs)
-            qs = qs.values(*[
-                'value', 'color', 'date', 'nsem_psa_variable__name', 'nsem_psa_variable__display_name',
-                'nsem_psa_variable__units', 'nsem_psa_variable__data_type',
-            ])
-            qs = qs.annotate(geom=Collect(Intersection(MakeValid(Cast('geo', GeometryField())), nsem_psa_user_export.bbox)))
+            date = nsem_psa_user_export.date_filter if psa_geom_variable.data_type == NsemPsaVariable.DATA_TYPE_TIME_SERIES else None
+
+            # stream the contours grouped by value and clipped by the bbox straight into the file
+            contours = psa_contour_export_query(psa_geom_variable.id, bbox, date)
+            contours_path = os.path.join(output_path, '{}.{}'.format(psa_geom_variable.name, extension))
+            if nsem_psa_user_export.format == NsemPsaUserExport.FORMAT_GEOPARQUET:
+                rows += write_contours_geoparquet(contours_path, contours)
+            else:
+                rows += write_contours_vector(contours_path, contours, driver=DRIVER_FLATGEOBUF)
+
+        for psa_dataset in units(datasets, progress_share - variables_share):
+
+            # subset the psa's source dataset using the export's bounding box and date (remove tz to use as an index)
+            with PsaDatasetExporter(psa_dataset) as exporter:
+                ds_out = exporter.subset(bbox, [nsem_psa_user_export.date_filter.replace(tzinfo=None)])
 
             # export's bounding box didn't contain any points/data
-            if not qs.exists():
+            if ds_out is None:
                 continue
 
-            if nsem_psa_user_export.format == NsemPsaUserExport.FORMAT_KML:
-                # annotate with "AsKML" to get kml and "ST_CollectionHomogenize" to guarantee we only get (multi)geometries
-                qs = qs.annotate(kml=AsKML(Func(F('geom'), function='ST_CollectionHomogenize')))
-                # write kml to file
-                with open(os.path.join(tmp_user_export_path, '{}.kml'.format(psa_variable.name)), 'w') as fh:
-                    fh.write(render_to_string('psa_export.kml', context={"results": qs, "psa_variable": psa_variable}))
-            elif nsem_psa_user_export.format == NsemPsaUserExport.FORMAT_GEOJSON:
-                # write geojson to file
-                with open(os.path.join(tmp_user_export_path, '{}.json'.format(psa_variable.name)), 'w') as fh:
-                    fh.write(get_geojson_feature_collection_from_psa_qs(qs))
+            points_path = os.path.join(output_path, '{}.{}'.format(os.path.splitext(psa_dataset.path)[0], extension))
+            if nsem_psa_user_export.format == NsemPsaUserExport.FORMAT_GEOPARQUET:
+                rows += write_points_geoparquet(points_path, ds_out)
+            else:
+                rows += write_points_vector(points_path, ds_out, driver=DRIVER_FLATGEOBUF)
+
+    return rows
+
+
+def _merge_psa_user_export_tiles(nsem_psa_user_export: NsemPsaUserExport, tile_paths: List[str], output_path: str):
+    """
+    Merges each tile's partial files into the export's files
+    """
+
+    # group the partial files by name
+    partials = {}
+    for tile_path in tile_paths:
+        for file_name in os.listdir(tile_path):
+            partials.setdefault(file_name, []).append(os.path.join(tile_path, file_name))
+
+    for file_name, paths in partials.items():
+        file_path = os.path.join(output_path, file_name)
+
+        # netcdf - append each tile's nodes
+        if nsem_psa_user_export.format == NsemPsaUserExport.FORMAT_NETCDF:
+            merge_netcdf_tiles(file_path, paths)
+
+        # csv - concatenate each tile's rows
+        elif nsem_psa_user_export.format == NsemPsaUserExport.FORMAT_CSV:
+            merge_csv_tiles(file_path, paths)
+
+        # shapefile - rejoin each value's geometries which were clipped by the tiles
+        elif nsem_psa_user_export.format == NsemPsaUserExport.FORMAT_SHAPEFILE:
+            # only read the actual shapefiles since their sidecar files (.dbf, .shx etc) are written alongside them
+            if not file_name.endswith('.shp'):
+                continue
+            contours = ((value, color, geometry.wkb) for value, color, geometry in dissolve_contour_tiles(paths))
+            write_contours_shapefile(file_path, contours)
+
+        # geojson - rejoin each value's geometries which were clipped by the tiles
+        elif nsem_psa_user_export.format == NsemPsaUserExport.FORMAT_GEOJSON:
+            psa_variable = nsem_psa_user_export.nsem.nsempsavariable_set.get(name=os.path.splitext(file_name)[0])
+            # only include date if it's a time series variable
+            date = nsem_psa_user_export.date_filter if psa_variable.data_type == NsemPsaVariable.DATA_TYPE_TIME_SERIES else None
+            contours = ((value, color, json.dumps(mapping(geometry))) for value, color, geometry in dissolve_contour_tiles(paths))
+            write_contours_geojson(file_path, psa_variable, date, contours)
+
+
+def _complete_psa_user_export(nsem_psa_user_export: NsemPsaUserExport, tmp_user_export_path: str):
+    """
+    Archives and uploads the export's files and completes the export
+    """
 
     # no data found in the export's bounding box
     if len(os.listdir(tmp_user_export_path)) == 0:
         msg = "No data found in the export's bounding box."
         logger.warning(msg)
         # update export instance
+        nsem_psa_user_export.refresh_from_db()
+        nsem_psa_user_export.phase = None
+        nsem_psa_user_export.progress = 100
         nsem_psa_user_export.date_completed = pytz.utc.localize(datetime.utcnow())
         nsem_psa_user_export.exception = msg
         nsem_psa_user_export.save()
+        complete_reused_psa_user_exports(nsem_psa_user_export)
         return
 
-    # create tar in local storage
-    tar = tarfile.open(tar_path, mode=settings.CWWED_NSEM_ARCHIVE_WRITE_MODE)
-    tar.add(tmp_user_export_path, arcname=str(nsem_psa_user_export.nsem.named_storm))
-    tar.close()
-
-    #
-    # create pre-signed url and upload to S3
-    # https://aws.amazon.com/premiumsupport/knowledge-center/presigned-url-s3-bucket-expiration/
-    #
-
-    # get the service client with sigv4 configured
-    s3_client = boto3.client(
-        's3',
-        aws_access_key_id=settings.CWWED_ARCHIVES_ACCESS_KEY_ID,
-        aws_secret_access_key=settings.CWWED_ARCHIVES_SECRET_ACCESS_KEY,
-        config=BotoCoreConfig(signature_version='s3v4'))
+    date_expires = pytz.utc.localize(datetime.utcnow()) + timedelta(days=settings.CWWED_PSA_USER_DATA_EXPORT_DAYS)
+
+    codec = get_archive_codec(tmp_user_export_path)
 
     # user export key name (using the export_id enforces uniqueness)
     key_name = '{path}/{storm_name}-{export_id}.{extension}'.format(
         path=settings.CWWED_NSEM_S3_USER_EXPORT_DIR_NAME,
         export_id=nsem_psa_user_export.id,
         storm_name=nsem_psa_user_export.nsem.named_storm,
-        extension=settings.CWWED_ARCHIVE_EXTENSION,
+        extension=get_archive_extension(codec),
     )
 
-    # handle staging base paths (i.e "local", "dev", "test")
-    s3_base_location = S3ObjectStoragePrivate().location
-    if s3_base_location:
-        key_name = '{}/{}'.format(s3_base_location, key_name)
-
-    # generate the pre-signed URL
-    presigned_url = s3_client.generate_presigned_url(
-        ClientMethod='get_object',
-        Params={
-            'Bucket': settings.AWS_ARCHIVE_BUCKET_NAME,
-            'Key': key_name,
-        },
-        ExpiresIn=settings.CWWED_PSA_USER_DATA_EXPORT_DAYS * 24 * 60 * 60,
-    )
+    # handles staging base paths (i.e "local", "dev", "test")
+    storage = S3ObjectStoragePrivate()
 
-    # upload tar to s3 object with expiration
-    s3_resource = boto3.resource(
-        's3',
-        aws_access_key_id=settings.CWWED_ARCHIVES_ACCESS_KEY_ID,
-        aws_secret_access_key=settings.CWWED_ARCHIVES_SECRET_ACCESS_KEY,
-    )
-    with open(tar_path, 'rb') as fh:
-        s3_resource.Bucket(settings.AWS_ARCHIVE_BUCKET_NAME).put_object(
-            Key=key_name,
-            Body=fh,
-        )
+    started = _start_psa_user_export_phase(nsem_psa_user_export.id, NsemPsaUserExport.PHASE_UPLOAD)
+
+    bytes_written = sum(
+        os.path.getsize(os.path.join(root, f)) for root, _, files in os.walk(tmp_user_export_path) for f in files)
+
+    # stream the tar through the codec straight into the s3 object
+    storage.upload_directory_archive(tmp_user_export_path, str(nsem_psa_user_export.nsem.named_storm), key_name, codec)
+
+    _complete_psa_user_export_phase(nsem_psa_user_export.id, NsemPsaUserExport.PHASE_UPLOAD, started, bytes_written=bytes_written)
 
     # remove temporary directory
     shutil.rmtree(tmp_user_export_path)
 
+    # include the recorded progress
+    nsem_psa_user_export.refresh_from_db()
+
+    nsem_psa_user_export.phase = None
     nsem_psa_user_export.success = True
     nsem_psa_user_export.date_expires = date_expires
     nsem_psa_user_export.date_completed = pytz.utc.localize(datetime.utcnow())
-    nsem_psa_user_export.url = presigned_url
+    nsem_psa_user_export.s3_key = key_name
+    nsem_psa_user_export.url = storage.presigned_url(key_name, expires_in=settings.CWWED_PSA_USER_DATA_EXPORT_DAYS * 24 * 60 * 60)
     nsem_psa_user_export.save()
 
+    complete_reused_psa_user_exports(nsem_psa_user_export)
+
+
+@app.task(**PSA_USER_EXPORT_TASK_ARGS)
+def create_psa_user_export_task(nsem_psa_user_export_id: int):
+
+    nsem_psa_user_export = get_object_or_404(NsemPsaUserExport, id=nsem_psa_user_export_id)
+
+    tmp_user_export_path = _psa_user_export_path(nsem_psa_user_export)
+
+    # create temporary directory
+    create_directory(tmp_user_export_path)
+
+    started = _start_psa_user_export_phase(nsem_psa_user_export.id, NsemPsaUserExport.PHASE_WRITE)
+    rows = _write_psa_user_export(nsem_psa_user_export, nsem_psa_user_export.bbox, tmp_user_export_path)
+    _complete_psa_user_export_phase(nsem_psa_user_export.id, NsemPsaUserExport.PHASE_WRITE, started, rows_processed=rows)
+
+    _complete_psa_user_export(nsem_psa_user_export, tmp_user_export_path)
+
+
+@app.task(**PSA_USER_EXPORT_TASK_ARGS)
+def create_psa_user_export_tile_task(nsem_psa_user_export_id: int, tile_index: int, tile_count: int, tile_wkt: str):
+    """
+    Writes the partial export files for a single tile of a large export
+    """
+
+    nsem_psa_user_export = get_object_or_404(NsemPsaUserExport, id=nsem_psa_user_export_id)
+
+    tile_path = _psa_user_export_tile_path(nsem_psa_user_export, tile_index)
+
+    # create temporary tile directory (replacing any partial files from a previous attempt)
+    create_directory(tile_path, remove_if_exists=True)
+
+    _start_psa_user_export_phase(nsem_psa_user_export.id, NsemPsaUserExport.PHASE_WRITE)
+
+    # tiles run concurrently so their share of the progress is added atomically as each dataset/variable is written
+    rows = _write_psa_user_export(
+        nsem_psa_user_export, geos.GEOSGeometry(tile_wkt), tile_path,
+        progress_share=PSA_USER_EXPORT_PHASE_PROGRESS[NsemPsaUserExport.PHASE_WRITE] / tile_count)
+
+    with open(_psa_user_export_tile_rows_path(nsem_psa_user_export, tile_index), 'w') as fh:
+        fh.write(str(rows))
+
+
+@app.task(**PSA_USER_EXPORT_TASK_ARGS)
+def merge_psa_user_export_tiles_task(nsem_psa_user_export_id: int):
+    """
+    Merges the partial files of every tile of a large export and completes the export
+    """
+
+    nsem_psa_user_export = get_object_or_404(NsemPsaUserExport, id=nsem_psa_user_export_id)
+
+    tmp_user_export_path = _psa_user_export_path(nsem_psa_user_export)
+    tiles_path = _psa_user_export_tile_path(nsem_psa_user_export)
+
+    # create temporary directory (replacing any merged files from a previous attempt)
+    create_directory(tmp_user_export_path, remove_if_exists=True)
+
+    tile_paths = [os.path.join(tiles_path, tile) for tile in os.listdir(tiles_path) if os.path.isdir(os.path.join(tiles_path, tile))]
+
+    # total the tiles' row counts since retried tiles added their rows to the running count more than once
+    rows = 0
+    for tile_index in range(len(tile_paths)):
+        with open(_psa_user_export_tile_rows_path(nsem_psa_user_export, tile_index)) as fh:
+            rows += int(fh.read())
+
+    # the tiles were written in parallel so time them together from when the first one started
+    _complete_psa_user_export_phase(
+        nsem_psa_user_export.id, NsemPsaUserExport.PHASE_WRITE, nsem_psa_user_export.date_started.timestamp(), rows_processed=rows)
+
+    started = _start_psa_user_export_phase(nsem_psa_user_export.id, NsemPsaUserExport.PHASE_MERGE)
+    _merge_psa_user_export_tiles(nsem_psa_user_export, tile_paths, tmp_user_export_path)
+    _complete_psa_user_export_phase(nsem_psa_user_export.id, NsemPsaUserExport.PHASE_MERGE, started)
+
+    # remove temporary tiles directory
+    shutil.rmtree(tiles_path)
+
+    _complete_psa_user_export(nsem_psa_user_export, tmp_user_export_path)
+
+
+def reuse_psa_user_export(nsem_psa_user_export: NsemPsaUserExport, source: NsemPsaUserExport):
+    """
+    Attaches an export to an identical export's results, which are copied now if the identical export is complete
+    """
+    nsem_psa_user_export.reused_from = source
+    if source.date_completed:
+        nsem_psa_user_export.success = source.success
+        nsem_psa_user_export.exception = source.exception
+        nsem_psa_user_export.date_expires = source.date_expires
+        nsem_psa_user_export.date_completed = pytz.utc.localize(datetime.utcnow())
+        if source.success:
+            # fresh pre-signed url for the existing object which is valid until the source export expires
+            expires_in = int((source.date_expires - nsem_psa_user_export.date_completed).total_seconds())
+            nsem_psa_user_export.url = S3ObjectStoragePrivate().presigned_url(source.s3_key, expires_in=expires_in)
+    nsem_psa_user_export.save()
+
+
+def start_psa_user_export(nsem_psa_user_export: NsemPsaUserExport):
+    """
+    Creates tasks to build the export and email the user when complete
+    """
+    tiles = get_psa_user_export_tiles(nsem_psa_user_export)
+
+    # record the failure (i.e a tile failed so the merge never runs) rather than leaving the export in progress.
+    # the errback is immutable since a chord only sends its body's task id to the body's errbacks when a header task fails
+    errback = fail_psa_user_export_task.si(nsem_psa_user_export_id=nsem_psa_user_export.id)
+
+    if len(tiles) > 1:
+        chain(
+            # build large exports in parallel by tile and then merge them
+            chord(
+                header=[
+                    create_psa_user_export_tile_task.si(nsem_psa_user_export.id, tile_index, len(tiles), tile.ewkt)
+                    for tile_index, tile in enumerate(tiles)
+                ],
+                body=merge_psa_user_export_tiles_task.si(nsem_psa_user_export_id=nsem_psa_user_export.id),
+            ),
+            email_psa_user_export_task.si(nsem_psa_user_export_id=nsem_psa_user_export.id),
+        ).on_error(errback).apply_async()
+    else:
+        chain(
+            create_psa_user_export_task.s(nsem_psa_user_export_id=nsem_psa_user_export.id),
+            email_psa_user_export_task.si(nsem_psa_user_export_id=nsem_psa_user_export.id),
+        ).on_error(errback).apply_async()
+
+
+@app.task(**TASK_ARGS_RETRY)
+def fail_psa_user_export_task(nsem_psa_user_export_id: int):
+    """
+    Errback which completes an export (and its attached exports) as unsuccessful and emails the user.
+    The failing task logs its own exception.
+    """
+    nsem_psa_user_export = get_object_or_404(NsemPsaUserExport, id=nsem_psa_user_export_id)
+
+    # the export already completed (i.e the email failed)
+    if nsem_psa_user_export.date_completed:
+        return
+
+    exception = 'The export failed'
+    if nsem_psa_user_export.phase:
+        exception += ' during the {} phase'.format(nsem_psa_user_export.phase)
+    logger.error('Export {}: {}'.format(nsem_psa_user_export, exception))
+
+    nsem_psa_user_export.exception = exception
+    nsem_psa_user_export.phase = None
+    nsem_psa_user_export.date_completed = timezone.now()
+    nsem_psa_user_export.save()
+
+    complete_reused_psa_user_exports(nsem_psa_user_export)
+    email_psa_user_export_task.delay(nsem_psa_user_export_id=nsem_psa_user_export.id)
+
+
+@app.task(**TASK_ARGS_RETRY)
+def restart_stale_psa_user_export_task(nsem_psa_user_export_id: int):
+    """
+    Creates an attached export on its own when the export it's attached to timed out (i.e its task died)
+    """
+    nsem_psa_user_export = get_object_or_404(NsemPsaUserExport, id=nsem_psa_user_export_id)
+    reused_from = nsem_psa_user_export.reused_from
+
+    # already completed along with the export it was attached to
+    if nsem_psa_user_export.date_completed or (reused_from and reused_from.date_completed):
+        return
+
+    logger.warning('Restarting export {} since the export it was attached to ({}) timed out'.format(nsem_psa_user_export, reused_from))
+
+    nsem_psa_user_export.reused_from = None
+    nsem_psa_user_export.save()
+    start_psa_user_export(nsem_psa_user_export)
+
+
+def complete_reused_psa_user_exports(nsem_psa_user_export: NsemPsaUserExport):
+    """
+    Completes and emails the identical exports that attached to this export while it was in progress
+    """
+    for reused_export in nsem_psa_user_export.reused_by.filter(date_completed__isnull=True):
+        reuse_psa_user_export(reused_export, nsem_psa_user_export)
+        email_psa_user_export_task.delay(nsem_psa_user_export_id=reused_export.id)
+
 
 @app.task(**TASK_ARGS_RETRY)
 def email_psa_user_export_task(nsem_psa_user_export_id: int):
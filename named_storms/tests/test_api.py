@@ -1,7 +1,27 @@
+import csv
+import io
+import json
+from unittest import mock
+import pyarrow as pa
+import pyarrow.parquet as pq
+import xarray as xr
+
+from django.contrib.auth.models import User
+from django.contrib.gis import geos
+from django.contrib.gis.db.models.functions import Distance
+from django.core.cache import cache
 from django.urls import reverse
-from rest_framework.status import HTTP_403_FORBIDDEN, HTTP_200_OK
+from rest_framework.renderers import JSONRenderer
+from rest_framework.status import HTTP_403_FORBIDDEN, HTTP_200_OK, HTTP_400_BAD_REQUEST, HTTP_429_TOO_MANY_REQUESTS
 
 from coastal_act.models import CoastalActProject
+from cwwed.api.parsers import ORJSONParser
+from cwwed.api.renderers import ORJSONRenderer
+from named_storms.api.serializers import NsemPsaDataSerializer, NsemPsaTimeSeriesSerializer, NsemPsaTimeSeriesBatchSerializer
+from named_storms.api.throttles import NsemPsaTimeSeriesBatchAnonRateThrottle
+from named_storms.api.viewsets import NsemPsaDataViewSet, NsemPsaTimeSeriesViewSet
+from named_storms.models import NsemPsaData, NsemPsaVariable
+from named_storms.sql import transect_length_query, transect_points_count
 from named_storms.tests.base import BaseTest
 
 
@@ -64,3 +84,265 @@ class ApiPermissionTestCase(BaseTest):
         # patch
         result = self.client.patch(reverse('nsempsa-detail', args=[self.named_storm.nsempsa_set.first().id]))
         self.assertEqual(result.status_code, HTTP_403_FORBIDDEN)
+
+
+class ApiRendererTestCase(BaseTest):
+
+    def test_orjson_renderer(self):
+        # the fast renderer should be interchangeable with drf's standard library renderer
+        for url in [reverse('namedstorm-list'), reverse('covereddata-list'), reverse('nsempsa-list')]:
+            result = self.client.get(url)
+            self.assertEqual(result.status_code, HTTP_200_OK)
+            self.assertEqual(result['Content-Type'], 'application/json')
+            self.assertEqual(json.loads(result.content), json.loads(JSONRenderer().render(result.data)))
+
+    def test_orjson_parser(self):
+        data = {'name': 'Sandy', 'values': [1, 2.5, None], 'nested': {'date': '2012-10-29T13:00:00Z'}}
+        self.assertEqual(ORJSONParser().parse(io.BytesIO(json.dumps(data).encode())), data)
+
+
+class ApiSerializationParityTestCase(BaseTest):
+    """
+    The raw value fast paths should produce the same output as the previous model/serializer implementations
+    """
+
+    def test_psa_data(self):
+        variable = self.nsem_psa.nsempsavariable_set.filter(data_type=NsemPsaVariable.DATA_TYPE_MAX_VALUES).first() or \
+            self.nsem_psa.nsempsavariable_set.first()
+        limit = 20
+
+        url = reverse('psa-wind-barb-geojson', args=[self.named_storm.id])
+        result = self.client.get(url, {'nsem_psa_variable': variable.name, 'limit': limit})
+        self.assertEqual(result.status_code, HTTP_200_OK)
+        self.assertTrue(result.data['results'])
+
+        # previous implementation: model instances through the model serializer
+        queryset = NsemPsaData.objects.filter(
+            storm_name=self.named_storm.name, nsem_psa_variable=variable,
+        ).order_by('nsem_psa_variable_id', 'date', 'id')[:limit]
+        expected = NsemPsaDataSerializer(queryset, many=True).data
+
+        renderer = ORJSONRenderer()
+        self.assertEqual(renderer.render(result.data['results']), renderer.render(expected))
+
+    def test_time_series(self):
+        variables = [
+            v for v in self.nsem_psa.nsempsavariable_set.all()
+            if v.data_type == NsemPsaVariable.DATA_TYPE_TIME_SERIES and v.geo_type == NsemPsaVariable.GEO_TYPE_POLYGON
+        ]
+        self.assertTrue(variables)
+        data = NsemPsaData.objects.filter(storm_name=self.named_storm.name, nsem_psa_variable=variables[0]).first()
+        lat, lon = '{:.6f}'.format(data.point.y), '{:.6f}'.format(data.point.x)
+        url = '/api/named-storm/{}/psa/data/time-series/{}/{}/'.format(self.named_storm.id, lat, lon)
+
+        expected = self._legacy_time_series(geos.Point(x=float(lon), y=float(lat), srid=4326), variables)
+
+        # json
+        result = self.client.get(url)
+        self.assertEqual(result.status_code, HTTP_200_OK)
+        self.assertEqual(result.content, ORJSONRenderer().render(NsemPsaTimeSeriesSerializer(expected, many=True).data))
+
+        # csv
+        result = self.client.get(url, {'export': 'csv'})
+        self.assertEqual(result.status_code, HTTP_200_OK)
+        content = io.StringIO()
+        writer = csv.writer(content)
+        writer.writerow(['date', 'lat', 'lon', 'name', 'units', 'value'])
+        for r in expected:
+            for i, value in enumerate(r['values']):
+                writer.writerow([self.nsem_psa.dates[i], float(lat), float(lon), r['variable'].name, r['variable'].units, value])
+        self.assertEqual(result.content.decode(), content.getvalue())
+
+    def test_point_ewkt(self):
+        # the formatted coordinates should match geos' representation of the stored points
+        for data in NsemPsaData.objects.filter(storm_name=self.named_storm.name)[:100]:
+            self.assertEqual(NsemPsaDataViewSet._point_ewkt(data.point.x, data.point.y), str(data.point))
+
+    def _legacy_time_series(self, point: geos.Point, variables: list) -> list:
+        # the time series implementation prior to aligning the values through a date index
+        fields_order = ['nsem_psa_variable__name', 'date']
+        fields_values = ('nsem_psa_variable__name', 'value', 'date')
+        time_series_query = list(NsemPsaData.objects.annotate(
+            distance=Distance('point', point),
+        ).distinct(
+            *fields_order
+        ).filter(
+            point__dwithin=(point, NsemPsaTimeSeriesViewSet.POINT_DISTANCE),
+            nsem_psa_variable__nsem=self.nsem_psa,
+            storm_name=self.named_storm.name,
+        ).order_by(
+            *fields_order + ['distance']
+        ).values(
+            *fields_values
+        ))
+        results = []
+        for variable in variables:
+            values = []
+            for date in self.nsem_psa.dates:
+                value = next((v['value'] for v in time_series_query if v['nsem_psa_variable__name'] == variable.name and v['date'] == date), 0)
+                values.append(value)
+            results.append({'variable': variable, 'values': values})
+        return results
+
+
+class TimeSeriesBatchTestCase(BaseTest):
+
+    def setUp(self):
+        super().setUp()
+        self.url = reverse('psa-time-series-batch', args=[self.named_storm.id])
+        self.variables = [
+            v for v in self.nsem_psa.nsempsavariable_set.all()
+            if v.data_type == NsemPsaVariable.DATA_TYPE_TIME_SERIES and v.geo_type == NsemPsaVariable.GEO_TYPE_POLYGON
+        ]
+        data = NsemPsaData.objects.filter(storm_name=self.named_storm.name, nsem_psa_variable=self.variables[0]).first()
+        self.point = {'lat': data.point.y, 'lon': data.point.x}
+        # reset the anonymous throttle's history for the test client
+        cache.delete('throttle_{}_127.0.0.1'.format(NsemPsaTimeSeriesBatchAnonRateThrottle.scope))
+
+    @mock.patch.dict(NsemPsaTimeSeriesBatchAnonRateThrottle.THROTTLE_RATES, {NsemPsaTimeSeriesBatchAnonRateThrottle.scope: '1/minute'})
+    def test_throttle(self):
+        result = self.client.post(self.url, {'points': [self.point]}, content_type='application/json')
+        self.assertEqual(result.status_code, HTTP_200_OK)
+
+        # anonymous users are throttled
+        result = self.client.post(self.url, {'points': [self.point]}, content_type='application/json')
+        self.assertEqual(result.status_code, HTTP_429_TOO_MANY_REQUESTS)
+
+        # authenticated users aren't
+        self.client.force_login(User.objects.create(username='batch'))
+        result = self.client.post(self.url, {'points': [self.point]}, content_type='application/json')
+        self.assertEqual(result.status_code, HTTP_200_OK)
+
+    def test_points(self):
+        # anonymous users are allowed
+        result = self.client.post(self.url, {'points': [self.point, self.point]}, content_type='application/json')
+        self.assertEqual(result.status_code, HTTP_200_OK)
+        self.assertEqual(len(result.data['points']), 2)
+        self.assertEqual(len(result.data['variables']), len(self.variables))
+        self.assertEqual(len(result.data['values']), 2)
+        self.assertEqual(len(result.data['values'][0]), len(self.variables))
+        self.assertEqual(len(result.data['values'][0][0]), len(self.nsem_psa.dates))
+        # identical points have identical values which were found near the point
+        self.assertEqual(result.data['values'][0], result.data['values'][1])
+        self.assertTrue(any(any(values) for values in result.data['values'][0]))
+
+    def test_line(self):
+        line = 'LINESTRING ({lon} {lat}, {lon2} {lat})'.format(lon=self.point['lon'], lon2=self.point['lon'] + .01, lat=self.point['lat'])
+        result = self.client.post(self.url, {'line': line, 'spacing': 100}, content_type='application/json')
+        self.assertEqual(result.status_code, HTTP_200_OK)
+        # sampled every 100 meters including both ends
+        self.assertEqual(len(result.data['points']), transect_points_count(transect_length_query(geos.GEOSGeometry(line, srid=4326)), 100))
+        self.assertGreater(len(result.data['points']), 2)
+        self.assertEqual(result.data['points'][0], [self.point['lat'], self.point['lon']])
+        self.assertEqual(len(result.data['values']), len(result.data['points']))
+
+    def test_export_csv(self):
+        result = self.client.post(self.url, {'points': [self.point], 'export': 'csv'}, content_type='application/json')
+        self.assertEqual(result.status_code, HTTP_200_OK)
+        self.assertEqual(result['Content-Type'], 'text/csv')
+        rows = list(csv.reader(io.StringIO(result.content.decode())))
+        self.assertEqual(rows[0], ['date', 'lat', 'lon', 'name', 'units', 'value'])
+        self.assertEqual(len(rows) - 1, len(self.variables) * len(self.nsem_psa.dates))
+
+    def test_export_netcdf(self):
+        result = self.client.post(self.url, {'points': [self.point, self.point], 'export': 'netcdf'}, content_type='application/json')
+        self.assertEqual(result.status_code, HTTP_200_OK)
+        self.assertEqual(result['Content-Type'], 'application/x-netcdf')
+        ds = xr.open_dataset(io.BytesIO(result.content))
+        self.assertEqual(set(ds.data_vars), {v.name for v in self.variables})
+        self.assertEqual(dict(ds.dims), {'point': 2, 'time': len(self.nsem_psa.dates)})
+
+    def test_validation(self):
+        invalid = [
+            # neither or both of points and line
+            {},
+            {'points': [self.point], 'line': 'LINESTRING (0 0, 1 1)', 'spacing': 100},
+            # invalid points
+            {'points': [{'lat': 91, 'lon': 0}]},
+            {'points': [self.point] * (NsemPsaTimeSeriesBatchSerializer.MAX_POINTS + 1)},
+            # invalid line
+            {'line': 'POINT (0 0)', 'spacing': 100},
+            {'line': 'not wkt', 'spacing': 100},
+            {'line': 'LINESTRING (0 0, 1 1)'},
+            # too many points along the line (~157km every 100 meters)
+            {'line': 'LINESTRING (0 0, 1 1)', 'spacing': 100},
+            # invalid export
+            {'points': [self.point], 'export': 'shapefile'},
+        ]
+        for data in invalid:
+            result = self.client.post(self.url, data, content_type='application/json')
+            self.assertEqual(result.status_code, HTTP_400_BAD_REQUEST, data)
+
+    def test_transect_points_count(self):
+        self.assertEqual(transect_points_count(0, 100), 1)
+        self.assertEqual(transect_points_count(50, 100), 2)
+        self.assertEqual(transect_points_count(200, 100), 3)
+        self.assertEqual(transect_points_count(250, 100), 4)
+
+
+class ApiColumnarTestCase(BaseTest):
+    """
+    Arrow and Parquet formats should round trip the same values as the json output
+    """
+    FORMATS = ('arrow', 'parquet')
+
+    def setUp(self):
+        super().setUp()
+        self.variables = [
+            v for v in self.nsem_psa.nsempsavariable_set.all()
+            if v.data_type == NsemPsaVariable.DATA_TYPE_TIME_SERIES and v.geo_type == NsemPsaVariable.GEO_TYPE_POLYGON
+        ]
+        data = NsemPsaData.objects.filter(storm_name=self.named_storm.name, nsem_psa_variable=self.variables[0]).first()
+        self.point = {'lat': round(data.point.y, 6), 'lon': round(data.point.x, 6)}
+
+    def test_time_series(self):
+        url = '/api/named-storm/{}/psa/data/time-series/{}/{}/'.format(self.named_storm.id, self.point['lat'], self.point['lon'])
+        expected = self.client.get(url).data
+        for fmt in self.FORMATS:
+            table = self._read_table(self.client.get(url, {'format': fmt}), fmt)
+            self.assertEqual(table.column_names, ['lon', 'lat', 'date', 'variable', 'value'])
+            self.assertEqual(set(table.column('lon').to_pylist()), {self.point['lon']})
+            self.assertEqual(table.column('date').to_pylist(), self.nsem_psa.dates * len(expected))
+            self.assertEqual(table.column('variable').to_pylist(), [r['variable']['name'] for r in expected for _ in self.nsem_psa.dates])
+            self.assertEqual(table.column('value').to_pylist(), [v for r in expected for v in r['values']])
+
+    def test_time_series_batch(self):
+        url = reverse('psa-time-series-batch', args=[self.named_storm.id])
+        points = [self.point, {'lat': self.point['lat'] + .001, 'lon': self.point['lon']}]
+        expected = self.client.post(url, {'points': points}, content_type='application/json').data
+        for fmt in self.FORMATS:
+            table = self._read_table(self.client.post('{}?format={}'.format(url, fmt), {'points': points}, content_type='application/json'), fmt)
+            size = len(self.variables) * len(self.nsem_psa.dates)
+            self.assertEqual(table.num_rows, len(points) * size)
+            self.assertEqual(table.column('lat').to_pylist(), [p['lat'] for p in points for _ in range(size)])
+            self.assertEqual(table.column('date').to_pylist(), self.nsem_psa.dates * (len(points) * len(self.variables)))
+            self.assertEqual(table.column('value').to_pylist(), [v for point in expected['values'] for values in point for v in values])
+
+    def test_data(self):
+        variable = self.variables[0]
+        url = reverse('psa-wind-barb-geojson', args=[self.named_storm.id])
+        expected = NsemPsaData.objects.filter(
+            storm_name=self.named_storm.name, nsem_psa_variable=variable,
+        ).order_by('date', 'id').values_list('date', 'value')
+        limit = max(len(expected) // 3, 1) | 1
+        for fmt in self.FORMATS:
+            # follow the next page links
+            tables = []
+            params = {'nsem_psa_variable': variable.name, 'limit': limit, 'format': fmt}
+            while url:
+                result = self.client.get(url, params)
+                tables.append(self._read_table(result, fmt))
+                self.assertLessEqual(tables[-1].num_rows, limit)
+                url = result['Link'][1:result['Link'].index('>')] if result.has_header('Link') else None
+                params = None
+            table = pa.concat_tables(tables)
+            self.assertEqual(set(table.column('variable').to_pylist()), {variable.name})
+            self.assertEqual(list(zip(table.column('date').to_pylist(), table.column('value').to_pylist())), list(expected))
+            url = reverse('psa-wind-barb-geojson', args=[self.named_storm.id])
+
+    def _read_table(self, result, fmt: str) -> pa.Table:
+        self.assertEqual(result.status_code, HTTP_200_OK)
+        content = b''.join(result.streaming_content)
+        if fmt == 'parquet':
+            return pq.read_table(io.BytesIO(content))
+        return pa.ipc.open_stream(content).read_all()
@@ -0,0 +1,55 @@
+import io
+import os
+import shutil
+import tempfile
+from unittest import skipUnless
+from django.test import TestCase, override_settings
+
+from named_storms.archive import (
+    ArchiveWriter, CODEC_GZIP, CODEC_PIGZ, CODEC_ZSTD, CODEC_STORE, get_archive_codec, get_archive_extension, write_archive, extract_archive,
+)
+
+
+@override_settings(CWWED_ARCHIVE_CODEC=CODEC_PIGZ)
+class ArchiveTestCase(TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.directory = tempfile.mkdtemp()
+        with open(os.path.join(self.directory, 'data.txt'), 'w') as f:
+            f.write('water level\n' * 1000)
+
+    def test_codec_policy(self):
+        # compressible payload uses the configured codec
+        self.assertEqual(get_archive_codec(self.directory), CODEC_PIGZ)
+
+        # already-compressed payload is stored
+        with open(os.path.join(self.directory, 'data.gz'), 'wb') as f:
+            f.write(os.urandom(200000))
+        self.assertEqual(get_archive_codec(self.directory), CODEC_STORE)
+
+    def test_round_trip(self):
+        for codec in (CODEC_GZIP, CODEC_PIGZ, CODEC_ZSTD, CODEC_STORE):
+            archive_path = os.path.join(tempfile.mkdtemp(), 'archive.{}'.format(get_archive_extension(codec)))
+            write_archive(self.directory, 'data', archive_path, codec)
+
+            # the reader detects the codec
+            output_path = tempfile.mkdtemp()
+            extract_archive(archive_path, output_path)
+            with open(os.path.join(output_path, 'data', 'data.txt')) as f:
+                self.assertEqual(f.read(), 'water level\n' * 1000, codec)
+
+    @skipUnless(shutil.which('pigz'), 'pigz is not installed')
+    def test_pigz_write_failure(self):
+
+        class FailingFile(io.BytesIO):
+            def write(self, data):
+                raise OSError('disk full')
+
+        # more than a pipe's buffer so pigz would block if its output wasn't being read
+        with open(os.path.join(self.directory, 'data.bin'), 'wb') as f:
+            f.write(os.urandom(1024 * 1024 * 4))
+
+        with self.assertRaisesRegex(OSError, 'disk full'):
+            with ArchiveWriter(FailingFile(), CODEC_PIGZ) as writer:
+                writer.add(self.directory, arcname='data')
@@ -0,0 +1,63 @@
+from unittest import mock
+from django.core.cache import cache
+from django.test import override_settings
+
+from named_storms.cache import get_psa_current, invalidate_psa_current, is_psa_processed, CACHE_KEY_PSA_CURRENT_GENERATION
+from named_storms.models import NsemPsa
+from named_storms.tests.base import BaseTest
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class PsaCurrentCacheTestCase(BaseTest):
+
+    def setUp(self):
+        super().setUp()
+        invalidate_psa_current()
+        # the test case's transaction never commits so run the signals' on_commit callbacks immediately
+        patcher = mock.patch('named_storms.signals.transaction.on_commit', side_effect=lambda fn: fn())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_psa_current(self):
+        psa_current = get_psa_current(self.named_storm.id)
+        self.assertEqual(psa_current.storm, self.named_storm)
+        self.assertEqual(psa_current.nsem, self.nsem_psa)
+        self.assertEqual(len(psa_current.variables), self.nsem_psa.nsempsavariable_set.count())
+
+        # cached results shouldn't touch the database
+        with self.assertNumQueries(0):
+            self.assertEqual(get_psa_current(self.named_storm.id), psa_current)
+
+    def test_psa_current_invalidation(self):
+        self.assertEqual(get_psa_current(self.named_storm.id).nsem, self.nsem_psa)
+        generation = cache.get(CACHE_KEY_PSA_CURRENT_GENERATION)
+
+        # saving without changing the psa's validity keeps the cache
+        self.nsem_psa.save()
+        self.assertEqual(cache.get(CACHE_KEY_PSA_CURRENT_GENERATION), generation)
+
+        # flagging the psa as unprocessed invalidates the cache through the signals
+        self.nsem_psa.processed = False
+        self.nsem_psa.save()
+        self.assertNotEqual(cache.get(CACHE_KEY_PSA_CURRENT_GENERATION), generation)
+
+        psa_current = get_psa_current(self.named_storm.id)
+        self.assertEqual(psa_current.nsem if psa_current else None, NsemPsa.get_last_valid_psa(self.named_storm.id))
+
+    def test_psa_variable_invalidation(self):
+        variable = self.nsem_psa.nsempsavariable_set.first()
+        self.assertTrue(is_psa_processed(self.nsem_psa.id))
+        generation = cache.get(CACHE_KEY_PSA_CURRENT_GENERATION)
+
+        # the processed check is cached so saving only runs the update
+        variable = type(variable).objects.get(id=variable.id)
+        with self.assertNumQueries(1):
+            variable.save()
+        self.assertNotEqual(cache.get(CACHE_KEY_PSA_CURRENT_GENERATION), generation)
+
+        # variables of unprocessed psas don't invalidate the cache
+        NsemPsa.objects.filter(id=self.nsem_psa.id).update(processed=False)
+        invalidate_psa_current()
+        generation = cache.get(CACHE_KEY_PSA_CURRENT_GENERATION)
+        variable.save()
+        self.assertEqual(cache.get(CACHE_KEY_PSA_CURRENT_GENERATION), generation)
@@ -0,0 +1,157 @@
+import os
+import tempfile
+from io import StringIO
+from unittest import mock
+from celery.exceptions import TimeoutError
+from django.core.management import call_command, CommandError
+from django.test import override_settings
+
+from named_storms.data.processors import ProcessorData
+from named_storms.models import CoveredDataProvider, NamedStormCoveredData, NamedStormCoveredDataLog
+from named_storms.tasks import collect_covered_data_provider_task, process_covered_data_dataset_chord_task
+from named_storms.tests.base import BaseTest
+from named_storms.utils import create_directory, named_storm_covered_data_current_path_root, named_storm_covered_data_incomplete_path
+
+
+class FakeFactory:
+    """
+    Factory which returns a processor for each of its urls or fails if they aren't defined
+    """
+    urls = None
+
+    def __init__(self, named_storm, provider):
+        self.named_storm = named_storm
+        self.provider = provider
+
+    def processors_data(self):
+        if self.urls is None:
+            raise Exception('factory failure')
+        return [ProcessorData(self.named_storm.id, self.provider.id, url) for url in self.urls]
+
+
+class BrokenFactory(FakeFactory):
+    def __init__(self, named_storm, provider):
+        raise Exception('factory construction failure')
+
+
+def fake_factory(urls=None):
+    return type('FakeFactory', (FakeFactory,), {'urls': urls})
+
+
+def fake_process(data):
+    if 'fail' in data.url:
+        raise Exception('dataset failure')
+    return {'url': data.url}
+
+
+@override_settings(CWWED_DATA_DIR=tempfile.mkdtemp())
+@mock.patch('named_storms.tasks.archive_named_storm_covered_data_task')
+@mock.patch('named_storms.tasks._process_covered_data_dataset', side_effect=fake_process)
+@mock.patch.object(process_covered_data_dataset_chord_task, 'max_retries', 0)
+class CollectCoveredDataTestCase(BaseTest):
+    """
+    Runs the provider fallback DAG eagerly
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.storm_covered_data = NamedStormCoveredData.objects.filter(named_storm=self.named_storm).first()
+        self.covered_data = self.storm_covered_data.covered_data
+        self.storm_covered_data.date_collected = None
+        self.storm_covered_data.save()
+
+        self.provider = self.covered_data.covereddataprovider_set.first()
+        self.provider_fallback = CoveredDataProvider.objects.get(pk=self.provider.pk)
+        self.provider_fallback.pk = None
+        self.provider_fallback.name = 'Fallback'
+        self.provider_fallback.save()
+
+        self.complete_path = named_storm_covered_data_current_path_root(self.named_storm)
+        create_directory(self.complete_path, remove_if_exists=True)
+        create_directory(os.path.join(named_storm_covered_data_incomplete_path(self.named_storm), self.covered_data.name), remove_if_exists=True)
+
+    def _collect(self, factories):
+        with mock.patch('named_storms.tasks.processor_factory_class', side_effect=lambda provider: factories[provider.id]):
+            return collect_covered_data_provider_task.apply(
+                args=(self.named_storm.id, self.covered_data.id, [self.provider.id, self.provider_fallback.id])).get()
+
+    def _logs(self):
+        return list(NamedStormCoveredDataLog.objects.filter(covered_data=self.covered_data).order_by('id').values_list(
+            'provider_id', 'success'))
+
+    def _assert_collected(self):
+        self.assertTrue(os.path.exists(os.path.join(self.complete_path, self.covered_data.name)))
+        self.storm_covered_data.refresh_from_db()
+        self.assertIsNotNone(self.storm_covered_data.date_collected)
+
+    def test_success(self, *mocks):
+        archive_task = mocks[-1]
+        self.assertTrue(self._collect({
+            self.provider.id: fake_factory(['http://success/1', 'http://fail/2']),
+            self.provider_fallback.id: fake_factory(),
+        }))
+        # a partial failure still succeeds
+        self.assertEqual(self._logs(), [(self.provider.id, True)])
+        self._assert_collected()
+        archive_task.delay.assert_called_once()
+
+    def test_factory_failure(self, *mocks):
+        self.assertTrue(self._collect({
+            self.provider.id: fake_factory(),
+            self.provider_fallback.id: fake_factory(['http://success/1']),
+        }))
+        self.assertEqual(self._logs(), [(self.provider.id, False), (self.provider_fallback.id, True)])
+        self.assertEqual(NamedStormCoveredDataLog.objects.get(provider=self.provider).exception, 'factory failure')
+        self._assert_collected()
+
+    def test_factory_construction_failure(self, *mocks):
+        self.assertTrue(self._collect({
+            self.provider.id: BrokenFactory,
+            self.provider_fallback.id: fake_factory(['http://success/1']),
+        }))
+        self.assertEqual(self._logs(), [(self.provider.id, False), (self.provider_fallback.id, True)])
+        self.assertEqual(NamedStormCoveredDataLog.objects.get(provider=self.provider).exception, 'factory construction failure')
+        self._assert_collected()
+
+    def test_no_data(self, *mocks):
+        self.assertTrue(self._collect({
+            self.provider.id: fake_factory([]),
+            self.provider_fallback.id: fake_factory(['http://success/1']),
+        }))
+        self.assertEqual(self._logs(), [(self.provider.id, False), (self.provider_fallback.id, True)])
+        self._assert_collected()
+
+    def test_all_datasets_failed(self, *mocks):
+        self.assertTrue(self._collect({
+            self.provider.id: fake_factory(['http://fail/1', 'http://fail/2']),
+            self.provider_fallback.id: fake_factory(['http://success/1']),
+        }))
+        self.assertEqual(self._logs(), [(self.provider.id, False), (self.provider_fallback.id, True)])
+        self._assert_collected()
+
+    def test_move_failure(self, *mocks):
+        archive_task = mocks[-1]
+        # nothing was written to the incomplete path
+        os.rmdir(os.path.join(named_storm_covered_data_incomplete_path(self.named_storm), self.covered_data.name))
+
+        # every provider is exhausted
+        self.assertFalse(self._collect({
+            self.provider.id: fake_factory(['http://success/1']),
+            self.provider_fallback.id: fake_factory(['http://success/1']),
+        }))
+        self.assertEqual(self._logs(), [(self.provider.id, False), (self.provider_fallback.id, False)])
+        archive_task.delay.assert_not_called()
+
+
+class CollectCoveredDataCommandTestCase(BaseTest):
+
+    @mock.patch('named_storms.management.commands.collect_covered_data.create_directory')
+    @mock.patch('named_storms.management.commands.collect_covered_data.chain')
+    def test_wait_timeout(self, chain, create_directory):
+        chain.return_value.apply_async.return_value.get.side_effect = TimeoutError()
+        NamedStormCoveredData.objects.filter(named_storm=self.named_storm).update(date_collected=None)
+
+        # the collection never finished (i.e a worker died) so the wait gives up instead of hanging
+        with self.assertRaises(CommandError):
+            call_command('collect_covered_data', storm_id=self.named_storm.id, wait=True, stdout=StringIO())
+        self.assertIsNotNone(chain.return_value.apply_async.return_value.get.call_args[1]['timeout'])
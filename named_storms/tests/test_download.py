@@ -0,0 +1,155 @@
+import os
+import json
+import hashlib
+import tempfile
+from unittest import mock
+import requests
+from django.test import TestCase
+
+from named_storms.data.download import download, DownloadError
+
+URL = 'https://example.com/data.nc'
+
+
+class DownloadTestCase(TestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.path = os.path.join(tempfile.mkdtemp(), 'data.nc')
+        self.session = mock.MagicMock()
+        patcher = mock.patch('named_storms.data.download.shared_session', return_value=self.session)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = mock.patch('named_storms.data.download.time.sleep')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _response(self, status_code: int, content: bytes, headers: dict = None):
+        response = mock.MagicMock(status_code=status_code, headers=dict({'Content-Length': str(len(content))}, **(headers or {})))
+        response.iter_content.return_value = [content]
+        self.session.get.return_value.__enter__.return_value = response
+        return response
+
+    def _partial(self, content: bytes, validator: str = None):
+        # partial file (and the version it's from) from a previous attempt
+        with open(self.path, 'wb') as f:
+            f.write(content)
+        if validator:
+            with open('{}.json'.format(self.path), 'w') as f:
+                json.dump({'url': URL, 'validator': validator}, f)
+
+    def _content(self) -> bytes:
+        with open(self.path, 'rb') as f:
+            return f.read()
+
+    def test_resume(self):
+        self._partial(b'water', validator='"abc"')
+        self._response(requests.codes.partial_content, b' level')
+
+        result = download(URL, self.path, checksum='md5:{}'.format(hashlib.md5(b'water level').hexdigest()))
+
+        self.assertEqual(self.session.get.call_args[1]['headers'], {'Accept-Encoding': 'identity', 'Range': 'bytes=5-', 'If-Range': '"abc"'})
+        self.assertEqual(self._content(), b'water level')
+        self.assertEqual(result.bytes, 11)
+        self.assertEqual(result.bytes_downloaded, 6)
+        # the version isn't kept once the download is complete
+        self.assertFalse(os.path.exists('{}.json'.format(self.path)))
+
+    def test_resume_unknown_version(self):
+        # the partial file's version is unknown so it isn't resumed
+        self._partial(b'stale')
+        self._response(requests.codes.ok, b'water level')
+
+        download(URL, self.path)
+        self.assertEqual(self.session.get.call_args[1]['headers'], {'Accept-Encoding': 'identity'})
+        self.assertEqual(self._content(), b'water level')
+
+    def test_resume_changed(self):
+        self._partial(b'stale', validator='"old"')
+        # the file changed so the server ignores the range (or doesn't support ranges) and sends the whole file
+        self._response(requests.codes.ok, b'water level', headers={'ETag': '"new"'})
+
+        download(URL, self.path)
+        self.assertEqual(self._content(), b'water level')
+
+    @staticmethod
+    def _interrupted(**kwargs):
+        yield b'water'
+        raise requests.exceptions.ChunkedEncodingError()
+
+    def test_resume_interrupted(self):
+        response = mock.MagicMock(status_code=requests.codes.ok, headers={'Content-Length': '11', 'ETag': '"abc"'})
+        response.iter_content.side_effect = self._interrupted
+        response_resumed = mock.MagicMock(status_code=requests.codes.partial_content, headers={'Content-Length': '6'})
+        response_resumed.iter_content.return_value = [b' level']
+        self.session.get.return_value.__enter__.side_effect = [response, response_resumed]
+
+        download(URL, self.path, attempts=2)
+
+        # the second attempt only resumes the same version
+        self.assertEqual(self.session.get.call_args[1]['headers'], {'Accept-Encoding': 'identity', 'Range': 'bytes=5-', 'If-Range': '"abc"'})
+        self.assertEqual(self._content(), b'water level')
+
+    def test_encoded(self):
+        # the server encoded the response anyway so the written (decoded) bytes don't line up with its ranges
+        response = self._response(requests.codes.ok, b'water level', headers={'ETag': '"abc"', 'Content-Encoding': 'gzip'})
+        response.iter_content.side_effect = self._interrupted
+        with self.assertRaises(requests.exceptions.ChunkedEncodingError):
+            download(URL, self.path, attempts=1)
+
+        # the partial file isn't resumed
+        self.assertFalse(os.path.exists('{}.json'.format(self.path)))
+        self._response(requests.codes.ok, b'water level')
+        download(URL, self.path)
+        self.assertEqual(self.session.get.call_args[1]['headers'], {'Accept-Encoding': 'identity'})
+        self.assertEqual(self._content(), b'water level')
+
+    def test_range_not_satisfiable(self):
+        # the partial file is already complete
+        self._partial(b'water level', validator='"abc"')
+        self._response(requests.codes.requested_range_not_satisfiable, b'', headers={'Content-Range': 'bytes */11'})
+        download(URL, self.path)
+        self.assertEqual(self._content(), b'water level')
+
+        # the partial file doesn't match the size so it's removed to start over
+        self._partial(b'water', validator='"abc"')
+        with self.assertRaises(DownloadError):
+            download(URL, self.path, attempts=1)
+        self.assertFalse(os.path.exists(self.path))
+
+    def test_range_not_satisfiable_head(self):
+        # the size is verified using a HEAD request when the server doesn't include the Content-Range
+        self._partial(b'water', validator='"abc"')
+        self._response(requests.codes.requested_range_not_satisfiable, b'')
+        self.session.head.return_value = mock.MagicMock(headers={'Content-Length': '11'})
+
+        with self.assertRaises(DownloadError):
+            download(URL, self.path, attempts=1)
+        self.assertFalse(os.path.exists(self.path))
+
+    def test_checksum(self):
+        self._response(requests.codes.ok, b'water level')
+        with self.assertRaises(DownloadError):
+            download(URL, self.path, checksum='md5:bad')
+        # the corrupt file isn't kept to be resumed
+        self.assertFalse(os.path.exists(self.path))
+
+
+class FTPDownloadTestCase(TestCase):
+
+    @mock.patch('named_storms.data.download.ftplib.FTP')
+    def test_remote_shrank(self, ftp):
+        path = os.path.join(tempfile.mkdtemp(), 'data.nc')
+        # partial file from a larger version of the file
+        with open(path, 'wb') as f:
+            f.write(b'water level and more')
+
+        ftp.return_value.size.return_value = 11
+        ftp.return_value.retrbinary.side_effect = lambda cmd, callback, blocksize, rest: callback(b'water level')
+
+        download('ftp://example.com/data.nc', path, attempts=1)
+
+        # the download starts over
+        self.assertIsNone(ftp.return_value.retrbinary.call_args[1]['rest'])
+        with open(path, 'rb') as f:
+            self.assertEqual(f.read(), b'water level')
@@ -0,0 +1,369 @@
+import os
+import json
+import tempfile
+from datetime import timedelta
+from unittest import mock, skipUnless
+import fiona
+import numpy as np
+import pyarrow.parquet as pq
+import xarray as xr
+from django.contrib.auth.models import User
+from django.contrib.gis import geos
+from django.test import override_settings
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.status import HTTP_200_OK, HTTP_400_BAD_REQUEST
+
+from shapely import wkb
+from shapely.geometry import shape
+
+from named_storms.models import NsemPsaUserExport, NsemPsaVariable
+from named_storms.psa.exporter import (
+    write_points_geoparquet, write_contours_geoparquet, write_contours_shapefile, write_contours_geojson, write_points_vector, write_contours_vector,
+    DRIVER_FLATGEOBUF,
+)
+from named_storms.tasks import (
+    get_psa_user_export_tiles, restart_stale_psa_user_export_task, start_psa_user_export, _merge_psa_user_export_tiles,
+    create_psa_user_export_tile_task, merge_psa_user_export_tiles_task,
+    _psa_user_export_units,
+)
+from named_storms.tests.base import BaseTest
+
+
+class UserExportReuseTestCase(BaseTest):
+
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create(username='export')
+
+    def test_fingerprint(self):
+        export = self._create_export(NsemPsaUserExport.FORMAT_CSV, (-75, 40, -73, 41))
+
+        # negligible bbox differences are the same request
+        self.assertEqual(export.fingerprint, self._create_export(NsemPsaUserExport.FORMAT_CSV, (-75.000001, 40, -73, 41)).fingerprint)
+        # different format
+        self.assertNotEqual(export.fingerprint, self._create_export(NsemPsaUserExport.FORMAT_KML, (-75, 40, -73, 41)).fingerprint)
+        # different bbox
+        self.assertNotEqual(export.fingerprint, self._create_export(NsemPsaUserExport.FORMAT_CSV, (-75, 40, -74, 41)).fingerprint)
+        # different date
+        self.assertNotEqual(export.fingerprint, self._create_export(
+            NsemPsaUserExport.FORMAT_CSV, (-75, 40, -73, 41), date_filter=self.nsem_psa.dates[-1]).fingerprint)
+
+        # netcdf exports every date so the date filter is ignored
+        export = self._create_export(NsemPsaUserExport.FORMAT_NETCDF, (-75, 40, -73, 41))
+        self.assertEqual(export.fingerprint, self._create_export(
+            NsemPsaUserExport.FORMAT_NETCDF, (-75, 40, -73, 41), date_filter=self.nsem_psa.dates[-1]).fingerprint)
+
+    def test_reusable_export(self):
+        export = self._create_export(NsemPsaUserExport.FORMAT_CSV, (-75, 40, -73, 41))
+        request = self._create_export(NsemPsaUserExport.FORMAT_CSV, (-75, 40, -73, 41))
+
+        # in progress
+        self.assertEqual(request.get_reusable_export(), export)
+
+        # successful and unexpired
+        export.success = True
+        export.date_completed = timezone.now()
+        export.date_expires = timezone.now() + timedelta(days=1)
+        export.save()
+        self.assertEqual(request.get_reusable_export(), export)
+
+        # expired
+        export.date_expires = timezone.now() - timedelta(days=1)
+        export.save()
+        self.assertIsNone(request.get_reusable_export())
+
+    def test_reusable_export_timeout(self):
+        export = self._create_export(NsemPsaUserExport.FORMAT_CSV, (-75, 40, -73, 41))
+        request = self._create_export(NsemPsaUserExport.FORMAT_CSV, (-75, 40, -73, 41))
+
+        # an export which didn't complete within its timeout (i.e its task died) isn't reused
+        NsemPsaUserExport.objects.filter(id=export.id).update(date_created=timezone.now() - NsemPsaUserExport.get_timeout())
+        self.assertIsNone(request.get_reusable_export())
+
+        # unless it succeeded
+        NsemPsaUserExport.objects.filter(id=export.id).update(
+            success=True, date_completed=timezone.now(), date_expires=timezone.now() + timedelta(days=1))
+        self.assertEqual(request.get_reusable_export(), export)
+
+    @mock.patch('named_storms.tasks.start_psa_user_export')
+    def test_restart_stale_export(self, start_psa_user_export):
+        export = self._create_export(NsemPsaUserExport.FORMAT_CSV, (-75, 40, -73, 41))
+        request = self._create_export(NsemPsaUserExport.FORMAT_CSV, (-75, 40, -73, 41))
+        request.reused_from = export
+        request.save()
+
+        # the attached export is created on its own when the original never completed
+        restart_stale_psa_user_export_task(request.id)
+        request.refresh_from_db()
+        self.assertIsNone(request.reused_from)
+        start_psa_user_export.assert_called_once_with(request)
+
+        # nothing to restart when the original completed
+        start_psa_user_export.reset_mock()
+        request.reused_from = export
+        request.save()
+        NsemPsaUserExport.objects.filter(id=export.id).update(date_completed=timezone.now())
+        restart_stale_psa_user_export_task(request.id)
+        request.refresh_from_db()
+        self.assertEqual(request.reused_from, export)
+        start_psa_user_export.assert_not_called()
+
+    def test_eta(self):
+        export = self._create_export(NsemPsaUserExport.FORMAT_CSV, (-75, 40, -73, 41))
+
+        # not started
+        self.assertIsNone(export.eta)
+
+        # halfway after an hour
+        export.date_started = timezone.now() - timedelta(hours=1)
+        export.progress = 50
+        self.assertAlmostEqual(export.eta, export.date_started + timedelta(hours=2), delta=timedelta(seconds=5))
+
+        # completed
+        export.date_completed = timezone.now()
+        self.assertIsNone(export.eta)
+
+    def test_write_progress(self):
+        export = self._create_export(NsemPsaUserExport.FORMAT_CSV, (-75, 40, -73, 41))
+        rows = [0]
+
+        # progress and rows are recorded as each unit is written
+        units = _psa_user_export_units(export.id, ['a', 'b'], 80, lambda: rows[0])
+        for i, _ in enumerate(units):
+            rows[0] += 10
+            if i == 1:
+                export.refresh_from_db()
+                self.assertEqual(export.progress, 40)
+                self.assertEqual(export.rows_processed, 10)
+        export.refresh_from_db()
+        self.assertEqual(export.progress, 80)
+        self.assertEqual(export.rows_processed, 20)
+
+        # a retried write can't exceed the write phase's progress
+        for _ in _psa_user_export_units(export.id, ['a'], 80, lambda: rows[0]):
+            pass
+        export.refresh_from_db()
+        self.assertEqual(export.progress, 80)
+
+    def test_stats(self):
+        self.user.is_staff = True
+        self.user.save()
+        self.client.force_login(self.user)
+        url = reverse('nsempsauserexport-stats')
+
+        self.assertEqual(self.client.get(url).status_code, HTTP_200_OK)
+        self.assertEqual(self.client.get(url, {'days': 7}).status_code, HTTP_200_OK)
+        for days in ['abc', '-1', '0']:
+            self.assertEqual(self.client.get(url, {'days': days}).status_code, HTTP_400_BAD_REQUEST, days)
+
+    def _create_export(self, export_format: str, bbox: tuple, date_filter=None) -> NsemPsaUserExport:
+        return NsemPsaUserExport.objects.create(
+            nsem=self.nsem_psa,
+            user=self.user,
+            format=export_format,
+            bbox=geos.Polygon.from_bbox(bbox),
+            date_filter=date_filter or self.nsem_psa.dates[0],
+        )
+
+
+@override_settings(CWWED_PSA_USER_DATA_EXPORT_TILE_DEGREES=2)
+class UserExportTilesTestCase(BaseTest):
+
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create(username='export')
+
+    def test_tiles(self):
+        # small exports aren't tiled
+        export = self._create_export(NsemPsaUserExport.FORMAT_NETCDF, (-75, 40, -74, 41))
+        self.assertEqual(len(get_psa_user_export_tiles(export)), 1)
+
+        # large exports are tiled and the tiles cover the export's bbox
+        export = self._create_export(NsemPsaUserExport.FORMAT_NETCDF, (-80, 35, -75, 39))
+        tiles = get_psa_user_export_tiles(export)
+        self.assertEqual(len(tiles), 6)
+        self.assertAlmostEqual(sum(t.area for t in tiles), geos.Polygon.from_bbox((-80, 35, -75, 39)).area)
+
+        # formats which can't be merged aren't tiled
+        export = self._create_export(NsemPsaUserExport.FORMAT_KML, (-80, 35, -75, 39))
+        self.assertEqual(len(get_psa_user_export_tiles(export)), 1)
+
+    def test_merge_netcdf(self):
+        export = self._create_export(NsemPsaUserExport.FORMAT_NETCDF, (-80, 35, -75, 39))
+        dates = self.nsem_psa.naive_dates()[:2]
+        tile_paths = [tempfile.mkdtemp(), tempfile.mkdtemp()]
+
+        # the tiles share the node on their edge
+        for tile_path, lons in zip(tile_paths, [[-79, -78], [-78, -77]]):
+            xr.Dataset(
+                {'water_level': (['time', 'node'], np.ones((len(dates), 2)))},
+                coords={'time': dates, 'lon': (['node'], lons), 'lat': (['node'], [36, 36])},
+                attrs={'title': 'export'},
+            ).to_netcdf(os.path.join(tile_path, 'export.nc'))
+
+        output_path = tempfile.mkdtemp()
+        _merge_psa_user_export_tiles(export, tile_paths, output_path)
+
+        ds = xr.open_dataset(os.path.join(output_path, 'export.nc'))
+        self.assertEqual(list(ds['lon'].values), [-79, -78, -77])
+        self.assertEqual(ds['water_level'].shape, (2, 3))
+        self.assertEqual(ds.attrs['title'], 'export')
+
+    def test_merge_csv(self):
+        export = self._create_export(NsemPsaUserExport.FORMAT_CSV, (-80, 35, -75, 39))
+        tile_paths = [tempfile.mkdtemp(), tempfile.mkdtemp()]
+
+        # the tiles share the row on their edge
+        for tile_path, lons in zip(tile_paths, [[-79, -78], [-78, -77]]):
+            with open(os.path.join(tile_path, 'export.nc.csv'), 'w') as fh:
+                fh.write(',,,water_level\n')
+                fh.writelines('2012-10-29 00:00:00+00:00,{},36,1.0\n'.format(lon) for lon in lons)
+
+        output_path = tempfile.mkdtemp()
+        _merge_psa_user_export_tiles(export, tile_paths, output_path)
+
+        with open(os.path.join(output_path, 'export.nc.csv')) as fh:
+            lines = fh.read().splitlines()
+        self.assertEqual(lines[0], ',,,water_level')
+        self.assertEqual([line.split(',')[1] for line in lines[1:]], ['-79', '-78', '-77'])
+
+    def test_merge_contours(self):
+        variable = self.nsem_psa.nsempsavariable_set.filter(geo_type=NsemPsaVariable.GEO_TYPE_POLYGON).first()
+        # a single contour value which the tiles split in two along with another value in a single tile
+        polygons = [
+            [(1.0, '#ffffff', geos.Polygon.from_bbox((-79, 36, -77, 37))), (2.0, '#000000', geos.Polygon.from_bbox((-79, 37, -78, 38)))],
+            [(1.0, '#ffffff', geos.Polygon.from_bbox((-77, 36, -76, 37)))],
+        ]
+        expected = {1.0: geos.Polygon.from_bbox((-79, 36, -76, 37)), 2.0: geos.Polygon.from_bbox((-79, 37, -78, 38))}
+
+        for export_format, file_name in [(NsemPsaUserExport.FORMAT_SHAPEFILE, '{}.shp'), (NsemPsaUserExport.FORMAT_GEOJSON, '{}.json')]:
+            export = self._create_export(export_format, (-80, 35, -75, 39))
+            file_name = file_name.format(variable.name)
+            tile_paths = [tempfile.mkdtemp(), tempfile.mkdtemp()]
+            for tile_path, contours in zip(tile_paths, polygons):
+                if export_format == NsemPsaUserExport.FORMAT_SHAPEFILE:
+                    write_contours_shapefile(os.path.join(tile_path, file_name), [(v, c, memoryview(bytes(p.wkb))) for v, c, p in contours])
+                else:
+                    write_contours_geojson(os.path.join(tile_path, file_name), variable, None, [(v, c, p.geojson) for v, c, p in contours])
+
+            output_path = tempfile.mkdtemp()
+            _merge_psa_user_export_tiles(export, tile_paths, output_path)
+
+            # every format dissolves each value's features
+            with fiona.open(os.path.join(output_path, file_name)) as src:
+                features = list(src)
+            self.assertEqual([f['properties']['value'] for f in features], [1.0, 2.0], export_format)
+            for feature in features:
+                self.assertTrue(shape(feature['geometry']).equals(wkb.loads(bytes(expected[feature['properties']['value']].wkb))), export_format)
+
+    @override_settings(CWWED_DATA_DIR=tempfile.mkdtemp())
+    @mock.patch('named_storms.tasks._complete_psa_user_export')
+    @mock.patch('named_storms.tasks._merge_psa_user_export_tiles')
+    @mock.patch('named_storms.tasks._write_psa_user_export', return_value=10)
+    def test_tile_rows(self, *mocks):
+        export = self._create_export(NsemPsaUserExport.FORMAT_NETCDF, (-80, 35, -75, 39))
+
+        # the first tile is retried after its rows were already added to the running count
+        for tile_index in [0, 0, 1]:
+            create_psa_user_export_tile_task(export.id, tile_index, 2, export.bbox.ewkt)
+        NsemPsaUserExport.objects.filter(id=export.id).update(rows_processed=30)
+
+        # the merge records each tile's rows once
+        merge_psa_user_export_tiles_task(export.id)
+        export.refresh_from_db()
+        self.assertEqual(export.rows_processed, 20)
+
+    @mock.patch('named_storms.tasks.email_psa_user_export_task')
+    @mock.patch('named_storms.tasks.chain')
+    def test_fail_export(self, chain, email_psa_user_export_task):
+        export = self._create_export(NsemPsaUserExport.FORMAT_NETCDF, (-80, 35, -75, 39))
+        export.phase = NsemPsaUserExport.PHASE_WRITE
+        export.save()
+
+        start_psa_user_export(export)
+        errback = chain.return_value.on_error.call_args[0][0]
+
+        # a failed tile sends only the chord body's task id to the body's errbacks
+        self.assertTrue(errback.immutable)
+        errback.apply(('chord-body-task-id',)).get()
+        export.refresh_from_db()
+        self.assertFalse(export.success)
+        self.assertIsNone(export.phase)
+        self.assertIsNotNone(export.date_completed)
+        self.assertEqual(export.exception, 'The export failed during the write phase')
+        email_psa_user_export_task.delay.assert_called_once_with(nsem_psa_user_export_id=export.id)
+
+        # completed exports are left alone (i.e the email task failed)
+        errback.apply().get()
+        email_psa_user_export_task.delay.assert_called_once()
+
+    def _create_export(self, export_format: str, bbox: tuple) -> NsemPsaUserExport:
+        return NsemPsaUserExport.objects.create(
+            nsem=self.nsem_psa,
+            user=self.user,
+            format=export_format,
+            bbox=geos.Polygon.from_bbox(bbox),
+            date_filter=self.nsem_psa.dates[0],
+        )
+
+
+class UserExportGeoParquetTestCase(BaseTest):
+
+    def test_points(self):
+        ds = xr.Dataset(
+            {'water_level': (['time', 'node'], [[1.5, np.nan]])},
+            coords={'time': self.nsem_psa.naive_dates()[:1], 'lon': (['node'], [-75, -74]), 'lat': (['node'], [0, 40])},
+        )
+        path = os.path.join(tempfile.mkdtemp(), 'points.parquet')
+        self.assertEqual(write_points_geoparquet(path, ds), 2)
+
+        table = pq.read_table(path)
+        self.assertEqual(json.loads(table.schema.metadata[b'geo'])['primary_column'], 'geometry')
+        self.assertEqual(table.column('water_level').to_pylist(), [1.5, None])
+        self.assertEqual([wkb.loads(g).coords[0] for g in table.column('geometry').to_pylist()], [(-75, 0), (-74, 40)])
+
+    def test_contours(self):
+        path = os.path.join(tempfile.mkdtemp(), 'contours.parquet')
+
+        # the file isn't created without any contours
+        self.assertEqual(write_contours_geoparquet(path, []), 0)
+        self.assertFalse(os.path.exists(path))
+
+        polygon = geos.Polygon.from_bbox((-75, 40, -74, 41))
+        self.assertEqual(write_contours_geoparquet(path, [(1.0, '#ffffff', memoryview(bytes(polygon.wkb)))]), 1)
+        table = pq.read_table(path)
+        self.assertEqual(table.column('color').to_pylist(), ['#ffffff'])
+        self.assertTrue(wkb.loads(table.column('geometry')[0].as_py()).equals(wkb.loads(bytes(polygon.wkb))))
+
+
+@skipUnless(DRIVER_FLATGEOBUF in fiona.supported_drivers, 'FlatGeobuf requires GDAL >= 3.1')
+class UserExportFlatGeobufTestCase(BaseTest):
+
+    def test_points(self):
+        ds = xr.Dataset(
+            {'water_level': (['time', 'node'], [[1.5, np.nan]])},
+            coords={'time': self.nsem_psa.naive_dates()[:1], 'lon': (['node'], [-75, -74]), 'lat': (['node'], [0, 40])},
+        )
+        path = os.path.join(tempfile.mkdtemp(), 'points.fgb')
+        self.assertEqual(write_points_vector(path, ds, DRIVER_FLATGEOBUF), 2)
+
+        with fiona.open(path) as src:
+            features = list(src)
+        self.assertEqual(features[0]['properties']['water_level'], 1.5)
+        self.assertIsNone(features[1]['properties']['water_level'])
+        self.assertEqual([f['geometry']['coordinates'] for f in features], [(-75, 0), (-74, 40)])
+
+    def test_contours(self):
+        path = os.path.join(tempfile.mkdtemp(), 'contours.fgb')
+
+        # the file isn't created without any contours
+        self.assertEqual(write_contours_vector(path, [], DRIVER_FLATGEOBUF), 0)
+        self.assertFalse(os.path.exists(path))
+
+        polygon = geos.Polygon.from_bbox((-75, 40, -74, 41))
+        self.assertEqual(write_contours_vector(path, [(1.0, '#ffffff', memoryview(bytes(polygon.wkb)))], DRIVER_FLATGEOBUF), 1)
+        with fiona.open(path) as src:
+            features = list(src)
+        self.assertEqual(features[0]['properties'], {'value': 1.0, 'color': '#ffffff'})
+        self.assertTrue(shape(features[0]['geometry']).equals(wkb.loads(bytes(polygon.wkb))))
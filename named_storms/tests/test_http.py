@@ -0,0 +1,25 @@
+import tempfile
+from unittest import mock
+import requests
+from django.test import TestCase
+
+from named_storms.data.http import fetch_cached
+
+
+class FetchCachedTestCase(TestCase):
+
+    def test_conditional_request(self):
+        cache_dir = tempfile.mkdtemp()
+        session = mock.Mock()
+        session.get.return_value = mock.Mock(status_code=requests.codes.ok, content=b'<catalog/>', headers={'ETag': '"abc"'})
+
+        path = fetch_cached('https://example.com/catalog.xml', cache_dir, session=session)
+        with open(path, 'rb') as f:
+            self.assertEqual(f.read(), b'<catalog/>')
+
+        # the cached copy is reused when it hasn't changed
+        session.get.return_value = mock.Mock(status_code=requests.codes.not_modified)
+        self.assertEqual(fetch_cached('https://example.com/catalog.xml', cache_dir, session=session), path)
+        self.assertEqual(session.get.call_args[1]['headers'], {'If-None-Match': '"abc"'})
+        with open(path, 'rb') as f:
+            self.assertEqual(f.read(), b'<catalog/>')
@@ -0,0 +1,39 @@
+from django.urls import reverse
+from rest_framework.status import HTTP_200_OK
+
+from named_storms.models import NsemPsaData, NsemPsaVariable
+from named_storms.tests.base import BaseTest
+
+
+class NsemPsaDataKeysetPaginationTestCase(BaseTest):
+
+    def test_time_series(self):
+        self._assert_pages(self.nsem_psa.nsempsavariable_set.filter(data_type=NsemPsaVariable.DATA_TYPE_TIME_SERIES).first())
+
+    def test_max_values(self):
+        # null dates
+        self._assert_pages(self.nsem_psa.nsempsavariable_set.filter(data_type=NsemPsaVariable.DATA_TYPE_MAX_VALUES).first())
+
+    def _assert_pages(self, variable: NsemPsaVariable):
+        self.assertIsNotNone(variable)
+
+        expected = list(NsemPsaData.objects.filter(
+            storm_name=self.named_storm.name, nsem_psa_variable=variable,
+        ).order_by('date', 'id').values_list('id', flat=True))
+        self.assertTrue(expected)
+
+        # roughly ten pages with a page size which doesn't align with the number of points per date
+        limit = max(len(expected) // 10, 1) | 1
+
+        ids = []
+        url = reverse('psa-wind-barb-geojson', args=[self.named_storm.id])
+        params = {'nsem_psa_variable': variable.name, 'limit': limit}
+        while url:
+            result = self.client.get(url, params)
+            self.assertEqual(result.status_code, HTTP_200_OK)
+            self.assertLessEqual(len(result.data['results']), limit)
+            ids += [r['id'] for r in result.data['results']]
+            url, params = result.data['next'], None
+
+        # every row exactly once and in order
+        self.assertEqual(ids, expected)
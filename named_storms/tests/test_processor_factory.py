@@ -1,5 +1,14 @@
-from django.test import TestCase
-from named_storms.data.factory import ProcessorBaseFactory
+import os
+import tempfile
+from unittest import mock
+import pandas as pd
+import requests
+from django.test import TestCase, override_settings
+from named_storms.data.factory import ProcessorBaseFactory, TidesAndCurrentsProcessorFactory
+from named_storms.data.processors import GenericFileProcessor
+from named_storms.models import CoveredDataProvider, PROCESSOR_DATA_FACTORY_TIDES_AND_CURRENTS
+from named_storms.tests.base import BaseTest
+from named_storms.utils import create_directory, named_storm_covered_data_tmp_path
 
 
 class DataFactoryTestCase(TestCase):
@@ -9,3 +18,72 @@ class DataFactoryTestCase(TestCase):
     def test_decorator(self):
         """Data processors should automatically be registered via decorator"""
         self.assertTrue(len(ProcessorBaseFactory.registered_factories.keys()) > 0, 'Registered processor factories')
+
+
+@override_settings(CWWED_DATA_DIR=tempfile.mkdtemp())
+class TidesAndCurrentsFactoryTestCase(BaseTest):
+
+    # station metadata responses keyed by url (exceptions are raised)
+    RESPONSES = {
+        'https://example.com/1/sensors.json': {'sensors': [{'name': 'Wind'}], 'units': 'english'},
+        'https://example.com/1/datums.json': {'datums': [{'name': 'MHHW', 'value': 1}], 'units': 'feet'},
+        'https://example.com/1/products.json': {'products': [{'name': 'Water Levels'}]},
+        'https://example.com/2/sensors.json': requests.ConnectionError('connection reset'),
+        'https://example.com/2/datums.json': None,  # bad status
+        'https://example.com/2/products.json': {'products': [{'name': 'Water Levels'}]},
+    }
+
+    def setUp(self):
+        super().setUp()
+        self.provider = CoveredDataProvider.objects.get(processor_factory=PROCESSOR_DATA_FACTORY_TIDES_AND_CURRENTS)
+        create_directory(named_storm_covered_data_tmp_path(self.named_storm))
+
+    def _get(self, url, **kwargs):
+        response = self.RESPONSES[url]
+        if isinstance(response, Exception):
+            raise response
+        return mock.Mock(ok=response is not None, json=mock.Mock(return_value=response))
+
+    @mock.patch('named_storms.data.factory.CoopsStationRegistry')
+    @mock.patch('named_storms.data.factory.pooled_session')
+    def test_processors_data(self, pooled_session, station_registry):
+        pooled_session.return_value.get.side_effect = self._get
+        station_registry.return_value.stations.return_value = pd.DataFrame()
+        station_registry.return_value.records.return_value = [
+            {'id': station_id, **{
+                item_name: {'self': 'https://example.com/{}/{}.json'.format(station_id, item_name)} for item_name in ['sensors', 'datums', 'products']}}
+            for station_id in ['1', '2']
+        ]
+
+        processors_data = TidesAndCurrentsProcessorFactory(self.named_storm, self.provider).processors_data()
+
+        # the failed and bad station requests are skipped instead of failing the provider
+        self.assertEqual(
+            [processor_data.label for processor_data in processors_data],
+            ['stations.csv', 'station-1-sensors.csv', 'station-1-datums.csv', 'station-1-water_level-MHHW.csv'],
+        )
+        # the product's units are added by the processor
+        self.assertEqual(processors_data[-1].kwargs, {GenericFileProcessor.CSV_COLUMNS: {'Units': 'feet'}})
+        self.assertIn('datum=MHHW', processors_data[-1].url)
+
+
+@override_settings(CWWED_DATA_DIR=tempfile.mkdtemp())
+class GenericFileProcessorTestCase(BaseTest):
+
+    def test_csv_columns(self):
+        provider = CoveredDataProvider.objects.get(processor_factory=PROCESSOR_DATA_FACTORY_TIDES_AND_CURRENTS)
+        processor = GenericFileProcessor(
+            named_storm=self.named_storm,
+            provider=provider,
+            url='https://example.com/data.csv',
+            label='data.csv',
+            **{GenericFileProcessor.CSV_COLUMNS: {'Units': 'feet'}},
+        )
+
+        tmp_file = os.path.join(tempfile.mkdtemp(), 'data.csv')
+        pd.DataFrame({'Date Time': ['2012-10-29 00:00', '2012-10-29 00:06'], 'Water Level': [1.5, 1.6]}).to_csv(tmp_file, index=False)
+        processor._pre_process(tmp_file)
+
+        df = pd.read_csv(tmp_file)
+        self.assertEqual(list(df['Units']), ['feet', 'feet'])
+        self.assertEqual(list(df['Water Level']), [1.5, 1.6])
@@ -1,11 +1,16 @@
+import os
 import tempfile
 import xarray as xr
 import numpy as np
 from cfchecker import cfchecks
+from django.contrib.gis import geos
+from django.test import override_settings
 from django.utils.dateparse import parse_datetime
 
 from named_storms.tests.base import BaseTest
+from named_storms.psa.exporter import PsaDatasetExporter
 from named_storms.psa.validator import PsaDatasetValidator
+from named_storms.utils import named_storm_nsem_version_path, create_directory
 
 
 class PSATest(BaseTest):
@@ -76,6 +81,40 @@ class PSATest(BaseTest):
         self.assertTrue(validator.is_valid_unstructured_topology('element'), 'missing element')
         self.assertTrue(validator.is_valid_unstructured_start_index('element'), 'missing start_index')
 
+    @override_settings(CWWED_DATA_DIR=tempfile.mkdtemp())
+    def test_export_subset(self):
+        dates = self.nsem_psa.naive_dates()
+        ds = xr.Dataset(
+            {
+                'water_level': (['time', 'node'], np.random.rand(len(dates), 3)),
+            },
+            coords={
+                'time': dates,
+                'lon': (['node'], [-74.5, -73.5, -60.0]),
+                'lat': (['node'], [40.5, 40.5, 30.0]),
+            },
+        )
+        # the second node is within the bbox but has no data
+        ds['water_level'][:, 1] = np.nan
+        create_directory(named_storm_nsem_version_path(self.nsem_psa))
+        ds.to_netcdf(os.path.join(named_storm_nsem_version_path(self.nsem_psa), 'export.nc'))
+
+        psa_dataset = self.nsem_psa.nsempsamanifestdataset_set.create(
+            path='export.nc', variables=['water_level'], structured=False, meta={'title': 'export'})
+        bbox = geos.Polygon.from_bbox((-75, 40, -73, 41))
+
+        with PsaDatasetExporter(psa_dataset) as exporter:
+            ds_out = exporter.subset(bbox, dates[:2])
+        self.assertEqual(ds_out['water_level'].dims, ('time', 'node'))
+        self.assertEqual(ds_out['water_level'].shape, (2, 1), 'Should only include the nodes with data in the bbox')
+        np.testing.assert_array_equal(ds_out['water_level'].values[:, 0], ds['water_level'].values[:2, 0])
+        self.assertEqual(ds_out.attrs, {'title': 'export'})
+
+        # bbox without any data
+        bbox = geos.Polygon.from_bbox((0, 0, 1, 1))
+        with PsaDatasetExporter(psa_dataset) as exporter:
+            self.assertIsNone(exporter.subset(bbox, dates[:2]))
+
     def _cf_check_results(self, ds_path: str):
         cf_check = cfchecks.CFChecker(silent=True)
         cf_check.checker(ds_path)
@@ -0,0 +1,105 @@
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework.status import HTTP_200_OK
+
+from named_storms.models import (
+    NamedStorm, CoveredData, NsemPsa, NamedStormCoveredDataSnapshot, NamedStormCoveredDataLog,
+)
+from named_storms.tests.base import BaseTest
+
+
+class ListingQueryCountTestCase(BaseTest):
+    """
+    Listing endpoints should use a constant number of queries regardless of how many results they return
+    """
+
+    def setUp(self):
+        super().setUp()
+        self.covered_data_count = CoveredData.objects.count()
+
+    def test_named_storms(self):
+        self._assert_constant_queries(reverse('namedstorm-list'), self._create_storm)
+
+    def test_named_storm_detail(self):
+        url = reverse('namedstorm-detail', args=[self.named_storm.id])
+        self._assert_constant_queries(url, lambda: self._assign_covered_data(self.named_storm, self._create_covered_data()))
+
+    def test_covered_data(self):
+        self._assert_constant_queries(reverse('covereddata-list'), self._create_covered_data)
+
+    def test_covered_data_snapshots(self):
+        self._assert_constant_queries(reverse('namedstormcovereddatasnapshot-list'), lambda: self._create_snapshot(self.named_storm))
+
+    def test_nsem_psa(self):
+        self._assert_constant_queries(reverse('nsempsa-list'), lambda: self._create_psa(self.named_storm))
+
+    def test_nsem_psa_per_storm(self):
+        self._assert_constant_queries(reverse('nsempsa-per-storm'), lambda: self._create_psa(self._create_storm()))
+
+    def _assert_constant_queries(self, url, create_results):
+        # warm up any one-time queries (i.e content types)
+        self._query_count(url)
+
+        before = self._query_count(url)
+        for _ in range(3):
+            create_results()
+        after = self._query_count(url)
+
+        self.assertEqual(before, after, '{} query count grew with its results'.format(url))
+
+    def _query_count(self, url) -> int:
+        with CaptureQueriesContext(connection) as context:
+            result = self.client.get(url)
+        self.assertEqual(result.status_code, HTTP_200_OK)
+        return len(context.captured_queries)
+
+    def _create_storm(self) -> NamedStorm:
+        storm = NamedStorm.objects.create(
+            name='Storm {}'.format(NamedStorm.objects.count()),
+            geo=self.named_storm.geo,
+            date_start=self.named_storm.date_start,
+            date_end=self.named_storm.date_end,
+        )
+        self._assign_covered_data(storm, CoveredData.objects.first())
+        return storm
+
+    def _create_covered_data(self) -> CoveredData:
+        self.covered_data_count += 1
+        covered_data = CoveredData.objects.create(name='Covered Data {}'.format(self.covered_data_count))
+        for provider in CoveredData.objects.first().covereddataprovider_set.all():
+            provider.pk = None
+            provider.covered_data = covered_data
+            provider.save()
+        return covered_data
+
+    def _assign_covered_data(self, storm: NamedStorm, covered_data: CoveredData):
+        storm.namedstormcovereddata_set.create(
+            covered_data=covered_data,
+            date_start=storm.date_start,
+            date_end=storm.date_end,
+            geo=storm.geo,
+        )
+
+    def _create_snapshot(self, storm: NamedStorm) -> NamedStormCoveredDataSnapshot:
+        snapshot = NamedStormCoveredDataSnapshot.objects.create(named_storm=storm, path='snapshot')
+        for covered_data in storm.covered_data.all():
+            log = NamedStormCoveredDataLog.objects.create(
+                named_storm=storm,
+                covered_data=covered_data,
+                provider=covered_data.covereddataprovider_set.first(),
+                success=True,
+            )
+            snapshot.covered_data_logs.add(log)
+        return snapshot
+
+    def _create_psa(self, storm: NamedStorm) -> NsemPsa:
+        return NsemPsa.objects.create(
+            named_storm=storm,
+            covered_data_snapshot=self._create_snapshot(storm),
+            manifest={},
+            path='psa.tgz',
+            extracted=True,
+            validated=True,
+            processed=True,
+        )
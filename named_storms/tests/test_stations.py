@@ -0,0 +1,55 @@
+import os
+import tempfile
+from datetime import datetime
+from unittest import mock
+import pandas as pd
+from django.contrib.gis import geos
+from django.test import TestCase, override_settings
+
+from named_storms.data.stations import NDBCStationRegistry
+
+
+class FakeNDBCStationRegistry(NDBCStationRegistry):
+    name = 'ndbc-test'
+    downloads = 0
+
+    def _download(self) -> pd.DataFrame:
+        self.downloads += 1
+        return pd.DataFrame.from_records([
+            # inside with an older deployment history too
+            {'id': 'inside', 'lng': -74.4, 'lat': 40.4, 'date_start': pd.Timestamp('2000-01-01'), 'date_end': pd.NaT, 'history': 0},
+            {'id': 'inside', 'lng': -74.5, 'lat': 40.5, 'date_start': pd.Timestamp('1990-01-01'), 'date_end': pd.NaT, 'history': 1},
+            # outside the geo
+            {'id': 'outside', 'lng': -70, 'lat': 40.5, 'date_start': pd.Timestamp('2000-01-01'), 'date_end': pd.NaT, 'history': 2},
+            # decommissioned before the storm
+            {'id': 'retired', 'lng': -74.5, 'lat': 40.5, 'date_start': pd.Timestamp('2000-01-01'), 'date_end': pd.Timestamp('2010-01-01'), 'history': 3},
+        ])
+
+
+@override_settings(CWWED_DATA_DIR=tempfile.mkdtemp())
+class StationRegistryTestCase(TestCase):
+
+    def test_query(self):
+        registry = FakeNDBCStationRegistry()
+        geo = geos.Polygon.from_bbox((-75, 40, -74, 41))
+
+        df = registry.query(geo, datetime(2020, 1, 1), datetime(2020, 1, 2))
+        self.assertEqual(list(df['id']), ['inside'])
+        # the first deployment history in the catalog is used
+        self.assertEqual(df['lng'].iloc[0], -74.4)
+
+        # the catalog isn't downloaded again until it's stale
+        registry.query(geo)
+        self.assertEqual(registry.downloads, 1)
+
+    def test_refresh_failure(self):
+        registry = FakeNDBCStationRegistry()
+        registry.name = 'ndbc-test-failure'
+
+        with mock.patch.object(pd.DataFrame, 'to_parquet', side_effect=IOError('disk full')):
+            with self.assertRaises(IOError):
+                registry.refresh()
+
+        # the temporary file is removed and the catalog isn't replaced
+        self.assertFalse(os.path.exists(registry.path()))
+        self.assertTrue(all(name.endswith('.parquet') for name in os.listdir(os.path.dirname(registry.path()))))
@@ -0,0 +1,76 @@
+import os
+import tempfile
+from typing import List
+from unittest import mock
+from django.test import TestCase, override_settings
+from lxml import etree
+
+from named_storms.data.thredds import THREDDSCatalogCrawler
+
+CATALOG = '''<catalog xmlns="http://www.unidata.ucar.edu/namespaces/thredds/InvCatalog/v1.0" xmlns:xlink="http://www.w3.org/1999/xlink">
+{}
+</catalog>'''
+
+
+def catalog_refs(*titles) -> etree.ElementTree:
+    return etree.fromstring(CATALOG.format(''.join(
+        '<catalogRef xlink:href="{0}/catalog.xml" xlink:title="{0}" ID="{0}"/>'.format(title) for title in titles)))
+
+
+def datasets(*names) -> etree.ElementTree:
+    return etree.fromstring(CATALOG.format(''.join('<dataset name="{0}" ID="{0}"/>'.format(name) for name in names)))
+
+
+class FakeCrawler(THREDDSCatalogCrawler):
+    catalogs = {
+        'root': catalog_refs('2017', '2018'),
+        '2018': catalog_refs('001', '002'),
+        '001': datasets('a.nc', 'a.txt'),
+        '002': datasets('b.nc'),
+    }
+    fetched = []
+
+    def _fetch(self, catalog_urls: List[str]) -> List[etree.ElementTree]:
+        self.fetched.append(catalog_urls)
+        return [self.catalogs[url] for url in catalog_urls]
+
+
+class THREDDSCatalogCrawlerTestCase(TestCase):
+
+    def test_datasets(self):
+        crawler = FakeCrawler(
+            'root',
+            catalog_ref_url=lambda ref: ref.get('ID'),
+            level_filters=[
+                lambda title, parents: title == '2018',
+                lambda title, parents: parents == ['2018'],
+            ],
+            dataset_filter=lambda dataset, parents: dataset.get('name').endswith('.nc'),
+        )
+        self.assertEqual([d.get('name') for d in crawler.datasets()], ['a.nc', 'b.nc'])
+
+        # each level is fetched all at once
+        self.assertEqual(crawler.fetched, [['root'], ['2018'], ['001', '002']])
+
+    @override_settings(CWWED_DATA_DIR=tempfile.mkdtemp())
+    @mock.patch('named_storms.data.thredds.fetch_cached')
+    def test_fetch(self, fetch_cached):
+        cache_dir = tempfile.mkdtemp()
+
+        def fetch(url, cache_path, session=None):
+            path = os.path.join(cache_dir, os.path.basename(url))
+            with open(path, 'wb') as f:
+                f.write(etree.tostring(FakeCrawler.catalogs[os.path.basename(url)]))
+            return path
+
+        fetch_cached.side_effect = fetch
+        crawler = THREDDSCatalogCrawler(
+            'https://example.com/root',
+            catalog_ref_url=lambda ref: 'https://example.com/{}'.format(ref.get('ID')),
+            level_filters=[lambda title, parents: title == '2018', None],
+        )
+        self.assertEqual([d.get('name') for d in crawler.datasets()], ['a.nc', 'a.txt', 'b.nc'])
+
+        # the catalogs are fetched in-process through the shared cache with the crawler's pooled session
+        self.assertEqual(fetch_cached.call_count, 4)
+        self.assertTrue(all(call[1]['session'] is crawler.session for call in fetch_cached.call_args_list))
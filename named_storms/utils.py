@@ -64,6 +64,13 @@ def root_data_path() -> str:
     return settings.CWWED_DATA_DIR
 
 
+def thredds_catalog_cache_path() -> str:
+    """
+    Returns a path to the THREDDS catalogs cache which is shared by every covered data collection
+    """
+    return os.path.join(root_data_path(), settings.CWWED_THREDDS_CATALOG_CACHE_DIR_NAME)
+
+
 def named_storm_path(named_storm: NamedStorm) -> str:
     """
     Returns a path to a storm's data (top level directory)